@@ -0,0 +1,255 @@
+"""
+수집 / DB 저장 / API 를 서로 다른 프로세스로 실행 (ACQUISITION_MODE=shm)
+- acquire: BLE 수집만 담당하고 디코딩한 값을 shared memory ring 에 씀 (한 프로세스만 실행)
+- writer: ring 을 읽어 IngestBuffer -> spool -> Postgres 로 저장, 파티션/rollup 관리
+  여러 개 실행할 때는 --shard i/n 으로 기기를 나눠서 담당 (같은 값을 두 번 저장하지 않음)
+- API 워커(uvicorn --workers N)는 각자 ring 을 읽어 자신의 telemetry hub 로 전달 (RingFollower)
+- DSCNN 실시간 분류(INFERENCE_MODEL_PATH)는 acquire 프로세스에서 한 번만 실행하고 결과도 ring 으로 전달
+
+python -m app.acquisition acquire [--fake]
+python -m app.acquisition writer [--shard 0/2]
+"""
+import argparse
+import asyncio
+import signal
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app.database import Base, async_engine, settings
+from app.fleet import FleetSupervisor, configured_devices
+from app.ingest_buffer import IngestBuffer
+from app.logger import get_logger, setup_logging, shutdown_logging
+from app.metrics import SPOOL_PENDING, STAGE_DEPTH, STAGE_DROPPED, default_registry
+from app.shm_ring import CLASSIFICATION_PID, RingReader, RingWriter, SampleRing, classification_label, wait_for_ring
+from app.spool import Spool, SpoolDrainer
+from app.storage import StorageMaintenance
+
+logger = get_logger("acquisition")
+
+READ_LIMIT = 10000 # 한 번에 처리하는 최대 레코드 수, 처리 후 이벤트 루프에 양보
+
+
+class RingFollower:
+    """
+    ring 의 새 레코드를 handle(device_id, pid, timestamp, value) 로 전달
+    분류 결과 레코드는 classify(device_id, timestamp, label, confidence) 로 전달 (classify 가 없으면 버림)
+    shard=(index, count) 이면 ring 의 기기 번호 % count == index 인 기기만 전달
+    """
+
+    def __init__(self, handle, shard=None, from_start=False, name=None, classify=None):
+        self.handle = handle
+        self.classify = classify
+        self.shard = shard
+        self.from_start = from_start
+        self.name = name
+        self.reader = None
+        self.last_seen = {} # device_id -> 마지막 값의 시각
+        self._task = None
+
+
+    async def _run(self):
+        ring = await wait_for_ring(self.name)
+        self.reader = RingReader(ring, from_start=self.from_start)
+        logger.info("[RING ATTACHED] %s capacity=%d seq=%d", ring.shm.name, ring.capacity, self.reader.cursor)
+        try:
+            while True:
+                views = self.reader.read(READ_LIMIT)
+                if not views:
+                    await asyncio.sleep(settings.SHM_POLL_INTERVAL)
+                    continue
+                self._dispatch(ring, views)
+                await asyncio.sleep(0)
+        finally:
+            ring.close()
+
+
+    def _dispatch(self, ring, views):
+        # view 에서 필요한 레코드만 골라 꺼낸 뒤, 그 사이에 writer 가 덮어쓴 앞쪽 레코드는 버림
+        batches = []
+        offset = 0
+        for view in views:
+            if self.shard is None:
+                keep = np.ones(len(view), dtype=bool)
+            else:
+                keep = view["device"] % self.shard[1] == self.shard[0]
+            batches.append((np.flatnonzero(keep) + offset, view["device"][keep], view["pid"][keep],
+                            view["timestamp"][keep], view["value"][keep], view["pad"][keep]))
+            offset += len(view)
+        stale = self.reader.stale()
+        if stale:
+            logger.warning("[RING OVERRUN] %d records overwritten while reading", stale)
+
+        for positions, devices, pids, times, values, pads in batches:
+            valid = positions >= stale
+            for device, pid, t, value, pad in zip(devices[valid].tolist(), pids[valid].tolist(),
+                                                  times[valid].tolist(), values[valid].tolist(), pads[valid].tolist()):
+                device_id = ring.device_name(device)
+                if pid == CLASSIFICATION_PID:
+                    if self.classify is not None:
+                        self.classify(device_id, datetime.fromtimestamp(t, timezone.utc), classification_label(ring, pad), value)
+                    continue
+                self.handle(device_id, pid, datetime.fromtimestamp(t, timezone.utc), value)
+                self.last_seen[device_id] = t
+
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+    def collect_metrics(self):
+        if self.reader is None:
+            return
+        STAGE_DEPTH.set(self.reader.ring.write_seq - self.reader.cursor, stage="ring")
+        STAGE_DROPPED.set(self.reader.lost, stage="ring")
+
+
+    # /devices 응답 (연결 상태 등은 acquire 프로세스에만 있음)
+    def report(self):
+        return {
+            device_id: {"state": "remote", "last_seen": datetime.fromtimestamp(t, timezone.utc).isoformat()}
+            for device_id, t in self.last_seen.items()
+        }
+
+
+async def _serve_metrics(port):
+    """API 가 없는 프로세스의 Prometheus /metrics (GET 요청만 처리)"""
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = default_registry.render().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "0.0.0.0", port)
+
+
+async def acquire(transport_factory=None, metrics_port=None):
+    ring = SampleRing.create()
+    writer = RingWriter(ring)
+    fleet = FleetSupervisor(configured_devices(), ingest_buffer=writer, transport_factory=transport_factory)
+    default_registry.on_collect(fleet.collect_metrics)
+
+    # API 워커마다 추론하지 않도록 여기서 한 번만 실행하고 결과는 ring 으로 전달
+    inference = None
+    if settings.INFERENCE_MODEL_PATH:
+        from app.inference import InferenceService, load_model
+
+        inference = InferenceService(load_model(settings.INFERENCE_MODEL_PATH), publish=writer.add_classification)
+        inference.start()
+        default_registry.on_collect(inference.collect_metrics)
+
+    server = await _serve_metrics(metrics_port) if metrics_port else None
+    logger.info("[ACQUISITION] ring %s capacity=%d seq=%d", ring.shm.name, ring.capacity, ring.write_seq)
+    try:
+        await fleet.run()
+    finally:
+        if server is not None:
+            server.close()
+        if inference is not None:
+            await inference.stop()
+        ring.close()
+
+
+async def write(shard=None, from_start=False, metrics_port=None):
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    # 파티션/rollup 관리는 첫 번째 writer 만 담당
+    storage = None
+    if shard is None or shard[0] == 0:
+        storage = StorageMaintenance()
+        await storage.prepare()
+        storage.start()
+
+    spool = drainer = None
+    if settings.SPOOL_ENABLED:
+        # writer 마다 별도의 spool 파일 사용
+        spool = Spool(settings.SPOOL_PATH if shard is None else f"{settings.SPOOL_PATH}.{shard[0]}")
+        drainer = SpoolDrainer(spool)
+        drainer.start()
+        default_registry.on_collect(lambda: SPOOL_PENDING.set(spool.pending_rows))
+
+    buffer = IngestBuffer(spool=spool)
+    buffer.start()
+    follower = RingFollower(
+        lambda device_id, pid, timestamp, value: buffer.add(device_id=device_id, timestamp=timestamp, pid=pid, value=value),
+        shard=shard, from_start=from_start,
+    )
+    follower.start()
+    default_registry.on_collect(follower.collect_metrics)
+    default_registry.on_collect(lambda: STAGE_DEPTH.set(len(buffer), stage="persist"))
+    server = await _serve_metrics(metrics_port) if metrics_port else None
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if server is not None:
+            server.close()
+        await follower.stop()
+        await buffer.stop()
+        if drainer is not None:
+            await drainer.stop()
+            spool.close()
+        if storage is not None:
+            await storage.stop()
+        await async_engine.dispose()
+
+
+def parse_shard(value):
+    index, count = (int(part) for part in value.split("/"))
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"invalid shard: {value}")
+    return index, count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("role", choices=["acquire", "writer"])
+    parser.add_argument("--fake", action="store_true", help="BLE 대신 가상 ELM327 사용")
+    parser.add_argument("--shard", type=parse_shard, help="writer 가 담당할 기기 (i/n)")
+    parser.add_argument("--from-start", action="store_true", help="writer 가 ring 에 남아있는 가장 오래된 값부터 저장")
+    parser.add_argument("--metrics-port", type=int, help="/metrics 포트 (기본: ACQUISITION_METRICS_PORT, writer 는 + 1 + shard)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    setup_logging()
+    # SIGTERM 도 Ctrl+C 와 같이 처리해서 버퍼에 남은 값을 저장하고 종료
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        if args.role == "acquire":
+            transport_factory = None
+            if args.fake:
+                from app.fake_elm327 import fake_transport_factory
+
+                transport_factory = fake_transport_factory()
+            port = settings.ACQUISITION_METRICS_PORT if args.metrics_port is None else args.metrics_port
+            asyncio.run(acquire(transport_factory, port))
+        else:
+            port = args.metrics_port
+            if port is None and settings.ACQUISITION_METRICS_PORT:
+                port = settings.ACQUISITION_METRICS_PORT + 1 + (args.shard[0] if args.shard else 0)
+            asyncio.run(write(args.shard, args.from_start, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+응답 지연 시간 기반 적응형 타이밍
+PID 별 응답 지연을 측정해서 호스트 쪽 대기 시간과 ELM327 의 ATST(응답 대기 시간)를 조정하고,
+가능하면 write-without-response 모드로 바꿔 GATT 응답 왕복을 없앤다.
+워밍업 구간의 지연 시간을 기준값으로 남겨서 조정 후 얼마나 빨라졌는지 보고한다.
+"""
+import math
+from collections import deque
+
+from app.logger import get_logger
+
+logger = get_logger("timing")
+
+ATST_UNIT = 0.004096 # ATST 1 = 4.096 ms
+ATST_MIN = 0x08 # 약 33 ms, 너무 짧으면 느린 ECU 응답을 NO DATA 로 처리함
+ATST_MAX = 0xFF
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(math.ceil(q / 100 * len(ordered))) - 1, len(ordered) - 1)
+    return ordered[max(index, 0)]
+
+
+class AdaptiveTiming:
+    def __init__(self, warmup_samples=50, retune_interval=30.0, margin=1.5,
+                 default_timeout=5.0, min_timeout=0.2, window=200, aggressive=False):
+        self.warmup_samples = warmup_samples
+        self.retune_interval = retune_interval
+        self.margin = margin
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.window = window
+        self.aggressive = aggressive # True 이면 ATAT2, 아니면 ATAT1
+
+        self.latencies = {}
+        self.baseline = [] # 조정 전(워밍업) 구간의 지연 시간
+        self.timeouts = {}
+        self._backoff = {}
+        self.samples = 0
+        self.tuned_at = None
+        self.atst = None
+        self.write_without_response = False
+
+
+    def record(self, pids, latency):
+        for pid in pids:
+            self.latencies.setdefault(pid, deque(maxlen=self.window)).append(latency)
+            # 성공하면 시간 초과로 늘려둔 대기 시간을 천천히 되돌림
+            self._backoff[pid] = max(self._backoff.get(pid, 1.0) * 0.9, 1.0)
+        if self.tuned_at is None:
+            self.baseline.append(latency)
+        self.samples += 1
+
+
+    def record_timeout(self, pids):
+        for pid in pids:
+            self.timeouts[pid] = self.timeouts.get(pid, 0) + 1
+            self._backoff[pid] = min(self._backoff.get(pid, 1.0) * 2, 8.0)
+
+
+    def timeout_for(self, pids):
+        """요청한 PID 들의 p99 지연 시간 기준 호스트 대기 시간"""
+        if self.tuned_at is None:
+            return self.default_timeout
+        timeouts = []
+        for pid in pids:
+            p99 = percentile(self.latencies.get(pid, ()), 99)
+            if p99 is None:
+                return self.default_timeout
+            timeouts.append(p99 * self.margin * 2 * self._backoff.get(pid, 1.0))
+        return min(max(max(timeouts), self.min_timeout), self.default_timeout)
+
+
+    def should_tune(self, now):
+        if self.samples < self.warmup_samples:
+            return False
+        return self.tuned_at is None or now - self.tuned_at >= self.retune_interval
+
+
+    def _all_latencies(self):
+        return [latency for values in self.latencies.values() for latency in values]
+
+
+    async def tune(self, channel, now, write_without_response=False):
+        """어댑터의 ATAT/ATST 를 관측된 지연 시간에 맞게 설정"""
+        p99 = percentile(self._all_latencies(), 99)
+        atst = min(max(math.ceil(p99 * self.margin / ATST_UNIT), ATST_MIN), ATST_MAX)
+
+        if self.tuned_at is None:
+            await channel.send(b"ATAT2\r" if self.aggressive else b"ATAT1\r")
+        if atst != self.atst:
+            reply = await channel.send(f"ATST{atst:02X}\r".encode())
+            if "OK" in reply:
+                self.atst = atst
+            logger.info("[ADAPTIVE TIMING] ATST %02X %s", atst, reply)
+
+        if write_without_response and not self.write_without_response:
+            channel.response = False
+            self.write_without_response = True
+            logger.info("[ADAPTIVE TIMING] write-without-response enabled")
+
+        self.tuned_at = now
+
+
+    def report(self):
+        """조정 전(워밍업) 대비 현재 지연 시간"""
+        current = self._all_latencies()
+        before = percentile(self.baseline, 50)
+        after = percentile(current, 50)
+        improvement = None
+        if before and after and self.tuned_at is not None:
+            improvement = round((before - after) / before * 100, 1)
+        return {
+            "baseline_p50_ms": before and round(before * 1000, 1),
+            "p50_ms": after and round(after * 1000, 1),
+            "p99_ms": current and round(percentile(current, 99) * 1000, 1),
+            "improvement_pct": improvement,
+            "atst": self.atst,
+            "write_without_response": self.write_without_response,
+            "timeouts": sum(self.timeouts.values()),
+        }
@@ -0,0 +1,188 @@
+"""
+비동기 PID 샘플 -> 고정 주기 피처 행렬 (시간, PID) 정렬
+- PID 마다 다른 시각/주기로 들어오는 값을 rate_hz 간격의 grid 시각에 맞춰 한 행으로 만듦
+- PID 별 채움 방식: HOLD(직전 값 유지), LINEAR(앞뒤 값 선형 보간), max_staleness 보다 오래된 값은 NaN 으로 표시
+- grid 행은 watermark(가장 최근 샘플 시각 - delay)를 지나면 닫히고, 미리 할당한 배열에 순서대로 쌓임
+- 실시간 추론(InferenceService)과 학습용 export 가 같은 코드로 같은 행렬을 만듦
+"""
+import math
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+HOLD = "hold"
+LINEAR = "linear"
+
+
+def to_seconds(timestamp):
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    if isinstance(timestamp, str):
+        return datetime.fromisoformat(timestamp).timestamp()
+    return float(timestamp)
+
+
+class Aligner:
+    def __init__(self, pids, rate_hz, policies=None, max_staleness=None, delay=0.0, capacity=1024):
+        """
+        pids: 열 순서
+        policies: {pid: HOLD | LINEAR}, 없는 PID 는 HOLD
+        max_staleness: 초 (모든 PID) 또는 {pid: 초}, 마지막 값이 이보다 오래되면 NaN
+        delay: 늦게 들어오는 샘플과 LINEAR 의 다음 값을 기다리는 시간(초), 다음 값이 없으면 HOLD 로 채움
+        capacity: 보관하는 최근 행 수 (close() 한 번에 닫는 최대 행 수)
+        """
+        self.pids = list(pids)
+        self._index = {pid: i for i, pid in enumerate(self.pids)}
+        self.period = 1.0 / rate_hz
+        self.delay = delay
+        self.capacity = capacity
+
+        policies = policies or {}
+        self._linear = [policies.get(pid, HOLD) == LINEAR for pid in self.pids]
+        if isinstance(max_staleness, dict):
+            self._staleness = [max_staleness.get(pid, math.inf) for pid in self.pids]
+        else:
+            self._staleness = [math.inf if max_staleness is None else max_staleness] * len(self.pids)
+
+        # PID 별 아직 필요한 샘플 (시각, 값), 시간순
+        self._samples = [deque() for _ in self.pids]
+        self.latest = -math.inf
+        self._next_row = None # 다음에 닫을 grid index (시각 = index * period)
+        self.late = 0 # 같은 PID 의 이전 샘플보다 과거 시각이라 버린 샘플 수
+
+        # 최근 행을 연속된 구간으로 꺼낼 수 있도록 2배 크기로 할당하고, 끝에 닿으면 최근 capacity 행을 앞으로 옮김
+        self._times = np.empty(2 * capacity, dtype=np.float64)
+        self._values = np.empty((2 * capacity, len(self.pids)), dtype=np.float32)
+        self._end = 0
+        self.rows_closed = 0
+
+
+    def add(self, pid, timestamp, value):
+        index = self._index.get(pid)
+        if index is None or value is None:
+            return
+        t = to_seconds(timestamp)
+        samples = self._samples[index]
+        if samples and t < samples[-1][0]:
+            self.late += 1
+            return
+        samples.append((t, value))
+        if t > self.latest:
+            self.latest = t
+        if self._next_row is None:
+            self._next_row = math.ceil(t / self.period)
+
+
+    def add_block(self, times, pids, values):
+        """시간순으로 정렬된 샘플 배열을 한 번에 추가 (export 용), times 는 epoch 초"""
+        times = np.asarray(times, dtype=np.float64)
+        pids = np.asarray(pids)
+        values = np.asarray(values, dtype=np.float64)
+        first = math.inf
+        for j, pid in enumerate(self.pids):
+            mask = pids == pid
+            if not mask.any():
+                continue
+            t, v = times[mask], values[mask]
+            samples = self._samples[j]
+            if samples:
+                fresh = t >= samples[-1][0]
+                self.late += len(t) - int(fresh.sum())
+                t, v = t[fresh], v[fresh]
+            if len(t):
+                samples.extend(zip(t.tolist(), v.tolist()))
+                first = min(first, t[0])
+                self.latest = max(self.latest, t[-1])
+        if self._next_row is None and first < math.inf:
+            self._next_row = math.ceil(first / self.period)
+
+
+    def close(self, now=None, delay=None):
+        """
+        watermark(now 또는 가장 최근 샘플 시각 - delay) 이전의 grid 행을 닫고 닫은 행 수 반환 (최대 capacity)
+        닫은 행은 rows(n) 으로 꺼냄
+        """
+        if self._next_row is None:
+            return 0
+        watermark = (self.latest if now is None else to_seconds(now)) - (self.delay if delay is None else delay)
+        last_row = math.floor(watermark / self.period)
+        if last_row < self._next_row:
+            return 0
+        last_row = min(last_row, self._next_row + self.capacity - 1)
+
+        t = np.arange(self._next_row, last_row + 1, dtype=np.float64) * self.period
+        values = np.full((len(t), len(self.pids)), np.nan, dtype=np.float32)
+        for j, samples in enumerate(self._samples):
+            if not samples:
+                continue
+            xp = np.fromiter((s[0] for s in samples), dtype=np.float64, count=len(samples))
+            fp = np.fromiter((s[1] for s in samples), dtype=np.float64, count=len(samples))
+            previous = np.searchsorted(xp, t, side="right") - 1
+            valid = previous >= 0
+            if self._linear[j]:
+                # 마지막 샘플 이후는 np.interp 가 마지막 값을 반환 -> HOLD 와 같음
+                column = np.interp(t, xp, fp)
+            else:
+                column = fp[np.maximum(previous, 0)]
+            age = t - xp[np.maximum(previous, 0)]
+            valid &= age <= self._staleness[j]
+            values[:, j] = np.where(valid, column, np.nan)
+
+            # 이후 행 계산에는 닫은 마지막 시각 이전 샘플 중 가장 최근 것 하나만 필요
+            keep_from = previous[-1]
+            for _ in range(max(keep_from, 0)):
+                samples.popleft()
+
+        self._next_row = last_row + 1
+        self._append(t, values)
+        return len(t)
+
+
+    def drain(self, delay=None):
+        """닫을 수 있는 행을 모두 닫으면서 capacity 이하 크기의 (times, values) block 복사본을 반환"""
+        while True:
+            closed = self.close(delay=delay)
+            if closed:
+                times, values = self.rows(closed)
+                yield times.copy(), values.copy()
+            if closed < self.capacity:
+                return
+
+
+    def _append(self, t, values):
+        n = len(t)
+        if self._end + n > len(self._times):
+            keep = min(self._end, self.capacity)
+            self._times[:keep] = self._times[self._end - keep:self._end]
+            self._values[:keep] = self._values[self._end - keep:self._end]
+            self._end = keep
+        self._times[self._end:self._end + n] = t
+        self._values[self._end:self._end + n] = values
+        self._end += n
+        self.rows_closed += n
+
+
+    def rows(self, n=None):
+        """최근 닫힌 n 개 행 (times, values) view, NaN 은 값 없음/오래된 값 (다음 close() 전까지 유효)"""
+        n = min(self._end, self.capacity) if n is None else min(n, self._end)
+        return self._times[self._end - n:self._end], self._values[self._end - n:self._end]
+
+
+def align(samples, pids, rate_hz, policies=None, max_staleness=None, delay=10.0, chunk_rows=4096):
+    """
+    시간순 (timestamp, pid, value) iterable 을 정렬해서 (times, values) block 을 순서대로 반환 (block 은 복사본)
+    readings 테이블을 시간순으로 읽은 결과를 그대로 넣으면 되고 전체를 메모리에 올리지 않음
+    """
+    aligner = Aligner(pids, rate_hz, policies, max_staleness, delay, capacity=chunk_rows)
+    block_span = chunk_rows * aligner.period
+    next_close = None
+    for timestamp, pid, value in samples:
+        aligner.add(pid, timestamp, value)
+        if next_close is None:
+            next_close = aligner.latest + block_span + delay
+        elif aligner.latest >= next_close:
+            next_close = aligner.latest + block_span
+            yield from aligner.drain()
+    # 끝에서는 delay 없이 가장 최근 샘플 시각까지 모두 닫음
+    yield from aligner.drain(delay=0.0)
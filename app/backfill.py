@@ -0,0 +1,341 @@
+"""
+raw_data(예전 형식) -> readings 일괄 변환
+- raw_data.value 는 notify 조각을 str(bytearray) 로 저장한 문자열 ex) "bytearray(b'41 0C 11 30 \\r>')"
+  한 응답이 여러 row 에 나뉘어 있을 수 있으므로 id 순서대로 이어 붙인 뒤 '\\r', '\\n', '>' 기준으로 줄을 나눔
+- 줄 단위로 디코딩하지 않고 chunk 전체를 (줄 수, 바이트) numpy 행렬로 만든 뒤
+  PIDS 표의 공식을 PID 별 배열에 한 번에 적용 (pid_decoder.decode_line 과 같은 결과)
+- raw_data 에는 시각과 기기가 없으므로 기기와 기록 구간(start ~ end)을 받아 id 순서에 비례해서 시각을 배정
+- id 를 keyset 방식으로 chunk_rows 개씩 나눈 구간을 process pool 에서 병렬로 처리하고,
+  끝난 구간은 checkpoint 파일에 기록해서 중단 후 다시 실행하면 남은 구간만 처리
+
+python -m app.backfill --device 62E97F99-... --start 2025-03-01T09:00 --end 2025-03-01T18:00 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database import AsyncSessionLocal, async_engine, settings
+from app.logger import get_logger, setup_logging
+from app.models import RawData, Reading
+from app.pid_decoder import PIDS
+from app.storage import ensure_partitions, refresh_rollups
+
+logger = get_logger("backfill")
+
+MAX_LINE_BYTES = 32 # 이보다 긴 줄(여러 프레임 응답 등)은 데이터 응답이 아니므로 무시
+OVERLAP_ROWS = 16 # 구간 끝에서 잘린 응답을 마저 읽기 위해 다음 구간에서 더 읽는 row 수
+INSERT_BATCH = 20000
+
+# 문자 -> 16진수 값 (16진수가 아니면 255)
+_HEX = np.full(256, 255, dtype=np.uint8)
+for _i, _c in enumerate(b"0123456789ABCDEF"):
+    _HEX[_c] = _i
+    _HEX[ord(chr(_c).lower())] = _i
+
+# (mode << 8 | PID 바이트) -> 데이터 바이트 수 (0 이면 모르는 PID)
+_LENGTHS = np.zeros(0x1000, dtype=np.int64)
+for _pid, _spec in PIDS.items():
+    _LENGTHS[_pid] = _spec.length
+
+_SEPARATORS = np.zeros(256, dtype=bool)
+_SEPARATORS[[ord("\r"), ord("\n"), ord(">")]] = True
+
+
+def clean_payloads(values):
+    """
+    str(bytearray) / str(bytes) 표현들을 하나로 이어 붙이고 내용만 남김 (escape 된 줄바꿈 복원, 공백 제거)
+    row 마다 처리하지 않고 구분 문자(\\x01)를 넣어 한 번에 치환한 뒤 구분 문자 위치로 row 경계를 계산
+    반환: (uint8 배열, row 별 시작 위치 (row 수 + 1))
+    """
+    joined = ("\x01" + "\x01".join(values) + "\x01").encode("ascii", errors="replace")
+    for wrapper in (b"\x01bytearray(b'", b'\x01bytearray(b"', b"\x01b'", b'\x01b"'):
+        joined = joined.replace(wrapper, b"\x01")
+    for wrapper in (b"')\x01", b'")\x01', b"'\x01", b'"\x01'):
+        joined = joined.replace(wrapper, b"\x01")
+    joined = joined.replace(b"\\r", b"\r").replace(b"\\n", b"\n").replace(b" ", b"")
+
+    blob = np.frombuffer(joined, dtype=np.uint8)
+    markers = blob == 1
+    row_of = np.cumsum(markers)[~markers] - 1
+    row_lengths = np.bincount(row_of, minlength=len(values))[:len(values)]
+    return blob[~markers], np.concatenate([[0], np.cumsum(row_lengths)])
+
+
+def split_lines(blob, complete=True):
+    """
+    이어 붙인 응답(uint8 배열)을 줄 단위 (시작, 끝) 위치 배열로 나눔, 빈 줄 제외
+    complete=False 이면 마지막 구분자 이후(아직 끝나지 않은 응답)는 제외
+    """
+    separators = np.flatnonzero(_SEPARATORS[blob])
+    starts = np.concatenate([[0], separators + 1])
+    ends = np.concatenate([separators, [len(blob)]])
+    if not complete:
+        starts, ends = starts[:-1], ends[:-1]
+    keep = ends > starts
+    return starts[keep], ends[keep]
+
+
+def decode_hex_lines(blob, starts, ends):
+    """
+    공백이 제거된 16진수 응답 줄들을 한 번에 디코딩
+    반환: (줄 번호, pid, 값) 배열, 한 줄에 여러 PID 가 묶여 있으면(packed 응답) 줄 번호가 반복됨
+    """
+    lengths = ends - starts
+    candidates = np.flatnonzero((lengths >= 4) & (lengths % 2 == 0) & (lengths <= 2 * MAX_LINE_BYTES))
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+    if len(candidates) == 0:
+        return empty
+
+    lengths = lengths[candidates]
+    width = int(lengths.max())
+    columns = np.arange(width)
+    inside = columns < lengths[:, None]
+    chars = blob[np.minimum(starts[candidates, None] + columns, len(blob) - 1)]
+    nibbles = _HEX[chars]
+    hex_only = ~((nibbles == 255) & inside).any(axis=1)
+    nibbles[~inside] = 0
+    data = nibbles[:, 0::2] << 4 | nibbles[:, 1::2] # (줄 수, 바이트) uint8
+    size = lengths // 2
+
+    mode = data[:, 0].astype(np.int64) - 0x40
+    active = hex_only & (mode >= 1) & (mode <= 0xF)
+    rows = np.flatnonzero(active)
+    cursor = np.ones(len(rows), dtype=np.int64)
+
+    line_parts, pid_parts, value_parts = [], [], []
+    # 한 줄의 PID 를 앞에서부터 하나씩, 모든 줄에 대해 동시에 처리 (decode_line 과 같이 모르는 PID 에서 중단)
+    while len(rows):
+        has_pid = cursor < size[rows]
+        rows, cursor = rows[has_pid], cursor[has_pid]
+        pids = mode[rows] << 8 | data[rows, cursor]
+        length = _LENGTHS[pids]
+        ok = (length > 0) & (cursor + 1 + length <= size[rows])
+        rows, cursor, pids, length = rows[ok], cursor[ok], pids[ok], length[ok]
+
+        for pid in np.unique(pids):
+            selected = pids == pid
+            spec = PIDS[int(pid)]
+            selected_rows, offset = rows[selected], cursor[selected] + 1
+            args = [data[selected_rows, offset + j].astype(np.float64) for j in range(spec.length)]
+            line_parts.append(candidates[selected_rows])
+            pid_parts.append(np.full(len(selected_rows), pid, dtype=np.int64))
+            value_parts.append(np.asarray(spec.formula(*args), dtype=np.float64))
+        cursor = cursor + 1 + length
+
+    if not line_parts:
+        return empty
+    return np.concatenate(line_parts), np.concatenate(pid_parts), np.concatenate(value_parts)
+
+
+def decode_rows(ids, values, owned_from, owned_to, complete):
+    """
+    id 순서의 raw_data row 들을 디코딩해서 (위치, pid, 값) 반환
+    위치 = 응답이 시작된 row 의 id + row 안에서의 상대 위치 (0 ~ 1), 시각 배정에 사용
+    [owned_from, owned_to) 번째 row 에서 시작한 응답만 반환 (앞뒤로 더 읽은 row 는 다른 구간 담당)
+    """
+    blob, row_offsets = clean_payloads(values)
+    row_lengths = np.diff(row_offsets)
+    if len(blob) == 0:
+        return np.empty(0), np.empty(0, dtype=np.int64), np.empty(0)
+
+    starts, ends = split_lines(blob, complete)
+    start_rows = np.searchsorted(row_offsets, starts, side="right") - 1
+    owned = (start_rows >= owned_from) & (start_rows < owned_to)
+    starts, ends, start_rows = starts[owned], ends[owned], start_rows[owned]
+
+    lines, pids, decoded = decode_hex_lines(blob, starts, ends)
+    rows = start_rows[lines]
+    fraction = (starts[lines] - row_offsets[rows]) / np.maximum(row_lengths[rows], 1)
+    positions = np.asarray(ids, dtype=np.float64)[rows] + fraction
+    order = np.argsort(positions, kind="stable")
+    return positions[order], pids[order], decoded[order]
+
+
+async def plan_ranges(session, chunk_rows):
+    """id 를 keyset 방식으로 chunk_rows 개씩 나눈 (lo, hi] 구간 목록"""
+    ranges = []
+    last = (await session.scalar(select(func.min(RawData.id))) or 1) - 1
+    while True:
+        hi = await session.scalar(
+            select(RawData.id).where(RawData.id > last).order_by(RawData.id).offset(chunk_rows - 1).limit(1)
+        )
+        if hi is None:
+            hi = await session.scalar(select(func.max(RawData.id)).where(RawData.id > last))
+            if hi is not None:
+                ranges.append((last, hi))
+            return ranges
+        ranges.append((last, hi))
+        last = hi
+
+
+async def _fetch(session, lo, hi):
+    """(lo, hi] 구간과 앞쪽 1 row, 뒤쪽 OVERLAP_ROWS row 를 id 순서로 읽음"""
+    before = (await session.execute(
+        select(RawData.id, RawData.value).where(RawData.id <= lo).order_by(RawData.id.desc()).limit(1)
+    )).all()
+    rows = (await session.execute(
+        select(RawData.id, RawData.value).where(RawData.id > lo, RawData.id <= hi).order_by(RawData.id)
+    )).all()
+    after = (await session.execute(
+        select(RawData.id, RawData.value).where(RawData.id > hi).order_by(RawData.id).limit(OVERLAP_ROWS)
+    )).all()
+    return before, rows, after
+
+
+async def backfill_range(device_id, lo, hi, min_id, max_id, start, end):
+    """(lo, hi] 구간 하나를 디코딩해서 readings 에 저장, (읽은 row 수, 저장한 값 수) 반환"""
+    async with AsyncSessionLocal() as session:
+        before, rows, after = await _fetch(session, lo, hi)
+        fetched = before + rows + after
+        ids = [row[0] for row in fetched]
+        values = [row[1] or "" for row in fetched]
+        # 테이블의 마지막 row 까지 읽었으면 '>' 로 끝나지 않은 마지막 응답도 포함
+        positions, pids, decoded = decode_rows(ids, values, len(before), len(before) + len(rows),
+                                               complete=len(after) < OVERLAP_ROWS)
+
+        # id 순서에 비례해서 start ~ end 사이 시각을 배정
+        span = (end - start).total_seconds() / max(max_id + 1 - min_id, 1)
+        times = start.timestamp() + (positions - min_id) * span
+        readings = [
+            {"device_id": device_id, "pid": pid, "timestamp": datetime.fromtimestamp(t, timezone.utc), "value": value}
+            for t, pid, value in zip(times.tolist(), pids.tolist(), decoded.tolist())
+        ]
+        try:
+            # 구간 전체를 한 트랜잭션으로 저장 -> 중간에 중단되면 checkpoint 에도 남지 않으므로 다시 처리
+            for i in range(0, len(readings), INSERT_BATCH):
+                await session.execute(insert(Reading).on_conflict_do_nothing(), readings[i:i + INSERT_BATCH])
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+    return len(rows), len(readings)
+
+
+def _run_range(index, device_id, lo, hi, min_id, max_id, start, end):
+    """process pool 작업 (프로세스마다 자신의 엔진 사용)"""
+    async def run():
+        try:
+            return await backfill_range(device_id, lo, hi, min_id, max_id, start, end)
+        finally:
+            await async_engine.dispose()
+
+    return (index, *asyncio.run(run()))
+
+
+class Checkpoint:
+    """처리할 구간과 끝난 구간을 JSON 파일로 보관 (쓰는 도중 종료되어도 파일이 깨지지 않도록 교체 방식)"""
+
+    def __init__(self, path, params):
+        self.path = path
+        self.state = {**params, "ranges": None, "done": []}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            changed = {key for key, value in params.items() if state.get(key) != value}
+            if changed:
+                raise ValueError(f"checkpoint {path} was created with different {sorted(changed)}")
+            self.state = state
+        self._done = set(self.state["done"])
+
+    @property
+    def ranges(self):
+        return self.state["ranges"]
+
+    def set_ranges(self, ranges):
+        self.state["ranges"] = [list(r) for r in ranges]
+        self.save()
+
+    def is_done(self, index):
+        return index in self._done
+
+    def mark_done(self, index):
+        self._done.add(index)
+        self.state["done"] = sorted(self._done)
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+
+
+async def _prepare(checkpoint, chunk_rows, start, end):
+    async with AsyncSessionLocal() as session:
+        min_id = await session.scalar(select(func.min(RawData.id)))
+        max_id = await session.scalar(select(func.max(RawData.id)))
+        if checkpoint.ranges is None and min_id is not None:
+            checkpoint.set_ranges(await plan_ranges(session, chunk_rows))
+    async with async_engine.begin() as conn:
+        await ensure_partitions(conn, start, end)
+    await async_engine.dispose()
+    return min_id, max_id
+
+
+async def _refresh_rollups(start, end):
+    async with async_engine.begin() as conn:
+        await refresh_rollups(conn, start, end)
+    await async_engine.dispose()
+
+
+def backfill(device_id, start, end, chunk_rows=200_000, workers=None, checkpoint_path=None):
+    """raw_data 전체를 readings 로 변환, 저장한 값 수 반환"""
+    checkpoint = Checkpoint(checkpoint_path, {
+        "device_id": device_id, "start": start.isoformat(), "end": end.isoformat(), "chunk_rows": chunk_rows,
+    })
+    min_id, max_id = asyncio.run(_prepare(checkpoint, chunk_rows, start, end))
+    if min_id is None:
+        logger.info("[BACKFILL] raw_data is empty")
+        return 0
+    if (datetime.now(timezone.utc) - start).days >= settings.RETENTION_DAYS_RAW:
+        logger.warning("[BACKFILL] %s is older than RETENTION_DAYS_RAW, partitions will be dropped by maintenance", start)
+
+    pending = [(i, lo, hi) for i, (lo, hi) in enumerate(checkpoint.ranges) if not checkpoint.is_done(i)]
+    logger.info("[BACKFILL] ids %d..%d, %d ranges (%d pending)", min_id, max_id, len(checkpoint.ranges), len(pending))
+    total_rows = total_readings = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=get_context("spawn")) as pool:
+        futures = [pool.submit(_run_range, i, device_id, lo, hi, min_id, max_id, start, end) for i, lo, hi in pending]
+        for future in as_completed(futures):
+            index, rows, readings = future.result()
+            checkpoint.mark_done(index)
+            total_rows += rows
+            total_readings += readings
+            logger.info("[BACKFILL] range %d/%d done: %d rows -> %d readings",
+                        len(checkpoint.state["done"]), len(checkpoint.ranges), rows, readings)
+
+    # 옮긴 구간의 1초 / 1분 rollup 갱신
+    asyncio.run(_refresh_rollups(start, end))
+    logger.info("[BACKFILL] finished: %d rows -> %d readings", total_rows, total_readings)
+    return total_readings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--device", required=True, help="raw_data 를 기록한 기기 주소 (readings.device_id)")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat, help="raw_data 기록 시작 시각")
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat, help="raw_data 기록 종료 시각")
+    parser.add_argument("--chunk-rows", type=int, default=200_000, help="작업 하나가 처리하는 raw_data row 수")
+    parser.add_argument("--workers", type=int, help="프로세스 수 (기본: CPU 수)")
+    parser.add_argument("--checkpoint", default="backfill_checkpoint.json")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    setup_logging()
+    start, end = (t if t.tzinfo else t.replace(tzinfo=timezone.utc) for t in (args.start, args.end))
+    backfill(args.device, start, end, args.chunk_rows, args.workers, args.checkpoint)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+학습 데이터 export / 로딩 (메모리에 전부 올리지 않음)
+- readings 를 기기별로 server-side cursor 로 읽어 Aligner 로 (시간, PID) 행렬을 만들고 .npy shard 로 저장
+- 기기의 샘플이 max_gap 초 넘게 없던 구간(시동 꺼짐, 연결 끊김)은 HOLD 로 채우지 않고 저장하지 않음 (거기서 shard 를 나눔)
+- 저장하면서 PID(채널)별 평균/표준편차를 한 번에 계산해서 stats.npz 로 저장
+  (노트북의 StandardScaler 는 (피처, 시간 스텝) 마다 따로 fit 해서 2048개 값이 나오지만 여기서는 채널별 16개)
+- WindowDataset 은 shard 를 mmap 으로 열고 정규화된 윈도우를 요청할 때 하나씩 만듦 (torch DataLoader 에 그대로 사용)
+  크기 때문에 나뉜 shard 끼리는 이어서 윈도우를 만들므로 shard_rows 는 윈도우 수에 영향을 주지 않음
+
+python -m app.dataset --out data/2026-q1 --devices A,B --start 2026-01-01 --end 2026-04-01 --rate-hz 10
+"""
+import argparse
+import asyncio
+import json
+import os
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app.alignment import HOLD, LINEAR, Aligner
+from app.database import AsyncSessionLocal
+from app.logger import get_logger, setup_logging
+from app.pid_decoder import ECU_PIDS
+from app.queries import stream_device_readings
+from app.windowing import window_count
+
+logger = get_logger("dataset")
+
+EXPORT_DELAY = 10.0 # LINEAR 보간에서 다음 값을 기다리는 시간(초)
+MAX_GAP = 5.0 # 기기의 샘플(모든 PID)이 이 시간(초)보다 오래 없으면 수집 공백으로 보고 shard 를 나눔
+
+
+class ChannelStats:
+    """채널별 평균/분산을 block 단위로 누적 (Welford 를 block 끼리 합치는 방식), NaN 은 제외"""
+
+    def __init__(self, num_features):
+        self.count = np.zeros(num_features, dtype=np.int64)
+        self.mean = np.zeros(num_features, dtype=np.float64)
+        self.m2 = np.zeros(num_features, dtype=np.float64)
+
+    def update(self, values):
+        valid = ~np.isnan(values)
+        n = valid.sum(axis=0)
+        if not n.any():
+            return
+        block_mean = np.where(valid, values, 0.0).sum(axis=0, dtype=np.float64) / np.maximum(n, 1)
+        block_m2 = (np.where(valid, values - block_mean, 0.0).astype(np.float64) ** 2).sum(axis=0)
+
+        total = self.count + n
+        delta = block_mean - self.mean
+        weight = np.where(total > 0, n / np.maximum(total, 1), 0.0)
+        self.mean += delta * weight
+        self.m2 += block_m2 + delta ** 2 * self.count * weight
+        self.count = total
+
+    @property
+    def std(self):
+        std = np.sqrt(self.m2 / np.maximum(self.count, 1))
+        # 값이 변하지 않는 채널은 나누지 않음
+        return np.where(std > 0, std, 1.0)
+
+    def save(self, path):
+        np.savez(path, mean=self.mean.astype(np.float32), std=self.std.astype(np.float32), count=self.count)
+
+
+class _NpyWriter:
+    """
+    크기를 모르는 .npy 를 순서대로 채움
+    최대 크기로 open_memmap 한 뒤 닫을 때 header 의 shape 만 실제 행 수로 고쳐 쓰고 남는 뒤쪽을 잘라냄
+    (numpy 는 첫 번째 축 크기가 늘어날 수 있도록 header 에 여유 공간을 두므로 header 길이는 그대로)
+    """
+
+    def __init__(self, path, max_rows, columns, dtype):
+        self.path = path
+        self._shape_tail = (columns,) if columns else ()
+        self._array = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(max_rows, *self._shape_tail))
+        self.rows = 0
+
+    def write(self, values):
+        self._array[self.rows:self.rows + len(values)] = values
+        self.rows += len(values)
+
+    def close(self):
+        dtype, offset = self._array.dtype, self._array.offset
+        self._array.flush()
+        del self._array
+        with open(self.path, "r+b") as f:
+            header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False,
+                      "shape": (self.rows, *self._shape_tail)}
+            np.lib.format.write_array_header_1_0(f, header)
+            if f.tell() != offset:
+                raise RuntimeError(f"npy header size changed: {self.path}")
+            f.truncate(offset + self.rows * dtype.itemsize * int(np.prod(self._shape_tail, dtype=np.int64)))
+
+
+class SourceGaps:
+    """
+    기기의 원본 샘플 시각(모든 PID)에서 max_gap 초보다 긴 공백을 기록하고 그 구간의 grid 행을 NaN 으로 바꿈
+    (HOLD 가 시동 꺼짐/연결 끊김 동안 마지막 값을 계속 채우지 않도록 -> ShardWriter 가 거기서 shard 를 나눔)
+    """
+
+    def __init__(self, max_gap):
+        self.max_gap = max_gap
+        self._last = None
+        self._gaps = deque() # (시작, 끝): 시작 < 행 시각 < 끝 이면 공백
+
+    def add(self, times):
+        if len(times) == 0:
+            return
+        points = times if self._last is None else np.concatenate([[self._last], times])
+        jumps = np.flatnonzero(np.diff(points) > self.max_gap)
+        self._gaps.extend(zip((points[jumps] + self.max_gap).tolist(), points[jumps + 1].tolist()))
+        self._last = points[-1]
+
+    def mask(self, times, values):
+        while self._gaps and self._gaps[0][1] <= times[0]:
+            self._gaps.popleft()
+        for gap_start, gap_end in self._gaps:
+            if gap_start >= times[-1]:
+                break
+            values[(times > gap_start) & (times < gap_end)] = np.nan
+        return values
+
+
+class ShardWriter:
+    """
+    기기 하나의 정렬된 행을 shard_rows 행 단위 .npy (values, times) 로 저장
+    모든 PID 가 NaN 인 행(시동 꺼짐, 연결 끊김)은 저장하지 않고 거기서 shard 를 나눠서 윈도우가 공백을 넘지 않게 함
+    크기 때문에 나눈 shard 는 continues=True 로 표시 (WindowDataset 이 앞 shard 와 이어서 윈도우를 만듦)
+    """
+
+    def __init__(self, directory, device_id, num_features, shard_rows):
+        self.directory = directory
+        self.device_id = device_id
+        self.num_features = num_features
+        self.shard_rows = shard_rows
+        self.shards = []
+        self._values = self._times = None
+
+    def _open(self, continues=False):
+        name = f"{self.device_id}-{len(self.shards):05d}".replace("/", "_").replace(":", "_")
+        self._values = _NpyWriter(os.path.join(self.directory, f"{name}.npy"), self.shard_rows, self.num_features, np.float32)
+        self._times = _NpyWriter(os.path.join(self.directory, f"{name}.times.npy"), self.shard_rows, 0, np.float64)
+        self.shards.append({"device_id": self.device_id, "values": f"{name}.npy", "times": f"{name}.times.npy",
+                            "continues": continues})
+
+    def _finish(self):
+        if self._values is None:
+            return
+        self._values.close()
+        self._times.close()
+        self.shards[-1]["rows"] = self._values.rows
+        if self._values.rows == 0:
+            os.remove(self._values.path)
+            os.remove(self._times.path)
+            self.shards.pop()
+        self._values = self._times = None
+
+    def write(self, times, values):
+        empty = np.isnan(values).all(axis=1)
+        # 연속으로 값이 있는 구간(segment) 단위로 저장
+        edges = np.flatnonzero(np.diff(np.concatenate([[True], empty, [True]]).astype(np.int8)))
+        if empty[0]:
+            self._finish()
+        for segment_start, segment_end in zip(edges[::2], edges[1::2]):
+            if segment_start > 0:
+                self._finish()
+            start = segment_start
+            while start < segment_end:
+                if self._values is None or self._values.rows == self.shard_rows:
+                    continues = self._values is not None
+                    self._finish()
+                    self._open(continues)
+                end = min(segment_end, start + self.shard_rows - self._values.rows)
+                self._values.write(values[start:end])
+                self._times.write(times[start:end])
+                start = end
+        if empty[-1]:
+            self._finish()
+
+    def close(self):
+        self._finish()
+        return self.shards
+
+
+async def export_dataset(directory, device_ids, start, end, pids=None, rate_hz=10.0, policies=None,
+                         max_staleness=None, max_gap=MAX_GAP, shard_rows=1_000_000, fetch_size=50_000):
+    """
+    readings -> directory/{manifest.json, stats.npz, <device>-<n>.npy, <device>-<n>.times.npy}
+    max_gap: 기기의 샘플이 이 시간(초)보다 오래 없던 구간은 저장하지 않고 shard 를 나눔 (None 이면 나누지 않음)
+    """
+    pids = list(pids or ECU_PIDS)
+    os.makedirs(directory, exist_ok=True)
+    stats = ChannelStats(len(pids))
+    manifest = {
+        "pids": pids,
+        "rate_hz": rate_hz,
+        "policies": {str(pid): policy for pid, policy in (policies or {}).items()},
+        "max_staleness": max_staleness,
+        "max_gap": max_gap,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "stats": "stats.npz",
+        "shards": [],
+    }
+
+    for device_id in device_ids:
+        aligner = Aligner(pids, rate_hz, policies, max_staleness, EXPORT_DELAY, capacity=65536)
+        writer = ShardWriter(directory, device_id, len(pids), shard_rows)
+        gaps = SourceGaps(max_gap) if max_gap is not None else None
+
+        def write(blocks):
+            for times, values in blocks:
+                if gaps is not None:
+                    values = gaps.mask(times, values)
+                stats.update(values)
+                writer.write(times, values)
+
+        async with AsyncSessionLocal() as session:
+            async for times, row_pids, values in stream_device_readings(session, device_id, pids, start, end, fetch_size):
+                if gaps is not None:
+                    gaps.add(times)
+                aligner.add_block(times, row_pids, values)
+                write(aligner.drain())
+        write(aligner.drain(delay=0.0))
+        manifest["shards"].extend(writer.close())
+        logger.info("[EXPORT] %s rows: %d", device_id, aligner.rows_closed)
+
+    stats.save(os.path.join(directory, manifest["stats"]))
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class WindowDataset:
+    """
+    export 된 shard 에서 (1, 피처 수, 윈도우 크기) 정규화 윈도우를 lazy 하게 반환
+    크기 때문에 나뉜 shard(continues)는 앞 shard 와 이어서 하나의 구간으로 보고 윈도우를 만듦 (경계를 넘는 윈도우만 복사해서 이어붙임)
+    NaN(값 없음/오래된 값)이 들어간 윈도우는 제외, labeler(device_id, 윈도우 마지막 시각) 를 주면 (x, y) 반환
+    """
+
+    def __init__(self, directory, window_size=128, step_size=64, normalize=True, labeler=None):
+        with open(os.path.join(directory, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.directory = directory
+        self.window_size = window_size
+        self.step_size = step_size
+        self.labeler = labeler
+
+        self.mean = self.std = None
+        if normalize:
+            stats = np.load(os.path.join(directory, self.manifest["stats"]))
+            self.mean, self.std = stats["mean"].reshape(-1, 1), stats["std"].reshape(-1, 1)
+
+        # 공백 없이 이어지는 shard 묶음(run): [device_id, values 목록, times 목록]
+        runs = []
+        for shard in self.manifest["shards"]:
+            values = np.load(os.path.join(directory, shard["values"]), mmap_mode="r")
+            times = np.load(os.path.join(directory, shard["times"]), mmap_mode="r")
+            if shard.get("continues") and runs and runs[-1][0] == shard["device_id"]:
+                runs[-1][1].append(values)
+                runs[-1][2].append(times)
+            else:
+                runs.append([shard["device_id"], [values], [times]])
+
+        self._runs = []
+        run_ids, positions = [], []
+        for device_id, values, times in runs:
+            offsets = np.concatenate([[0], np.cumsum([len(v) for v in values])])
+            count = window_count(int(offsets[-1]), window_size, step_size)
+            if count == 0:
+                continue
+            # NaN 이 있는 행 수의 누적합으로 윈도우마다 NaN 포함 여부를 계산
+            nan_rows = np.concatenate([[0], np.cumsum(np.concatenate([np.isnan(v).any(axis=1) for v in values]))])
+            starts = np.arange(count) * step_size
+            valid = np.flatnonzero(nan_rows[starts + window_size] == nan_rows[starts])
+            run_ids.append(np.full(len(valid), len(self._runs), dtype=np.int32))
+            positions.append(valid)
+            self._runs.append((device_id, values, times, offsets))
+        self._run_ids = np.concatenate(run_ids) if run_ids else np.empty(0, dtype=np.int32)
+        self._positions = np.concatenate(positions) if positions else np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._positions)
+
+    @staticmethod
+    def _rows(arrays, offsets, start, end):
+        """run 의 [start, end) 행, 한 shard 안이면 view, 경계를 넘으면 이어붙인 복사본"""
+        first = np.searchsorted(offsets, start, side="right") - 1
+        if end <= offsets[first + 1]:
+            return arrays[first][start - offsets[first]:end - offsets[first]]
+        parts = []
+        index = first
+        while start < end:
+            stop = min(end, offsets[index + 1])
+            parts.append(arrays[index][start - offsets[index]:stop - offsets[index]])
+            start = stop
+            index += 1
+        return np.concatenate(parts)
+
+    def window_info(self, index):
+        """(device_id, 윈도우 마지막 시각(epoch 초))"""
+        device_id, _, times, offsets = self._runs[self._run_ids[index]]
+        last = self._positions[index] * self.step_size + self.window_size - 1
+        return device_id, float(self._rows(times, offsets, last, last + 1)[0])
+
+    def __getitem__(self, index):
+        _, values, _, offsets = self._runs[self._run_ids[index]]
+        start = self._positions[index] * self.step_size
+        x = self._rows(values, offsets, start, start + self.window_size).T.astype(np.float32)
+        if self.mean is not None:
+            x -= self.mean
+            x /= self.std
+        if self.labeler is None:
+            return x[None]
+        return x[None], self.labeler(*self.window_info(index))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="readings 를 학습용 .npy shard 로 export")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--devices", required=True, help="기기 주소 (쉼표로 구분)")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--pids", default=",".join(f"{pid:04X}" for pid in ECU_PIDS))
+    parser.add_argument("--rate-hz", type=float, default=10.0)
+    parser.add_argument("--linear", default="", help="선형 보간할 PID (쉼표로 구분), 나머지는 직전 값 유지")
+    parser.add_argument("--max-staleness", type=float, help="마지막 값이 이 시간(초)보다 오래되면 NaN")
+    parser.add_argument("--max-gap", type=float, default=MAX_GAP, help="기기의 샘플이 이 시간(초)보다 오래 없으면 shard 를 나눔")
+    parser.add_argument("--shard-rows", type=int, default=1_000_000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    setup_logging()
+    pids = [int(pid, 16) for pid in args.pids.split(",")]
+    linear = {int(pid, 16) for pid in args.linear.split(",") if pid}
+    start, end = (t if t.tzinfo else t.replace(tzinfo=timezone.utc) for t in (args.start, args.end))
+    asyncio.run(export_dataset(
+        args.out, [device.strip() for device in args.devices.split(",")], start, end, pids, args.rate_hz,
+        {pid: LINEAR if pid in linear else HOLD for pid in pids}, args.max_staleness, args.max_gap,
+        args.shard_rows,
+    ))
+
+
+if __name__ == "__main__":
+    main()
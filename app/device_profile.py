@@ -0,0 +1,45 @@
+"""
+기기별 프로필(notify/write UUID 조합, OBD 프로토콜) 저장 및 조회
+"""
+from datetime import datetime, timezone
+
+from app.database import AsyncSessionLocal
+from app.logger import get_logger
+from app.models import DeviceProfile
+
+logger = get_logger("profile")
+
+
+async def load_profile(device_id):
+    async with AsyncSessionLocal() as session:
+        try:
+            return await session.get(DeviceProfile, device_id)
+        except Exception as e:
+            logger.warning("[PROFILE LOAD ERROR] %s", e)
+            return None
+
+
+async def save_profile(device_id, notify_uuid, write_uuid, write_properties, protocol, init_results):
+    async with AsyncSessionLocal() as session:
+        try:
+            await session.merge(DeviceProfile(
+                device_id=device_id,
+                notify_uuid=str(notify_uuid),
+                write_uuid=str(write_uuid),
+                write_properties=','.join(write_properties),
+                protocol=protocol,
+                init_results=init_results,
+                updated_at=datetime.now(timezone.utc),
+            ))
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            logger.warning("[PROFILE SAVE ERROR] %s", e)
+
+
+async def delete_profile(device_id):
+    async with AsyncSessionLocal() as session:
+        profile = await session.get(DeviceProfile, device_id)
+        if profile is not None:
+            await session.delete(profile)
+            await session.commit()
@@ -0,0 +1,41 @@
+"""
+차트 표시용 시계열 downsampling
+LTTB(Largest-Triangle-Three-Buckets): 모양을 최대한 유지하면서 threshold 개의 점만 남긴다.
+"""
+
+
+def lttb(points, threshold):
+    """points: [(x, y, ...), ...] (x 오름차순), x 는 float(epoch 초), 세번째 이후 값은 그대로 유지"""
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0 # 직전에 선택한 점의 index
+
+    for i in range(threshold - 2):
+        # 다음 bucket 의 평균점
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        count = next_end - next_start
+        avg_x = sum(points[j][0] for j in range(next_start, next_end)) / count
+        avg_y = sum(points[j][1] for j in range(next_start, next_end)) / count
+
+        # 현재 bucket 에서 (직전 선택점, 다음 bucket 평균점)과 만드는 삼각형 넓이가 가장 큰 점 선택
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = points[a][0], points[a][1]
+        max_area = -1.0
+        chosen = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                chosen = j
+
+        sampled.append(points[chosen])
+        a = chosen
+
+    sampled.append(points[-1])
+    return sampled
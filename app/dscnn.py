@@ -0,0 +1,192 @@
+"""
+DS_CNN.ipynb 의 DSCNNWithDownsampling 모델과 추론용 export
+- export 시 BatchNorm 을 바로 앞 Conv 의 weight/bias 로 합쳐서(fold) 추론 연산을 줄임
+- .onnx 로 저장하고 calibration 데이터를 주면 int8 정적 양자화, 그 외 확장자는 TorchScript(trace + freeze) 로 저장
+- 실행은 app.inference.load_model (.onnx 는 onnxruntime 만 있으면 되고 torch 는 필요 없음)
+- 입력 PID, 윈도우 크기, 정규화 값, 클래스 이름 등은 모델 파일 안에 메타데이터로 같이 저장
+
+python -m app.dscnn --checkpoint dscnn.pt --out dscnn.onnx --num-classes 3 --stats stats.npz --calibration drive.npy
+"""
+import argparse
+import copy
+import json
+import os
+import tempfile
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+from app.pid_decoder import ECU_PIDS
+from app.windowing import SlidingWindows
+
+
+class DSCNNWithDownsampling(nn.Module):
+    def __init__(self, in_channels, num_classes):
+        super(DSCNNWithDownsampling, self).__init__()
+
+        # --- Block 1 (64 channels) ---
+        self.block1 = nn.Sequential(
+            nn.Conv2d(in_channels, in_channels, kernel_size=3, stride=2, padding=1, groups=in_channels, bias=False),
+            nn.BatchNorm2d(in_channels),
+            nn.ReLU(),
+            nn.Conv2d(in_channels, 64, kernel_size=1, bias=False),
+            nn.BatchNorm2d(64),
+            nn.ReLU()
+        )
+
+        # --- Block 2 (128 channels) ---
+        # Depthwise Conv 에서 stride=2 로 Downsampling, Pointwise Conv 에서 채널 수를 128로 변경
+        self.block2 = nn.Sequential(
+            nn.Conv2d(64, 64, kernel_size=3, stride=2, padding=1, groups=64, bias=False),
+            nn.BatchNorm2d(64),
+            nn.ReLU(),
+            nn.Conv2d(64, 128, kernel_size=1, bias=False),
+            nn.BatchNorm2d(128),
+            nn.ReLU()
+        )
+
+        # --- Block 3 (128 channels) ---
+        self.block3 = nn.Sequential(
+            nn.Conv2d(128, 128, kernel_size=3, padding=1, stride=2, groups=128, bias=False),
+            nn.BatchNorm2d(128),
+            nn.ReLU(),
+            nn.Conv2d(128, 128, kernel_size=1, bias=False),
+            nn.BatchNorm2d(128),
+            nn.ReLU(),
+        )
+        # --- 후처리 레이어 ---
+        self.avgpool = nn.AdaptiveMaxPool2d((1, 1))
+        self.fc = nn.Linear(128, num_classes)
+
+    def forward(self, x):
+        # x: [batch, 1, 피처 수, 윈도우 크기]
+        x = self.block1(x)
+        x = self.block2(x)
+        x = self.block3(x)
+        x = self.avgpool(x)
+        x = torch.flatten(x, 1)
+        return self.fc(x)
+
+
+def fold_batchnorm(model):
+    """Sequential 안의 Conv2d -> BatchNorm2d 쌍을 하나의 Conv2d 로 합친 eval 모델 반환 (원본은 그대로)"""
+    model = copy.deepcopy(model).eval()
+    for name, block in model.named_children():
+        if not isinstance(block, nn.Sequential):
+            continue
+        layers = list(block)
+        folded = []
+        i = 0
+        while i < len(layers):
+            if i + 1 < len(layers) and isinstance(layers[i], nn.Conv2d) and isinstance(layers[i + 1], nn.BatchNorm2d):
+                folded.append(fuse_conv_bn_eval(layers[i], layers[i + 1]))
+                i += 2
+            else:
+                folded.append(layers[i])
+                i += 1
+        setattr(model, name, nn.Sequential(*folded))
+    return model
+
+
+class _CalibrationReader:
+    """onnxruntime 정적 양자화용 입력 (실제 주행 데이터 윈도우)"""
+
+    def __init__(self, windows, batch_size=64, max_batches=32):
+        self._batches = (x for x, _ in windows.batches(batch_size, np.arange(min(len(windows), batch_size * max_batches))))
+
+    def get_next(self):
+        x = next(self._batches, None)
+        return None if x is None else {"windows": x}
+
+
+def export_model(model, path, meta, calibration=None):
+    """
+    model: 학습된 DSCNNWithDownsampling
+    meta: pids, window_size, step_size, sample_hz, mean, std, classes
+    calibration: (시간, 피처) 원본 주행 데이터, .onnx 저장 시 int8 양자화에 사용
+    """
+    folded = fold_batchnorm(model)
+    example = torch.zeros(1, 1, len(meta["pids"]), meta["window_size"])
+
+    if not path.endswith(".onnx"):
+        with torch.inference_mode():
+            traced = torch.jit.freeze(torch.jit.trace(folded, example))
+        torch.jit.save(traced, path, _extra_files={"meta.json": json.dumps(meta)})
+        return path
+
+    import onnx
+
+    with tempfile.TemporaryDirectory() as tmp:
+        float_path = os.path.join(tmp, "float.onnx")
+        torch.onnx.export(
+            folded, (example,), float_path,
+            input_names=["windows"], output_names=["logits"],
+            dynamic_shapes={"x": {0: torch.export.Dim("batch")}},
+            external_data=False, verbose=False,
+        )
+        if calibration is not None:
+            from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+            windows = SlidingWindows(calibration, window_size=meta["window_size"], step_size=meta["step_size"],
+                                     mean=meta.get("mean"), std=meta.get("std"))
+            quantized_path = os.path.join(tmp, "int8.onnx")
+            quantize_static(float_path, quantized_path, _CalibrationReader(windows),
+                            quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                            weight_type=QuantType.QInt8, per_channel=True)
+            meta = dict(meta, quantized="int8")
+            float_path = quantized_path
+
+        onnx_model = onnx.load(float_path)
+        onnx.helper.set_model_props(onnx_model, {"obdflow": json.dumps(meta)})
+        onnx.save(onnx_model, path)
+    return path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="학습된 DSCNN state_dict 를 추론용 모델로 export")
+    parser.add_argument("--checkpoint", required=True, help="torch.save(model.state_dict()) 파일")
+    parser.add_argument("--out", required=True, help=".onnx 이면 onnxruntime, 그 외에는 TorchScript")
+    parser.add_argument("--num-classes", type=int, required=True)
+    parser.add_argument("--classes", default="", help="클래스 이름 (쉼표로 구분)")
+    parser.add_argument("--pids", default=",".join(f"{pid:04X}" for pid in ECU_PIDS), help="입력 피처 순서")
+    parser.add_argument("--window-size", type=int, default=128)
+    parser.add_argument("--step-size", type=int, default=64)
+    parser.add_argument("--sample-hz", type=float, default=10.0, help="실시간 입력을 만들 때 피처를 샘플링하는 주기")
+    parser.add_argument("--stats", help="피처별 mean/std 가 들어있는 .npz")
+    parser.add_argument("--dataset", help="app.dataset 으로 export 한 디렉터리 (pids, 주기, 채움 방식, stats 를 그대로 사용)")
+    parser.add_argument("--calibration", help="int8 양자화용 (시간, 피처) 주행 데이터 .npy (.onnx 만)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    pids = [int(pid, 16) for pid in args.pids.split(",")]
+    model = DSCNNWithDownsampling(in_channels=1, num_classes=args.num_classes)
+    model.load_state_dict(torch.load(args.checkpoint, map_location="cpu"))
+
+    meta = {
+        "pids": pids,
+        "window_size": args.window_size,
+        "step_size": args.step_size,
+        "sample_hz": args.sample_hz,
+        "classes": args.classes.split(",") if args.classes else [str(i) for i in range(args.num_classes)],
+    }
+    if args.dataset:
+        # 학습 데이터와 같은 방식으로 실시간 입력을 정렬하도록 export 설정을 그대로 저장
+        with open(os.path.join(args.dataset, "manifest.json")) as f:
+            manifest = json.load(f)
+        meta.update(pids=manifest["pids"], sample_hz=manifest["rate_hz"], policies=manifest["policies"],
+                    max_staleness=manifest["max_staleness"])
+        args.stats = args.stats or os.path.join(args.dataset, manifest["stats"])
+    if args.stats:
+        stats = np.load(args.stats)
+        meta["mean"] = stats["mean"].tolist()
+        meta["std"] = stats["std"].tolist()
+    calibration = np.load(args.calibration, mmap_mode="r") if args.calibration else None
+    print(export_model(model, args.out, meta, calibration))
+
+
+if __name__ == "__main__":
+    main()
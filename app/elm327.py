@@ -0,0 +1,121 @@
+"""
+ELM327 응답 프레임 조립 및 명령-응답 매칭
+BLE notify 는 응답을 임의의 크기로 잘라서 보내므로 '>' 프롬프트가 올 때까지 버퍼에 모은 뒤
+한 번에 하나의 명령만 전송하고, 완성된 응답을 그 명령의 future 로 전달한다.
+시간 초과된 명령의 응답은 늦게라도 도착하므로 그 응답은 버려서 이후 응답이 한 칸씩 밀리지 않게 한다.
+"""
+import asyncio
+import time
+
+MAX_FRAME_BYTES = 4096 # 가장 긴 응답(CAN multi-frame)보다 충분히 큼
+# 시간 초과된 명령의 응답을 기다리는 시간(초), ELM327 은 ATST 최대값(약 1초) 안에 응답을 끝내므로 여유를 둠
+STALE_REPLY_WINDOW = 2.0
+
+
+class FrameAssembler:
+    def __init__(self, max_bytes=MAX_FRAME_BYTES):
+        # bytes 를 계속 이어붙이지 않고 하나의 bytearray 를 재사용
+        self._buffer = bytearray()
+        self.max_bytes = max_bytes
+        self.overflows = 0 # '>' 없이 max_bytes 를 넘어서 버린 횟수 (잡음, 끊긴 응답)
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def reset(self):
+        self._buffer.clear()
+
+    def feed(self, data):
+        """
+        notify 조각을 추가하고 완성된 응답 목록을 반환
+        응답 하나는 '\r' 로 나눈 줄 목록 ex) ['41 0C 11 30', '41 0C 11 2E']
+        """
+        self._buffer += data
+        replies = []
+        while True:
+            end = self._buffer.find(b">")
+            if end < 0:
+                break
+            chunk = self._buffer[:end].decode("ascii", errors="ignore")
+            del self._buffer[:end + 1]
+
+            lines = [line.strip() for line in chunk.replace("\n", "\r").split("\r")]
+            replies.append([line for line in lines if line])
+
+        if len(self._buffer) > self.max_bytes:
+            # 프롬프트가 오지 않는 notify 가 계속 쌓이지 않도록 버림 -> 메모리 상한 유지
+            self._buffer.clear()
+            self.overflows += 1
+        return replies
+
+
+def reply_matches(command, reply):
+    """
+    응답이 명령에 대한 것인지 확인 (늦게 도착한 이전 명령의 응답을 구분할 때만 사용)
+    PID 요청은 '4x' + 첫 PID 가 있어야 하고, AT 명령은 PID 데이터 응답이 아니어야 함
+    """
+    command = command.decode("ascii", errors="ignore").strip().upper().replace(" ", "")
+    lines = [line.replace(" ", "").upper() for line in reply]
+    if command.startswith("AT"):
+        return not any(line[:1] == "4" and line[1:2].isdigit() for line in lines)
+    if len(command) < 4:
+        return False
+    expected = f"4{command[1]}{command[2:4]}"
+    return any(expected in line for line in lines)
+
+
+class CommandChannel:
+    """한 번에 하나의 명령만 전송(single in-flight)하는 ELM327 명령 채널"""
+
+    def __init__(self, client, write_uuid=None, response=True):
+        self.client = client
+        self.write_uuid = write_uuid
+        self.response = response # False 이면 write-without-response (GATT 응답 왕복 생략)
+        self.assembler = FrameAssembler()
+        self._lock = asyncio.Lock()
+        self._pending = None
+        self._command = None
+        # 시간 초과된 명령 중 아직 응답이 오지 않은 수, _stale_until 까지 오지 않으면 응답이 없는 것으로 봄
+        self._stale = 0
+        self._stale_until = 0.0
+
+        self.unsolicited = 0 # 대기 중인 명령이 없을 때 도착한 응답 수
+        self.stale_replies = 0 # 시간 초과된 명령의 늦은 응답이라서 버린 수
+        self.timeouts = 0
+
+
+    # bleak notify 콜백, 동기 함수라 notify 마다 task 가 생성되지 않음
+    def on_notify(self, sender, data):
+        for reply in self.assembler.feed(data):
+            if self._stale and time.monotonic() > self._stale_until:
+                self._stale = 0
+            pending = self._pending is not None and not self._pending.done()
+            if self._stale and not (pending and reply_matches(self._command, reply)):
+                # 시간 초과된 명령의 응답 -> 지금 대기 중인 명령의 응답으로 전달하지 않음
+                self._stale -= 1
+                self.stale_replies += 1
+            elif pending:
+                self._pending.set_result(reply)
+            else:
+                self.unsolicited += 1
+
+
+    async def send(self, command, timeout=5.0):
+        """명령을 전송하고 '>' 프롬프트까지의 응답 줄 목록을 반환, 시간 초과 시 asyncio.TimeoutError"""
+        async with self._lock:
+            self._pending = asyncio.get_running_loop().create_future()
+            self._command = command
+            try:
+                await self.client.write_gatt_char(self.write_uuid, command, response=self.response)
+                return await asyncio.wait_for(self._pending, timeout=timeout)
+            except asyncio.TimeoutError:
+                # 응답이 중간에 끊긴 경우 남은 조각이 다음 명령의 응답으로 섞이지 않도록 비움
+                self.timeouts += 1
+                self.assembler.reset()
+                # 늦게 오는 응답은 버림 (STALE_REPLY_WINDOW 안에 오지 않으면 응답이 없는 명령으로 봄)
+                self._stale += 1
+                self._stale_until = time.monotonic() + max(timeout, STALE_REPLY_WINDOW)
+                raise
+            finally:
+                self._pending = None
+                self._command = None
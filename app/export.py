@@ -0,0 +1,267 @@
+"""
+분석용 컬럼 형식 export (Parquet / Arrow IPC)
+- readings 를 기기별로 server-side cursor 로 읽으면서 (기기, 시각) 한 행에 PID 별 열로 펼침
+  (한 번의 요청으로 받은 PID 들은 같은 시각이므로 같은 행에 들어감, 값이 없는 칸은 NaN)
+- row_group_rows 행씩 row group(Parquet) / record batch(Arrow) 로 쓰고 버리므로
+  기간/기기 수와 상관없이 메모리 사용량은 fetch_size + row_group_rows 행 정도로 일정
+- 값 열은 null 대신 NaN 을 쓰는 float32 라서 pandas / numpy 로 복사 없이 읽을 수 있음
+  ex) pa.ipc.open_file(pa.memory_map("fleet.arrow")).read_all()["engine_rpm"].to_numpy()
+- pyarrow 는 선택 의존성 (export 할 때만 import)
+
+python -m app.export --out fleet-2026-03.parquet --start 2026-03-01 --end 2026-04-01
+python -m app.export --out a.arrow --format arrow --devices A,B --start 2026-03-01 --end 2026-03-02 --compression zstd
+"""
+import argparse
+import asyncio
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import text
+
+from app.database import AsyncSessionLocal
+from app.logger import get_logger, setup_logging
+from app.pid_decoder import ECU_PIDS, PIDS
+from app.queries import stream_device_readings
+
+logger = get_logger("export")
+
+FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", ".arrow"),
+}
+ROW_GROUP_ROWS = 131072
+
+
+def require_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet/Arrow export requires pyarrow (pip install pyarrow)") from e
+    return pa, pq
+
+
+def check_options(fmt, compression):
+    """스트림을 시작하기 전에 형식/압축 확인 (응답을 보내기 시작한 뒤에는 오류를 알릴 수 없음)"""
+    pa, _ = require_pyarrow()
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+    if compression is None:
+        return
+    # Arrow IPC 는 lz4 / zstd 만 지원
+    allowed = ("lz4", "zstd") if fmt == "arrow" else ("snappy", "gzip", "brotli", "zstd", "lz4")
+    if compression not in allowed or not pa.Codec.is_available(compression):
+        raise ValueError(f"unsupported compression for {fmt}: {compression}")
+
+
+def column_name(pid):
+    spec = PIDS.get(pid)
+    return spec.name if spec is not None else f"pid_{pid:04X}"
+
+
+class Pivot:
+    """
+    시간순 (시각, pid, 값) block 을 (시각, PID 열) 행렬로 펼쳐서 row_group_rows 행 단위로 반환
+    block 의 마지막 시각은 다음 block 에 이어질 수 있으므로 다음 block 과 합쳐서 처리
+    """
+
+    def __init__(self, pids, row_group_rows=ROW_GROUP_ROWS):
+        self.pids = list(pids)
+        self._columns = np.full(0x10000, -1, dtype=np.int64)
+        self._columns[self.pids] = np.arange(len(self.pids))
+        self.row_group_rows = row_group_rows
+        self._times = np.empty(row_group_rows, dtype=np.float64)
+        self._values = np.full((row_group_rows, len(self.pids)), np.nan, dtype=np.float32)
+        self._rows = 0
+        self._carry = None
+
+
+    def add(self, times, pids, values):
+        if self._carry is not None:
+            times, pids, values = (np.concatenate([c, x]) for c, x in zip(self._carry, (times, pids, values)))
+        split = np.searchsorted(times, times[-1], side="left")
+        self._carry = times[split:], pids[split:], values[split:]
+        yield from self._fill(times[:split], pids[:split], values[:split])
+
+
+    def finish(self):
+        if self._carry is not None:
+            yield from self._fill(*self._carry)
+            self._carry = None
+        if self._rows:
+            yield self._take()
+
+
+    def _fill(self, times, pids, values):
+        if len(times) == 0:
+            return
+        new_row = np.concatenate([[True], np.diff(times) > 0])
+        row_of = np.cumsum(new_row) - 1
+        unique_times = times[new_row]
+        columns = self._columns[pids]
+
+        done = 0
+        while done < len(unique_times):
+            count = min(len(unique_times) - done, self.row_group_rows - self._rows)
+            lo, hi = np.searchsorted(row_of, [done, done + count])
+            self._times[self._rows:self._rows + count] = unique_times[done:done + count]
+            valid = columns[lo:hi] >= 0
+            self._values[self._rows + row_of[lo:hi][valid] - done, columns[lo:hi][valid]] = values[lo:hi][valid]
+            self._rows += count
+            done += count
+            if self._rows == self.row_group_rows:
+                yield self._take()
+
+
+    def _take(self):
+        times, values = self._times[:self._rows].copy(), self._values[:self._rows].copy()
+        self._values[:self._rows] = np.nan
+        self._rows = 0
+        return times, values
+
+
+class _ChunkSink:
+    """pyarrow writer 의 출력을 모아두었다가 drain() 으로 꺼내는 file 객체 (HTTP 응답으로 바로 전송)"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def fleet_devices(session, start, end):
+    """
+    기간 안에 값이 있는 기기
+    PK 인덱스 (device_id, pid, timestamp) 로 기기마다 한 번씩만 건너뛰면서 조회 (기간 전체를 읽지 않음)
+    """
+    result = await session.execute(text(
+        """
+        WITH RECURSIVE devices(device_id) AS (
+            SELECT min(device_id) FROM readings WHERE timestamp >= :start AND timestamp < :end
+            UNION ALL
+            SELECT (SELECT min(r.device_id) FROM readings r
+                    WHERE r.device_id > d.device_id AND r.timestamp >= :start AND r.timestamp < :end)
+            FROM devices d WHERE d.device_id IS NOT NULL
+        )
+        SELECT device_id FROM devices WHERE device_id IS NOT NULL
+        """
+    ), {"start": start, "end": end})
+    return list(result.scalars())
+
+
+async def stream_export(device_ids, start, end, pids=None, fmt="parquet", compression=None,
+                        row_group_rows=ROW_GROUP_ROWS, fetch_size=50_000):
+    """
+    export 파일을 row group 단위 bytes 조각으로 반환 (조각을 순서대로 이어 쓰면 완성된 파일)
+    device_ids 가 없으면 기간 안의 모든 기기
+    """
+    check_options(fmt, compression)
+    pa, pq = require_pyarrow()
+    pids = list(pids or ECU_PIDS)
+
+    async with AsyncSessionLocal() as session:
+        if not device_ids:
+            device_ids = await fleet_devices(session, start, end)
+        # 모든 batch 가 같은 dictionary 를 쓰도록 기기 목록을 미리 고정 (Arrow IPC file 은 dictionary 교체 불가)
+        devices = pa.array(device_ids, type=pa.string())
+        schema = pa.schema(
+            [("device_id", pa.dictionary(pa.int32(), pa.string())), ("timestamp", pa.timestamp("us", tz="UTC"))]
+            + [(column_name(pid), pa.float32()) for pid in pids],
+            metadata={"pids": ",".join(f"{pid:04X}" for pid in pids)},
+        )
+
+        sink = _ChunkSink()
+        if fmt == "parquet":
+            writer = pq.ParquetWriter(sink, schema, compression=compression or "NONE")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=compression) if compression else None
+            writer = pa.ipc.new_file(sink, schema, options=options)
+
+        def write(device_index, times, values):
+            micros = np.round(times * 1e6).astype(np.int64)
+            columns = [
+                pa.DictionaryArray.from_arrays(pa.array(np.full(len(times), device_index, dtype=np.int32)), devices),
+                pa.array(micros, type=pa.timestamp("us", tz="UTC")),
+            ] + [pa.array(values[:, i]) for i in range(len(pids))]
+            batch = pa.record_batch(columns, schema=schema)
+            if fmt == "parquet":
+                writer.write_batch(batch, row_group_size=len(times))
+            else:
+                writer.write_batch(batch)
+
+        rows = 0
+        try:
+            for device_index, device_id in enumerate(device_ids):
+                pivot = Pivot(pids, row_group_rows)
+                async for times, row_pids, values in stream_device_readings(session, device_id, pids, start, end, fetch_size):
+                    for group_times, group_values in pivot.add(times, row_pids, values):
+                        write(device_index, group_times, group_values)
+                        rows += len(group_times)
+                        yield sink.drain()
+                for group_times, group_values in pivot.finish():
+                    write(device_index, group_times, group_values)
+                    rows += len(group_times)
+                    yield sink.drain()
+        finally:
+            writer.close()
+        yield sink.drain()
+        logger.info("[EXPORT] %s %d devices, %d rows", fmt, len(device_ids), rows)
+
+
+async def export_file(path, device_ids, start, end, pids=None, fmt="parquet", compression=None,
+                      row_group_rows=ROW_GROUP_ROWS, fetch_size=50_000):
+    with open(path, "wb") as f:
+        async for chunk in stream_export(device_ids, start, end, pids, fmt, compression, row_group_rows, fetch_size):
+            f.write(chunk)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--devices", default="", help="기기 주소 (쉼표로 구분, 없으면 기간 안의 모든 기기)")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--pids", default=",".join(f"{pid:04X}" for pid in ECU_PIDS))
+    parser.add_argument("--format", choices=list(FORMATS), help="기본: 파일 확장자 (.arrow / .feather 이면 arrow)")
+    parser.add_argument("--compression", help="parquet: snappy, zstd, gzip ... / arrow: lz4, zstd")
+    parser.add_argument("--row-group-rows", type=int, default=ROW_GROUP_ROWS)
+    args = parser.parse_args()
+    args.format = args.format or ("arrow" if args.out.endswith((".arrow", ".feather")) else "parquet")
+    try:
+        check_options(args.format, args.compression)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def main():
+    args = parse_args()
+    setup_logging()
+    start, end = (t if t.tzinfo else t.replace(tzinfo=timezone.utc) for t in (args.start, args.end))
+    asyncio.run(export_file(
+        args.out, [device.strip() for device in args.devices.split(",") if device.strip()], start, end,
+        [int(pid, 16) for pid in args.pids.split(",")], args.format, args.compression, args.row_group_rows,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+블루투스 없이 실행할 수 있는 가상 ELM327 BLE 어댑터
+BleakClient 와 같은 인터페이스를 제공하므로 SensorReader(transport_factory=...) 로 바로 사용할 수 있다.
+- 응답 지연, notify 조각 크기, 첫 요청의 SEARCHING..., 지원하지 않는 PID 의 NO DATA, 여러 PID 묶음 요청 지원
+- recording 이 주어지면 RecordingTransport 로 기록한 실제 세션의 응답을 재생
+"""
+import asyncio
+import json
+import math
+import random
+import time
+
+from app.pid_decoder import PIDS
+
+NOTIFY_UUID = "0000fff1-0000-1000-8000-00805f9b34fb"
+WRITE_UUID = "0000fff2-0000-1000-8000-00805f9b34fb"
+
+
+class FakeCharacteristic:
+    def __init__(self, uuid, properties, description=""):
+        self.uuid = uuid
+        self.properties = properties
+        self.description = description
+
+
+class FakeService:
+    def __init__(self, uuid, characteristics):
+        self.uuid = uuid
+        self.characteristics = characteristics
+
+
+# PID 별 시간에 따라 변하는 가상 차량 값
+def _simulated_value(pid, t):
+    if pid == 0x010C:
+        return 1500 + 700 * math.sin(t / 3)
+    if pid == 0x010D:
+        return 60 + 30 * math.sin(t / 20)
+    if pid == 0x0105:
+        return min(90, 20 + t)
+    if pid == 0x0142:
+        return 14.1 + 0.1 * math.sin(t)
+    if pid in (0x0104, 0x0161, 0x0162):
+        return 40 + 20 * math.sin(t / 2)
+    return 10 + 5 * math.sin(t / 5)
+
+
+def encode_value(pid, value):
+    """PID 공식의 역변환으로 응답 데이터 바이트 생성 (mode 01 공식은 모두 1차식)"""
+    spec = PIDS[pid]
+    zero = [0] * spec.length
+    one = zero[:-1] + [1]
+    offset = spec.formula(*zero)
+    scale = spec.formula(*one) - offset
+    raw = min(max(int(round((value - offset) / scale)), 0), 256 ** spec.length - 1)
+    return raw.to_bytes(spec.length, "big")
+
+
+def load_recording(path):
+    """RecordingTransport 로 기록한 JSONL -> {command: [(reply, latency), ...]}"""
+    recording = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                entry = json.loads(line)
+                recording.setdefault(entry["command"], []).append((entry["reply"], entry.get("latency")))
+    return recording
+
+
+class FakeElm327:
+    def __init__(self, address="FAKE-ELM327", latency=0.03, jitter=0.01, chunk_size=20,
+                 search_delay=1.0, packed=True, max_pids=6, supported_pids=None,
+                 gatt_ack_latency=0.01, recording=None, seed=None):
+        self.address = address
+        self.latency = latency # ECU 응답 지연(초)
+        self.jitter = jitter
+        self.chunk_size = chunk_size # BLE notify 한 번에 전달되는 최대 바이트 수
+        self.search_delay = search_delay # ATSP0 이후 첫 요청의 프로토콜 검색 시간
+        self.packed = packed # False 이면 여러 PID 묶음 요청에 '?' 응답
+        self.max_pids = max_pids
+        self.supported_pids = set(PIDS) if supported_pids is None else set(supported_pids)
+        self.gatt_ack_latency = gatt_ack_latency # write(response=True) 의 GATT 응답 왕복 시간
+        self.recording = load_recording(recording) if isinstance(recording, str) else recording
+        self._replay_index = {}
+        self._random = random.Random(seed)
+
+        self.services = [FakeService("0000fff0-0000-1000-8000-00805f9b34fb", [
+            FakeCharacteristic(NOTIFY_UUID, ["notify"]),
+            FakeCharacteristic(WRITE_UUID, ["write", "write-without-response"]),
+        ])]
+        self.is_connected = False
+        self._callbacks = {}
+        self._protocol = "0"
+        self._searched = False
+        self._started = time.monotonic()
+        self.commands = 0
+
+
+    async def connect(self):
+        self.is_connected = True
+        self._started = time.monotonic()
+
+
+    async def disconnect(self):
+        self.is_connected = False
+        self._callbacks.clear()
+
+
+    async def start_notify(self, uuid, callback):
+        if uuid != NOTIFY_UUID:
+            raise ValueError(f"{uuid} does not support notify")
+        self._callbacks[uuid] = callback
+
+
+    async def stop_notify(self, uuid):
+        self._callbacks.pop(uuid, None)
+
+
+    async def write_gatt_char(self, uuid, data, response=True):
+        if not self.is_connected:
+            raise ConnectionError("not connected")
+        if uuid != WRITE_UUID:
+            return # 잘못된 characteristic 에 쓰면 응답 없음
+        if response:
+            await asyncio.sleep(self.gatt_ack_latency)
+
+        self.commands += 1
+        command = bytes(data).decode("ascii", errors="ignore").strip().upper().replace(" ", "")
+        reply, delay = self._reply(command)
+        delay = max(delay + self._random.uniform(-self.jitter, self.jitter), 0)
+        asyncio.get_running_loop().call_later(delay, self._emit, reply.encode())
+
+
+    def _emit(self, payload):
+        # 응답을 chunk_size 로 잘라서 여러 번의 notify 로 전달
+        for uuid, callback in list(self._callbacks.items()):
+            for i in range(0, len(payload), self.chunk_size):
+                result = callback(uuid, bytearray(payload[i:i + self.chunk_size]))
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result)
+
+
+    def _reply(self, command):
+        if self.recording is not None:
+            return self._replay(command)
+
+        if command.startswith("AT"):
+            return self._at_reply(command), 0.005
+
+        try:
+            mode = int(command[:2], 16)
+            pids = [(mode << 8) | int(command[i:i + 2], 16) for i in range(2, len(command), 2)]
+        except ValueError:
+            return "?\r\r>", 0.005
+
+        prefix = ""
+        delay = self.latency
+        if not self._searched:
+            # 자동 프로토콜 검색 중인 첫 요청
+            self._searched = True
+            if self._protocol == "0":
+                prefix = "SEARCHING...\r"
+                delay += self.search_delay
+
+        if mode != 0x01 or not pids or len(pids) > self.max_pids or (len(pids) > 1 and not self.packed):
+            return "?\r\r>", 0.005
+        if pids == [0x0100]:
+            return prefix + "41 00 BE 3F A8 13\r\r>", delay
+
+        t = time.monotonic() - self._started
+        data = bytearray([0x41])
+        for pid in pids:
+            if pid in self.supported_pids and pid in PIDS:
+                data.append(pid & 0xFF)
+                data += encode_value(pid, _simulated_value(pid, t))
+        if len(data) == 1:
+            return prefix + "NO DATA\r\r>", delay
+        # 응답 바이트 수가 많을수록 약간 더 오래 걸림
+        return prefix + " ".join(f"{b:02X}" for b in data) + " \r\r>", delay + 0.001 * len(pids)
+
+
+    def _at_reply(self, command):
+        if command == "ATZ":
+            self._searched = False
+            self._protocol = "0"
+            return "\r\rELM327 v1.5\r\r>"
+        if command == "ATDPN":
+            return f"A{self._protocol if self._protocol != '0' else '6'}\r\r>"
+        if command.startswith("ATSP"):
+            self._protocol = command[4:] or "0"
+            self._searched = False
+        return "OK\r\r>"
+
+
+    def _replay(self, command):
+        replies = self.recording.get(command)
+        if not replies:
+            return "?\r\r>", 0.005
+        index = self._replay_index.get(command, 0)
+        self._replay_index[command] = index + 1
+        reply, latency = replies[index % len(replies)]
+        return reply, latency if latency is not None else self.latency
+
+
+def fake_transport_factory(**options):
+    """SensorReader / FleetSupervisor 의 transport_factory 로 사용"""
+    return lambda address: FakeElm327(address, **options)
@@ -0,0 +1,127 @@
+"""
+fleet 모드: 하나의 이벤트 루프에서 여러 기기의 SensorReader 를 관리
+기기마다 독립된 task, 명령 채널, 재연결 backoff, 통계를 가지고
+DB 쓰기는 하나의 IngestBuffer(와 커넥션 풀)를, trip 집계는 하나의 TripRecorder 를 공유한다.
+"""
+import asyncio
+import random
+import time
+
+from app.database import settings
+from app.ingest_buffer import IngestBuffer
+from app.logger import get_logger
+from app.metrics import ACHIEVED_RATE, CONNECTED, INGEST_BUFFER_ROWS, INGEST_DROPPED, RECONNECTS, REQUESTED_RATE, \
+    STAGE_COALESCED, STAGE_DEPTH, STAGE_DROPPED, TRIPS_OPEN, UNSOLICITED_REPLIES
+from app.sensor_reader import SensorReader
+from app.trips import TripRecorder
+
+logger = get_logger("fleet")
+
+
+def configured_devices():
+    devices = [address.strip() for address in settings.FLEET_DEVICES.split(",") if address.strip()]
+    return devices or [settings.BLE_ADDRESS or None]
+
+
+class FleetSupervisor:
+    def __init__(self, devices, ingest_buffer=None, poll_rates=None, transport_factory=None, trips=None):
+        self.ingest_buffer = ingest_buffer if ingest_buffer is not None else IngestBuffer()
+        self.trips = trips if trips is not None else TripRecorder()
+        self.connect_lock = asyncio.Semaphore(settings.BLE_CONNECT_CONCURRENCY)
+        self.readers = {}
+        for address in devices:
+            reader = SensorReader(address, ingest_buffer=self.ingest_buffer, poll_rates=poll_rates,
+                                  connect_lock=self.connect_lock, transport_factory=transport_factory,
+                                  trips=self.trips)
+            self.readers[reader.ble_address] = reader
+
+        self.stats = {
+            address: {"state": "idle", "sessions": 0, "reconnects": 0, "last_error": None, "backoff": 0.0}
+            for address in self.readers
+        }
+        self._tasks = {}
+
+
+    # 한 기기의 연결이 끊기거나 실패하면 지수 backoff 후 재연결, 다른 기기에는 영향 없음
+    async def _supervise(self, address):
+        reader = self.readers[address]
+        stats = self.stats[address]
+        backoff = settings.RECONNECT_BACKOFF_MIN
+        while True:
+            stats["state"] = "running"
+            stats["sessions"] += 1
+            started = time.monotonic()
+            try:
+                await reader.reading_data()
+            except asyncio.CancelledError:
+                stats["state"] = "stopped"
+                raise
+            except Exception as e:
+                stats["last_error"] = repr(e)
+                logger.error("[READER ERROR] %s %s", address, e)
+
+            # 충분히 오래 연결되어 있었다면 backoff 초기화
+            if time.monotonic() - started > settings.RECONNECT_BACKOFF_MAX:
+                backoff = settings.RECONNECT_BACKOFF_MIN
+
+            # 여러 기기가 동시에 재연결을 시도하지 않도록 jitter 추가
+            delay = backoff * random.uniform(0.5, 1.0)
+            stats["state"] = "backoff"
+            stats["backoff"] = round(delay, 2)
+            stats["reconnects"] += 1
+            RECONNECTS.inc(device=address)
+            logger.info("[RECONNECT] %s in %.1fs", address, delay)
+            await asyncio.sleep(delay)
+            backoff = min(backoff * 2, settings.RECONNECT_BACKOFF_MAX)
+
+
+    def start(self):
+        self.ingest_buffer.start()
+        self.trips.start()
+        for address in self.readers:
+            if address not in self._tasks or self._tasks[address].done():
+                self._tasks[address] = asyncio.create_task(self._supervise(address))
+
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+        await self.ingest_buffer.stop()
+        await self.trips.stop()
+
+
+    async def run(self):
+        self.start()
+        try:
+            await asyncio.gather(*self._tasks.values())
+        finally:
+            await self.stop()
+
+
+    # /metrics scrape 시점에 gauge 갱신
+    def collect_metrics(self):
+        INGEST_BUFFER_ROWS.set(len(self.ingest_buffer))
+        INGEST_DROPPED.set(self.ingest_buffer.rows_dropped)
+        STAGE_DEPTH.set(len(self.ingest_buffer), stage="persist")
+        STAGE_DROPPED.set(self.ingest_buffer.rows_dropped, stage="persist")
+        STAGE_COALESCED.set(self.ingest_buffer.rows_coalesced, stage="persist")
+        TRIPS_OPEN.set(len(self.trips))
+        STAGE_DEPTH.set(sum(len(reader.channel.assembler) for reader in self.readers.values()), stage="receive")
+        STAGE_DROPPED.set(sum(reader.channel.assembler.overflows for reader in self.readers.values()), stage="receive")
+        for address, reader in self.readers.items():
+            CONNECTED.set(1 if reader.client.is_connected else 0, device=address)
+            UNSOLICITED_REPLIES.set(reader.channel.unsolicited, device=address)
+            if reader.scheduler is None:
+                continue
+            for pid, schedule in reader.scheduler.schedules.items():
+                ACHIEVED_RATE.set(schedule.achieved_hz, device=address, pid=f"{pid:04X}")
+                REQUESTED_RATE.set(schedule.hz, device=address, pid=f"{pid:04X}")
+
+
+    def report(self):
+        return {
+            address: {**self.stats[address], **reader.report()}
+            for address, reader in self.readers.items()
+        }
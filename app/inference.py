@@ -0,0 +1,251 @@
+"""
+DSCNN 실시간 분류
+- telemetry hub 를 구독해서 기기별 Aligner 로 sample_hz 주기의 (시간, PID) 행렬을 만듦 (학습 데이터와 같은 정렬 방식)
+- step_size 행마다 최근 window_size 행으로 윈도우를 만들어 대기열에 넣고, 여러 기기의 윈도우를 batch 로 모아 한 번에 추론
+- 모델은 스레드에서 실행해서 수집 이벤트 루프를 막지 않음 (onnxruntime / TorchScript 모두 실행 중 GIL 을 놓음)
+- 결과는 telemetry hub 에 classification 으로 발행 -> 센서 값과 같은 WebSocket/SSE 로 전달
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app.adaptive_timing import percentile
+from app.alignment import Aligner
+from app.database import settings
+from app.logger import get_logger
+from app.metrics import INFERENCE_BATCH_SECONDS, INFERENCE_LATENCY, INFERENCE_QUEUE, INFERENCE_WINDOWS
+from app.telemetry import telemetry_hub
+
+logger = get_logger("inference")
+
+STALE_AFTER = 5.0 # 이 시간(초) 동안 값이 들어오지 않은 기기는 윈도우를 처음부터 다시 채움
+ALIGN_DELAY = 0.5 # 늦게 도착하는 샘플을 기다리는 시간(초)
+REPORT_INTERVAL = 10.0 # 처리량/지연 시간 출력 간격(초)
+
+
+class CompiledModel:
+    """export 된 모델 실행: (B, 1, 피처 수, 윈도우 크기) float32 -> (B, 클래스 수) logits"""
+
+    def __init__(self, path, threads=None):
+        self.path = path
+        threads = threads or settings.INFERENCE_THREADS
+        if path.endswith(".onnx"):
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+            self._session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+            props = self._session.get_modelmeta().custom_metadata_map
+            self.meta = json.loads(props["obdflow"])
+            self._module = None
+        else:
+            import torch
+
+            torch.set_num_threads(threads)
+            extra_files = {"meta.json": ""}
+            self._module = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+            self.meta = json.loads(extra_files["meta.json"])
+            self._session = None
+
+    def __call__(self, x):
+        if self._session is not None:
+            return self._session.run(None, {"windows": x})[0]
+        import torch
+
+        with torch.inference_mode():
+            return self._module(torch.from_numpy(x)).numpy()
+
+
+def load_model(path, threads=None):
+    return CompiledModel(path, threads)
+
+
+class InferenceService:
+    def __init__(self, model, telemetry=None, batch_size=None, max_delay=None, publish=None):
+        """
+        model: load_model() 결과 (meta 에 pids, window_size, step_size, sample_hz, mean, std, classes)
+        publish: 분류 결과를 받을 함수 (device_id, timestamp, label, confidence), 기본은 telemetry.publish_classification
+        """
+        self.model = model
+        meta = model.meta
+        self.pids = meta["pids"]
+        self.window_size = meta["window_size"]
+        self.step_size = meta["step_size"]
+        self.sample_hz = meta.get("sample_hz", 10.0)
+        self.classes = meta.get("classes")
+        self.mean = np.asarray(meta["mean"], dtype=np.float32).reshape(-1, 1) if meta.get("mean") else None
+        self.std = np.asarray(meta["std"], dtype=np.float32).reshape(-1, 1) if meta.get("std") else None
+        # 학습 데이터를 만들 때 사용한 PID 별 채움 방식 (JSON 이라 key 가 문자열)
+        self.policies = {int(pid): policy for pid, policy in meta.get("policies", {}).items()}
+        self.max_staleness = meta.get("max_staleness")
+
+        self.telemetry = telemetry if telemetry is not None else telemetry_hub
+        self.publish = publish or self.telemetry.publish_classification
+        self.batch_size = batch_size or settings.INFERENCE_BATCH_SIZE
+        self.max_delay = max_delay or settings.INFERENCE_MAX_DELAY
+        # 추론이 밀리면 오래된 윈도우부터 버림 (실시간 분류라서 늦은 결과는 의미 없음)
+        self.max_pending = self.batch_size * 8
+
+        self._devices = {} # device_id -> (Aligner, 마지막 윈도우를 만든 행 번호)
+        self._pending = deque() # (device_id, timestamp, 완성 시각, window)
+        self._ready = asyncio.Event()
+        self._tasks = []
+        self._latencies = deque(maxlen=1000)
+        self._first_batch = None
+        self.windows_classified = 0
+        self.windows_dropped = 0
+        self.windows_incomplete = 0
+
+
+    async def _consume(self):
+        subscriber = self.telemetry.subscribe(pids=self.pids)
+        try:
+            while True:
+                for sample in await subscriber.next_batch():
+                    device = self._devices.get(sample["device_id"])
+                    if device is None:
+                        device = self._devices[sample["device_id"]] = [self._new_aligner(), 0]
+                    device[0].add(sample["pid"], sample["timestamp"], sample["value"])
+        finally:
+            self.telemetry.unsubscribe(subscriber)
+
+
+    def _new_aligner(self):
+        return Aligner(self.pids, self.sample_hz, self.policies, self.max_staleness, ALIGN_DELAY,
+                       capacity=self.window_size + self.step_size)
+
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        # 윈도우는 step_size 행마다 하나씩 만들어지므로 그 주기로 행을 한꺼번에 닫음
+        period = self.step_size / self.sample_hz
+        next_tick = loop.time()
+        next_report = time.monotonic() + REPORT_INTERVAL
+        while True:
+            next_tick += period
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+            now = time.monotonic()
+            timestamp = datetime.now(timezone.utc)
+            wall_clock = timestamp.timestamp()
+            for device_id in list(self._devices):
+                aligner, last_window = self._devices[device_id]
+                if wall_clock - aligner.latest > STALE_AFTER:
+                    # 연결이 끊긴 기기는 다시 값이 들어오면 처음부터 채움
+                    del self._devices[device_id]
+                    continue
+                while aligner.close(wall_clock) == aligner.capacity:
+                    pass
+                if aligner.rows_closed < self.window_size or aligner.rows_closed - last_window < self.step_size:
+                    continue
+                self._devices[device_id][1] = aligner.rows_closed
+                _, values = aligner.rows(self.window_size)
+                if np.isnan(values).any():
+                    # 아직 값이 없거나 max_staleness 를 넘은 PID 가 있는 윈도우는 분류하지 않음
+                    self.windows_incomplete += 1
+                    continue
+                self._pending.append((device_id, timestamp, now, values.T.copy()))
+                if len(self._pending) > self.max_pending:
+                    self._pending.popleft()
+                    self.windows_dropped += 1
+            if self._pending:
+                self._ready.set()
+
+            if now >= next_report:
+                next_report += REPORT_INTERVAL
+                if self.windows_classified:
+                    logger.info("[INFERENCE] %s", self.report())
+
+
+    async def _infer(self):
+        while True:
+            if not self._pending:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            # batch 가 다 차거나 가장 오래된 윈도우가 max_delay 만큼 기다렸으면 추론
+            wait = self.max_delay - (time.monotonic() - self._pending[0][2])
+            if len(self._pending) < self.batch_size and wait > 0:
+                self._ready.clear()
+                try:
+                    await asyncio.wait_for(self._ready.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            try:
+                await self._run_batch(batch)
+            except Exception as e:
+                logger.error("[INFERENCE ERROR] %s", e)
+
+
+    async def _run_batch(self, batch):
+        x = np.empty((len(batch), 1, len(self.pids), self.window_size), dtype=np.float32)
+        for i, (_, _, _, window) in enumerate(batch):
+            x[i, 0] = window
+        if self.mean is not None:
+            x -= self.mean
+        if self.std is not None:
+            x /= self.std
+
+        started = time.monotonic()
+        logits = await asyncio.to_thread(self.model, x)
+        done = time.monotonic()
+        INFERENCE_BATCH_SECONDS.observe(done - started)
+
+        # softmax
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        indices = probs.argmax(axis=1)
+
+        for (device_id, timestamp, completed, _), index, prob in zip(batch, indices, probs):
+            label = self.classes[index] if self.classes else int(index)
+            self.publish(device_id, timestamp, label, round(float(prob[index]), 4))
+            INFERENCE_LATENCY.observe(done - completed)
+            INFERENCE_WINDOWS.inc(device=device_id)
+            self._latencies.append(done - completed)
+        self.windows_classified += len(batch)
+        if self._first_batch is None:
+            self._first_batch = done
+
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(coro) for coro in (self._consume(), self._sample(), self._infer())]
+
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+    def collect_metrics(self):
+        INFERENCE_QUEUE.set(len(self._pending))
+
+
+    def report(self):
+        # 첫 윈도우가 채워지기 전 구간은 빼고 계산
+        elapsed = time.monotonic() - self._first_batch if self._first_batch else 0.0
+        latencies = list(self._latencies)
+        return {
+            "devices": len(self._devices),
+            "windows": self.windows_classified,
+            "windows_per_s": round(self.windows_classified / elapsed, 2) if elapsed else 0.0,
+            "dropped": self.windows_dropped,
+            "incomplete": self.windows_incomplete,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+                "p95": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+            },
+        }
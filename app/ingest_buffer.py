@@ -0,0 +1,170 @@
+"""
+write-behind 방식의 수집 버퍼
+센서 데이터를 메모리에 모아두었다가 크기(flush_size) 또는 시간(flush_interval) 조건을 만족하면
+한 번의 트랜잭션에서 multi-row INSERT 로 DB에 반영한다.
+spool 이 주어지면 DB 대신 로컬 spool 에 기록하고, DB 반영은 SpoolDrainer 가 담당한다.
+DB 장애 등으로 버퍼가 가득 차면 PID 별 정책에 따라 빠르게 변하는 값은 (기기, PID) 별 최신 값만 남기고(COALESCE),
+주행 거리처럼 드물게 요청하는 값은 버리지 않는다(KEEP).
+"""
+import asyncio
+from collections import deque
+
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database import AsyncSessionLocal, settings
+from app.logger import get_logger
+from app.metrics import DB_FLUSH_LATENCY, DB_ROWS_WRITTEN
+from app.models import Reading
+from app.scheduler import DEFAULT_POLL_RATES
+
+logger = get_logger("ingest")
+
+COALESCE = "coalesce"
+KEEP = "keep"
+
+
+def default_overflow_policies(poll_rates=None):
+    """1Hz 이상으로 요청하는 PID 는 COALESCE, 그보다 드문 PID 는 KEEP"""
+    poll_rates = poll_rates or DEFAULT_POLL_RATES
+    return {pid: COALESCE if hz >= 1.0 else KEEP for pid, (hz, _) in poll_rates.items()}
+
+
+class IngestBuffer:
+    def __init__(self, flush_size=None, flush_interval=None, max_buffer=None, model=Reading, spool=None,
+                 overflow_policies=None):
+        self.flush_size = flush_size or settings.INGEST_FLUSH_SIZE
+        self.flush_interval = flush_interval or settings.INGEST_FLUSH_INTERVAL
+        self.max_buffer = max_buffer or settings.INGEST_MAX_BUFFER
+        self.model = model
+        self.spool = spool
+        # PID -> COALESCE | KEEP, 없는 PID 는 COALESCE
+        self.overflow_policies = overflow_policies if overflow_policies is not None else default_overflow_policies()
+
+        self._rows = deque() # COALESCE 대상
+        self._kept = deque() # KEEP 대상, max_buffer 는 넘지 않음
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_coalesced = 0 # 같은 (기기, PID) 의 더 최신 값으로 대체된 행 수
+
+
+    def __len__(self):
+        return len(self._rows) + len(self._kept)
+
+
+    # 이벤트 루프를 막지 않도록 동기 함수로 버퍼에만 추가
+    def add(self, **row):
+        if self.overflow_policies.get(row["pid"], COALESCE) == KEEP:
+            if len(self._kept) >= self.max_buffer:
+                self._kept.popleft()
+                self._dropped(1)
+            self._kept.append(row)
+        else:
+            self._rows.append(row)
+            if len(self._rows) > self.max_buffer:
+                self._coalesce()
+
+        if len(self) >= self.flush_size:
+            self._flush_requested.set()
+
+
+    def _coalesce(self):
+        """
+        버퍼가 가득 차면 (기기, PID) 별 최신 값만 남겨서 메모리 사용량 상한 유지
+        그래도 절반 넘게 남으면 가장 오래된 행을 버려서 다음 정리까지 add() 가 다시 O(n) 이 되지 않게 함
+        """
+        latest = {}
+        for row in self._rows:
+            latest[(row["device_id"], row["pid"])] = row
+        self.rows_coalesced += len(self._rows) - len(latest)
+        self._rows = deque(sorted(latest.values(), key=lambda row: row["timestamp"]))
+        excess = len(self._rows) - self.max_buffer // 2
+        for _ in range(max(excess, 0)):
+            self._rows.popleft()
+        self._dropped(max(excess, 0))
+
+
+    def _dropped(self, count):
+        if not count:
+            return
+        before = self.rows_dropped
+        self.rows_dropped += count
+        if before // self.flush_size != self.rows_dropped // self.flush_size or before == 0:
+            logger.warning("[BUFFER FULL] dropped rows: %d", self.rows_dropped)
+
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._rows and not self._kept:
+                return 0
+
+            # 리스트를 통째로 교체해서 flush 도중 들어오는 데이터는 다음 배치로 넘어감
+            rows, kept = list(self._rows), list(self._kept)
+            self._rows, self._kept = deque(), deque()
+
+            try:
+                await self._write(rows + kept)
+            except Exception as e:
+                logger.error("[FLUSH ERROR] %s", e)
+                # 실패한 배치는 다시 앞쪽에 넣어 다음 flush 때 재시도, 넘치면 정책대로 정리
+                self._rows.extendleft(reversed(rows))
+                self._kept.extendleft(reversed(kept))
+                if len(self._rows) > self.max_buffer:
+                    self._coalesce()
+                excess = len(self._kept) - self.max_buffer
+                for _ in range(max(excess, 0)):
+                    self._kept.popleft()
+                self._dropped(max(excess, 0))
+                return 0
+
+            self.rows_written += len(rows) + len(kept)
+            return len(rows) + len(kept)
+
+
+    async def _write(self, rows):
+        target = "spool" if self.spool is not None else "db"
+        with DB_FLUSH_LATENCY.labels(target=target).time():
+            if self.spool is not None:
+                # sqlite 쓰기는 동기 I/O 라서 이벤트 루프 밖에서 실행
+                await asyncio.to_thread(self.spool.append, rows)
+            else:
+                async with AsyncSessionLocal() as session:
+                    try:
+                        # 이미 저장된 (기기, PID, 시각) 은 무시해서 한 row 때문에 배치 전체가 계속 실패하지 않게 함
+                        await session.execute(insert(self.model).on_conflict_do_nothing(), rows)
+                        await session.commit()
+                    except Exception:
+                        await session.rollback()
+                        raise
+        DB_ROWS_WRITTEN.inc(len(rows), target=target)
+
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            # flush 전에 clear 해야 flush 도중 들어온 set() 을 놓치지 않음
+            self._flush_requested.clear()
+            await self.flush()
+
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+
+    # 종료 시 남아있는 데이터를 모두 반영
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
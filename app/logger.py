@@ -0,0 +1,91 @@
+"""
+로깅 설정
+- 이벤트 루프에서는 LogRecord 를 queue 에 넣기만 하고, 포맷팅과 출력은 QueueListener 스레드에서 처리
+- 수집 경로처럼 자주 호출되는 로그(hot path)는 category 별로 초당 출력 개수를 제한
+- 레벨이 꺼져 있으면 logger.debug(...) 는 isEnabledFor 확인만 하고 끝나므로 비용이 거의 없음
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+from app.database import settings
+
+ROOT_LOGGER = "obdflow"
+
+_listener = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # 기본 QueueHandler 는 put 하기 전에 호출한 스레드에서 메시지를 포맷팅하므로
+    # 같은 프로세스 안의 queue 에서는 record 를 그대로 넘겨 listener 스레드에서 포맷팅
+    def prepare(self, record):
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """category(logger) 별로 interval 초 동안 최대 rate 개만 통과, 버려진 개수는 다음 로그에 붙임"""
+
+    def __init__(self, rate, interval=1.0):
+        super().__init__()
+        self.rate = rate
+        self.interval = interval
+        self._window_start = 0.0
+        self._count = 0
+        self._suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window_start >= self.interval:
+                self._window_start = now
+                self._count = 0
+            self._count += 1
+            if self._count > self.rate:
+                self._suppressed += 1
+                return False
+            if self._suppressed:
+                record.msg = f"{record.msg} (suppressed {self._suppressed} messages)"
+                self._suppressed = 0
+        return True
+
+
+def get_logger(name, hot=False):
+    """
+    obdflow.<name> logger 반환
+    hot=True 이면 LOG_HOT_PATH_RATE 로 출력 개수를 제한 (ex. notify 마다, 응답마다 남기는 로그)
+    """
+    logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+    if hot and not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+        logger.addFilter(RateLimitFilter(settings.LOG_HOT_PATH_RATE))
+    return logger
+
+
+def setup_logging(level=None):
+    """obdflow logger 에 queue handler 를 연결하고 출력 스레드 시작 (여러 번 호출해도 한 번만 설정)"""
+    global _listener
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level or settings.LOG_LEVEL)
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """queue 에 남은 로그를 모두 출력하고 스레드 종료"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
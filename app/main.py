@@ -1,28 +1,244 @@
-import asyncio
-import os
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Literal
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app import sensor_reader
-from app.database import Base, async_engine
+from app.database import Base, async_engine, get_db, settings
+from app.export import FORMATS, ROW_GROUP_ROWS, check_options, stream_export
+from app.fleet import FleetSupervisor, configured_devices
+from app.ingest_buffer import IngestBuffer
+from app.logger import setup_logging, shutdown_logging
+from app.metrics import SPOOL_PENDING, STAGE_COALESCED, STAGE_DEPTH, TELEMETRY_SUBSCRIBERS, default_registry
+from app.pid_decoder import parse_pid
+from app.queries import fetch_series, fetch_trips
+from app.schemas import ReadingSeries, TripSummary
+from app.spool import Spool, SpoolDrainer
+from app.storage import StorageMaintenance
+from app.telemetry import telemetry_hub
 
 
-app = FastAPI()
+# /metrics 요청 시 단계별 대기열 gauge 갱신
+def collect_telemetry_metrics():
+    TELEMETRY_SUBSCRIBERS.set(telemetry_hub.subscriber_count)
+    STAGE_DEPTH.set(telemetry_hub.pending, stage="fanout")
+    STAGE_COALESCED.set(telemetry_hub.coalesced, stage="fanout")
 
-@app.on_event("startup")
-async def startup_event():
-    async with async_engine.begin() as conn:
-        # models.py에서 정의한 테이블 생성
-        await conn.run_sync(Base.metadata.create_all)
 
-        sensor_reader_instance = sensor_reader.SensorReader(os.getenv("BLE_ADDRESS"))
+def collect_spool_metrics(spool):
+    pending = spool.pending_rows
+    SPOOL_PENDING.set(pending)
+    STAGE_DEPTH.set(pending, stage="spool")
 
-        # create_task()로 비동기 함수를 백그라운드에서 실행, app이 종료될 때까지 유지
+
+# 앱 시작 시 테이블을 만들고 센서 수집은 백그라운드 서비스로 실행
+# 종료 시 notify 해제, 남은 데이터 flush, 연결 종료 순으로 정리
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 로그 출력은 별도 스레드에서 처리해서 이벤트 루프를 막지 않음
+    setup_logging()
+
+    # shm 모드: 수집과 DB 저장은 python -m app.acquisition 프로세스가 담당하고
+    # API 워커는 shared memory ring 의 값을 자신의 telemetry hub 로 전달만 함 (uvicorn --workers N 가능)
+    storage = spool = drainer = None
+    if settings.ACQUISITION_MODE == "shm":
+        from app.acquisition import RingFollower
+
+        fleet = RingFollower(telemetry_hub.publish, classify=telemetry_hub.publish_classification)
+        fleet.start()
+    else:
+        async with async_engine.begin() as conn:
+            # models.py에서 정의한 테이블 생성
+            await conn.run_sync(Base.metadata.create_all)
+
+        # 일 단위 파티션 생성, 이후 rollup 갱신과 보관 기간 관리는 백그라운드에서 실행
+        storage = StorageMaintenance()
+        await storage.prepare()
+        storage.start()
+
+        # 수집 데이터는 로컬 spool 에 먼저 기록하고 drainer 가 Postgres 로 옮김
+        if settings.SPOOL_ENABLED:
+            spool = Spool()
+            drainer = SpoolDrainer(spool)
+            drainer.start()
+
+        # FLEET_DEVICES(없으면 BLE_ADDRESS)의 모든 기기를 하나의 supervisor 로 관리
+        # 연결이 끊기면 supervisor 가 지수 backoff 후 재연결하므로 프로세스를 재시작할 필요 없음
+        fleet = FleetSupervisor(configured_devices(), ingest_buffer=IngestBuffer(spool=spool))
+        fleet.start()
+    app.state.fleet = fleet
+
+    # /metrics 요청 시 큐 깊이 등 gauge 갱신
+    default_registry.on_collect(fleet.collect_metrics)
+    default_registry.on_collect(collect_telemetry_metrics)
+    if spool is not None:
+        default_registry.on_collect(lambda: collect_spool_metrics(spool))
+
+    # 모델 파일이 설정되어 있으면 실시간 값으로 윈도우를 만들어 분류하고 telemetry 로 발행
+    # shm 모드에서는 acquire 프로세스가 한 번만 추론하고 결과는 ring 으로 전달됨 (워커마다 같은 윈도우를 추론하지 않음)
+    inference = None
+    if settings.INFERENCE_MODEL_PATH and settings.ACQUISITION_MODE != "shm":
+        from app.inference import InferenceService, load_model
+
+        inference = InferenceService(load_model(settings.INFERENCE_MODEL_PATH))
+        inference.start()
+        default_registry.on_collect(inference.collect_metrics)
+
+    try:
+        yield
+    finally:
+        if inference is not None:
+            await inference.stop()
+        await fleet.stop()
+        if drainer is not None:
+            await drainer.stop()
+            spool.close()
+        if storage is not None:
+            await storage.stop()
+        await async_engine.dispose()
+        shutdown_logging()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+# 기기별 수집 상태 (연결 여부, 재연결 횟수, 달성 주기 등)
+@app.get("/devices")
+async def devices_status():
+    return app.state.fleet.report()
+
+
+# Prometheus 형식 metrics (PID 별 지연 시간 histogram, 시간 초과, 달성 주기, 버퍼 깊이, DB flush 시간 등)
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(default_registry.render(), media_type="text/plain; version=0.0.4")
+
+
+# '010C' -> 0x010C, 16진수가 아니거나 readings.pid(smallint) 범위 밖이면 400
+def _parse_pid(pid):
+    try:
+        value = parse_pid(pid)
+    except ValueError:
+        value = -1
+    if not 0 <= value <= 0x7FFF:
+        raise HTTPException(status_code=400, detail=f"invalid pid: {pid}")
+    return value
+
+
+# '010C,0105' -> {0x010C, 0x0105}, 잘못된 PID 가 있으면 400
+def _parse_pids(pids):
+    if not pids:
+        return None
+    return {_parse_pid(pid.strip()) for pid in pids.split(",") if pid.strip()}
+
+
+# 실시간 센서 값 WebSocket
+# 연결 직후 ring buffer 의 최근 값(history 개, 0 이면 보내지 않음)을 보내고 이후 새 값이 들어올 때마다 묶어서 전송
+# pids 가 잘못되었으면 1008(policy violation) 으로 닫음
+@app.websocket("/ws/telemetry")
+async def telemetry_websocket(websocket: WebSocket, device_id: str | None = None, pids: str | None = None, history: int = Query(1, ge=0, le=settings.TELEMETRY_HISTORY)):
+    await websocket.accept()
+    try:
+        pid_filter = _parse_pids(pids)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        return
+    subscriber = telemetry_hub.subscribe(device_id, pid_filter)
+    try:
+        await websocket.send_json({"samples": telemetry_hub.snapshot(device_id, pid_filter, history)})
+        while True:
+            await websocket.send_json({"samples": await subscriber.next_batch()})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        telemetry_hub.unsubscribe(subscriber)
+
+
+# 실시간 센서 값 Server-Sent Events
+@app.get("/telemetry/stream")
+async def telemetry_stream(request: Request, device_id: str | None = None, pids: str | None = None, history: int = Query(1, ge=0, le=settings.TELEMETRY_HISTORY)):
+    pid_filter = _parse_pids(pids)
+    subscriber = telemetry_hub.subscribe(device_id, pid_filter)
+
+    async def events():
         try:
-            await asyncio.create_task(sensor_reader_instance.reading_data())
-        except asyncio.CancelledError:
-            print("[ERROR] Sensor Reader Cancelled")
+            yield f"data: {json.dumps({'samples': telemetry_hub.snapshot(device_id, pid_filter, history)})}\n\n"
+            while not await request.is_disconnected():
+                yield f"data: {json.dumps({'samples': await subscriber.next_batch()})}\n\n"
+        finally:
+            telemetry_hub.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ring buffer 에 있는 최근 값 (DB 조회 없음)
+@app.get("/telemetry/latest")
+async def telemetry_latest(device_id: str | None = None, pids: str | None = None, history: int = Query(1, ge=0, le=settings.TELEMETRY_HISTORY)):
+    return {"samples": telemetry_hub.snapshot(device_id, _parse_pids(pids), history)}
+
+
+# 기기/PID 의 기간별 값, 서버에서 points 개 이하로 downsampling
+# mode: bucket(고정 구간 평균/최소/최대), lttb(모양 유지), raw(원본, 앞에서부터 points 개)
+@app.get("/devices/{device_id}/readings/{pid}", response_model=ReadingSeries)
+async def read_readings(
+    device_id: str,
+    pid: str,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    points: int = Query(500, ge=3, le=10000),
+    mode: Literal["bucket", "lttb", "raw"] = "bucket",
+    db: AsyncSession = Depends(get_db),
+):
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(hours=1)
+    return await fetch_series(db, device_id, _parse_pid(pid), start, end, points, mode)
+
+
+# 주행별 요약 (수집하면서 갱신한 집계, 진행 중인 trip 은 ended_at 이 없음)
+# summary=false 이면 PID 별 집계 JSON 없이 목록만
+@app.get("/trips", response_model=list[TripSummary])
+async def list_trips(
+    device_id: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    limit: int = Query(100, ge=1, le=10000),
+    summary: bool = True,
+    db: AsyncSession = Depends(get_db),
+):
+    return await fetch_trips(db, device_id, start, end, limit, summary)
+
+
+# 기간 내 readings 를 PID 별 열로 펼친 Parquet / Arrow IPC 파일로 전송 (row group 단위로 만들면서 바로 전송)
+# device_id 를 여러 번 지정 가능, 없으면 기간 안의 모든 기기
+@app.get("/export")
+async def export_readings(
+    start: datetime,
+    end: datetime,
+    device_id: list[str] = Query(default=[]),
+    pids: str | None = None,
+    format: Literal["parquet", "arrow"] = "parquet",
+    compression: str | None = None,
+    row_group_rows: int = Query(ROW_GROUP_ROWS, ge=1024, le=1 << 20),
+):
+    # 응답을 보내기 시작한 뒤에는 오류를 알릴 수 없으므로 옵션을 모두 먼저 확인
+    try:
+        check_options(format, compression)
+        pid_filter = _parse_pids(pids)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type, suffix = FORMATS[format]
+    filename = f"readings_{start:%Y%m%dT%H%M%S}_{end:%Y%m%dT%H%M%S}{suffix}"
+    return StreamingResponse(
+        stream_export(device_id, start, end, sorted(pid_filter) if pid_filter else None, format, compression, row_group_rows),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 # @app.post("uuids/", response_model=UUIDSchema, status_code=status.HTTP_201_CREATED)
@@ -36,5 +252,7 @@ async def startup_event():
 
 def __main__():
     uvicorn.run(app, host="0.0.0.0", port=8000)
-    if __name__ == "__main__":
-        startup_event()
\ No newline at end of file
+
+
+if __name__ == "__main__":
+    __main__()
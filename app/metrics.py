@@ -0,0 +1,199 @@
+"""
+Prometheus 텍스트 형식 metrics
+외부 라이브러리 없이 counter / gauge / histogram 만 구현하고 /metrics 에서 registry.render() 결과를 반환한다.
+수집 경로에서는 labels() 로 얻은 child 를 캐시해두고 inc() / observe() 만 호출한다.
+"""
+import bisect
+import time
+
+from app.logger import get_logger
+
+logger = get_logger("metrics")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        (registry or default_registry).register(self)
+
+    def labels(self, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in list(self._children.items()):
+            lines.extend(child.render(self.name, key))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def render(self, name, key):
+        return [f"{name}{_format_labels(key)} {self.value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0, **labels):
+        self.labels(**labels).inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value, **labels):
+        self.labels(**labels).set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def render(self, name, key):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(key, {'le': bound})} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(key, {'le': '+Inf'})} {self.count}")
+        lines.append(f"{name}_sum{_format_labels(key)} {self.sum}")
+        lines.append(f"{name}_count{_format_labels(key)} {self.count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value, **labels):
+        self.labels(**labels).observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def on_collect(self, callback):
+        """scrape 시점에 gauge 값을 갱신하는 함수 등록 (큐 깊이, 달성 주기 등)"""
+        self._collectors.append(callback)
+
+    def render(self):
+        for callback in self._collectors:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("[METRICS COLLECT ERROR] %s", e)
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+default_registry = Registry()
+
+
+# --- 수집 경로 ---
+REQUEST_LATENCY = Histogram("obd_request_latency_seconds", "ELM327 request round trip per PID", ["device", "pid"])
+REQUEST_TIMEOUTS = Counter("obd_request_timeouts_total", "ELM327 requests that timed out or returned NO DATA", ["device", "pid"])
+SAMPLES = Counter("obd_samples_total", "Decoded samples", ["device", "pid"])
+ACHIEVED_RATE = Gauge("obd_achieved_rate_hz", "Achieved polling rate per PID", ["device", "pid"])
+REQUESTED_RATE = Gauge("obd_requested_rate_hz", "Requested polling rate per PID", ["device", "pid"])
+NOTIFY_BYTES = Counter("obd_notify_bytes_total", "Bytes received from BLE notify", ["device"])
+UNSOLICITED_REPLIES = Gauge("obd_unsolicited_replies", "Replies received with no command in flight", ["device"])
+RECONNECTS = Counter("obd_reconnects_total", "Reader reconnect attempts", ["device"])
+CONNECTED = Gauge("obd_connected", "1 if the BLE link is up", ["device"])
+
+# --- 저장 경로 ---
+INGEST_BUFFER_ROWS = Gauge("obd_ingest_buffer_rows", "Rows waiting in the write-behind buffer")
+INGEST_DROPPED = Gauge("obd_ingest_dropped_rows", "Rows dropped because the buffer was full")
+SPOOL_PENDING = Gauge("obd_spool_pending_rows", "Rows in the local spool not yet in Postgres")
+DB_FLUSH_LATENCY = Histogram("obd_db_flush_seconds", "Batch write latency", ["target"])
+DB_ROWS_WRITTEN = Counter("obd_db_rows_written_total", "Rows written per batch target", ["target"])
+TELEMETRY_SUBSCRIBERS = Gauge("obd_telemetry_subscribers", "Connected WebSocket/SSE subscribers")
+TRIPS_OPEN = Gauge("obd_trips_open", "Trips currently being aggregated")
+
+# --- 단계별 대기열 (receive: notify 조립 버퍼 bytes, fanout: 구독자 대기 샘플, persist: 쓰기 버퍼 행, spool: DB 미반영 행) ---
+STAGE_DEPTH = Gauge("obd_stage_depth", "Items waiting in an acquisition stage", ["stage"])
+STAGE_DROPPED = Gauge("obd_stage_dropped", "Items dropped by an acquisition stage", ["stage"])
+STAGE_COALESCED = Gauge("obd_stage_coalesced", "Items replaced by a newer value of the same device/PID", ["stage"])
+
+# --- 실시간 분류 ---
+INFERENCE_LATENCY = Histogram("obd_inference_latency_seconds", "Time from a full window to its classification")
+INFERENCE_BATCH_SECONDS = Histogram("obd_inference_batch_seconds", "Model run time per micro-batch")
+INFERENCE_WINDOWS = Counter("obd_inference_windows_total", "Classified windows", ["device"])
+INFERENCE_QUEUE = Gauge("obd_inference_queue_windows", "Windows waiting for inference")
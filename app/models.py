@@ -4,7 +4,7 @@ ORM(Object-Relation Mapper) 정의
 데이터베이스 테이블과 클래스를 매핑한다.
 """
 
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, BigInteger, String, SmallInteger, Float, DateTime, JSON, Index
 
 from app.database import Base
 
@@ -24,3 +24,74 @@ class RawData(Base):
     id=Column(Integer, primary_key=True)
     type=Column(String)
     value=Column(String)
+
+
+# 디코딩이 끝난 센서 값 (PID 당 한 row)
+# timestamp 기준 일 단위 파티션(readings_pYYYYMMDD), 파티션 생성/삭제는 app/storage.py 에서 관리
+class Reading(Base):
+    __tablename__ = "readings"
+    __table_args__ = (
+        # 기기와 상관없이 시간 범위로 읽는 rollup 갱신용, 시간 순으로 쌓이므로 작은 BRIN 으로 충분
+        Index("ix_readings_timestamp_brin", "timestamp", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+    device_id=Column(String, primary_key=True)
+    pid=Column(SmallInteger, primary_key=True) # 0x010C 와 같은 mode+PID 코드
+    timestamp=Column(DateTime(timezone=True), primary_key=True)
+    value=Column(Float(precision=24), nullable=False) # real (4 bytes)
+
+
+# 1초 / 1분 단위 집계 (평균은 sum / count)
+class ReadingRollup1s(Base):
+    __tablename__ = "readings_1s"
+    __table_args__ = {"postgresql_partition_by": "RANGE (bucket)"}
+    device_id=Column(String, primary_key=True)
+    pid=Column(SmallInteger, primary_key=True)
+    bucket=Column(DateTime(timezone=True), primary_key=True)
+    count=Column(Integer, nullable=False)
+    sum=Column(Float, nullable=False)
+    min=Column(Float(precision=24), nullable=False)
+    max=Column(Float(precision=24), nullable=False)
+
+
+class ReadingRollup1m(Base):
+    __tablename__ = "readings_1m"
+    device_id=Column(String, primary_key=True)
+    pid=Column(SmallInteger, primary_key=True)
+    bucket=Column(DateTime(timezone=True), primary_key=True)
+    count=Column(BigInteger, nullable=False)
+    sum=Column(Float, nullable=False)
+    min=Column(Float(precision=24), nullable=False)
+    max=Column(Float(precision=24), nullable=False)
+
+
+# 주행(연결 ~ 연결 종료 또는 idle) 단위 집계, 수집하면서 app/trips.py 가 갱신
+# summary: PID('010C') 별 count/mean/min/max, 시간 가중 평균/적분, histogram
+class Trip(Base):
+    __tablename__ = "trips"
+    __table_args__ = (
+        Index("ix_trips_device_started", "device_id", "started_at"),
+        Index("ix_trips_started", "started_at"),
+    )
+    id=Column(BigInteger, primary_key=True, autoincrement=True)
+    device_id=Column(String, nullable=False)
+    started_at=Column(DateTime(timezone=True), nullable=False)
+    ended_at=Column(DateTime(timezone=True)) # 진행 중이면 NULL
+    end_reason=Column(String) # disconnect / idle
+    samples=Column(Integer, nullable=False)
+    duration=Column(Float) # 첫 값 ~ 마지막 값(초)
+    fuel_used=Column(Float) # 015E(연료 소비율, L/h) 적분(L)
+    summary=Column(JSON, nullable=False)
+    updated_at=Column(DateTime(timezone=True))
+
+
+# 재연결 시 탐색을 생략하기 위한 기기별 프로필
+class DeviceProfile(Base):
+    __tablename__ = "device_profiles"
+    device_id=Column(String, primary_key=True)
+    notify_uuid=Column(String)
+    write_uuid=Column(String)
+    write_properties=Column(String) # ex) 'write,write-without-response'
+    protocol=Column(String) # ATDPN 으로 확인한 OBD 프로토콜 번호 ex) '6'
+    init_results=Column(JSON) # AT 명령별 응답
+    updated_at=Column(DateTime(timezone=True))
@@ -0,0 +1,101 @@
+"""
+ELM327 mode 01 응답 디코더
+bytearray(b'41 0C 11 30 \r') 와 같은 응답을 (PID, 값) 형태의 숫자로 변환한다.
+PID 는 요청할 때 사용하는 4자리 코드(0x010C 등)를 그대로 정수로 사용한다.
+"""
+from typing import NamedTuple, Callable
+
+
+class PidSpec(NamedTuple):
+    name: str
+    unit: str
+    length: int # 응답 데이터 바이트 수 (A, B, ...)
+    formula: Callable[..., float]
+
+
+# mode 01 PID 별 (이름, 단위, 데이터 길이, 변환 공식)
+PIDS = {
+    0x0104: PidSpec("engine_load", "%", 1, lambda a: a * 100 / 255),
+    0x0105: PidSpec("coolant_temp", "°C", 1, lambda a: a - 40),
+    0x0106: PidSpec("short_term_fuel_trim", "%", 1, lambda a: a * 100 / 128 - 100),
+    0x0107: PidSpec("long_term_fuel_trim", "%", 1, lambda a: a * 100 / 128 - 100),
+    0x010B: PidSpec("intake_map", "kPa", 1, lambda a: a),
+    0x010C: PidSpec("engine_rpm", "rpm", 2, lambda a, b: (a * 256 + b) / 4),
+    0x010D: PidSpec("vehicle_speed", "km/h", 1, lambda a: a),
+    0x0110: PidSpec("maf_rate", "g/s", 2, lambda a, b: (a * 256 + b) / 100),
+    0x0121: PidSpec("distance_with_mil", "km", 2, lambda a, b: a * 256 + b),
+    0x0122: PidSpec("fuel_rail_pressure", "kPa", 2, lambda a, b: (a * 256 + b) * 0.079),
+    0x0130: PidSpec("warmups_since_clear", "count", 1, lambda a: a),
+    0x0131: PidSpec("distance_since_clear", "km", 2, lambda a, b: a * 256 + b),
+    0x0142: PidSpec("control_module_voltage", "V", 2, lambda a, b: (a * 256 + b) / 1000),
+    0x015E: PidSpec("engine_fuel_rate", "L/h", 2, lambda a, b: (a * 256 + b) / 20),
+    0x0161: PidSpec("demand_torque", "%", 1, lambda a: a - 125),
+    0x0162: PidSpec("actual_torque", "%", 1, lambda a: a - 125),
+}
+
+# 기본 폴링 대상 PID
+ECU_PIDS = [
+    0x0105, 0x0106, 0x0122, 0x015E, 0x0104, 0x010C, 0x0161,
+    0x0142, 0x0121, 0x0130, 0x0131, 0x010B, 0x0110,
+]
+
+
+def pid_command(pid):
+    return f"{pid:04X}\r".encode()
+
+
+def parse_pid(pid):
+    """'010C', '0x010C', 268 모두 같은 PID 정수로 변환"""
+    if isinstance(pid, int):
+        return pid
+    return int(pid, 16)
+
+
+def _hex_bytes(line):
+    try:
+        return bytes.fromhex(line)
+    except ValueError:
+        return None
+
+
+def decode_line(line):
+    """
+    응답 한 줄을 디코딩한다.
+    헤더가 꺼진(ATH0) 상태에서 '41 0C 11 30' 또는 '410C1130 0D20'(여러 PID) 형태를 처리
+    """
+    data = _hex_bytes(line.replace(" ", ""))
+    if not data or data[0] < 0x41 or data[0] > 0x4F:
+        return []
+
+    mode = data[0] - 0x40
+    results = []
+    i = 1
+    while i < len(data):
+        pid = (mode << 8) | data[i]
+        spec = PIDS.get(pid)
+        if spec is None or i + 1 + spec.length > len(data):
+            # 모르는 PID 이후의 데이터 길이는 알 수 없으므로 중단
+            break
+        results.append((pid, float(spec.formula(*data[i + 1:i + 1 + spec.length]))))
+        i += 1 + spec.length
+    return results
+
+
+def decode_lines(lines):
+    """FrameAssembler 가 조립한 응답 줄 목록을 디코딩해서 [(pid, value), ...] 반환"""
+    results = []
+    for line in lines:
+        results.extend(decode_line(line))
+    return results
+
+
+def decode_response(raw):
+    """
+    ELM327 응답 전체(bytes 또는 str)를 디코딩해서 [(pid, value), ...] 반환
+    SEARCHING..., NO DATA, OK, ? 등 데이터가 아닌 줄은 무시한다.
+    """
+    if isinstance(raw, (bytes, bytearray)):
+        raw = raw.decode("ascii", errors="ignore")
+
+    lines = raw.replace(">", "\r").replace("\n", "\r").split("\r")
+    return decode_lines(line.strip() for line in lines if line.strip())
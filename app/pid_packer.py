@@ -0,0 +1,122 @@
+"""
+여러 mode 01 PID 를 하나의 요청으로 묶어서 전송
+ELM327 은 한 요청에 최대 6개의 PID 를 받을 수 있다. ex) b'010C0D0510\r'
+묶음 요청을 지원하지 않는 어댑터에서는 PID 하나씩 요청하는 방식으로 되돌아간다.
+"""
+import asyncio
+import re
+import time
+
+from app.logger import get_logger
+from app.pid_decoder import decode_line, decode_lines, pid_command
+
+logger = get_logger("packer")
+
+MAX_PIDS_PER_REQUEST = 6
+
+# CAN 멀티 프레임 응답의 프레임 줄 ex) '0: 41 0C 11 30 0D 20'
+_FRAME_LINE = re.compile(r"^([0-9A-F]):\s*(.*)$", re.IGNORECASE)
+
+
+def pack_pids(pids, max_per_request=MAX_PIDS_PER_REQUEST):
+    """같은 mode 의 PID 끼리 max_per_request 개씩 묶은 그룹 목록 반환"""
+    by_mode = {}
+    for pid in pids:
+        by_mode.setdefault(pid >> 8, []).append(pid)
+
+    groups = []
+    for mode_pids in by_mode.values():
+        for i in range(0, len(mode_pids), max_per_request):
+            groups.append(mode_pids[i:i + max_per_request])
+    return groups
+
+
+def packed_command(pids):
+    """[0x010C, 0x010D] -> b'010C0D\r'"""
+    if len(pids) == 1:
+        return pid_command(pids[0])
+    mode = pids[0] >> 8
+    return (f"{mode:02X}" + "".join(f"{pid & 0xFF:02X}" for pid in pids) + "\r").encode()
+
+
+def split_packed_reply(lines):
+    """
+    묶음 요청의 응답을 PID 별 값으로 분리
+    한 줄 응답('41 0C 11 30 0D 20')과 CAN 멀티 프레임 응답('00A', '0: 41 0C ...', '1: ...') 모두 처리
+    """
+    size = None
+    frames = []
+    others = []
+    for line in lines:
+        match = _FRAME_LINE.match(line)
+        if match:
+            frames.append((int(match.group(1), 16), match.group(2).replace(" ", "")))
+        elif frames == [] and len(line) == 3:
+            # 첫 프레임 앞의 전체 바이트 수 ex) '00A'
+            try:
+                size = int(line, 16)
+            except ValueError:
+                others.append(line)
+        else:
+            others.append(line)
+
+    results = decode_lines(others)
+    if frames:
+        # 프레임 번호(0~F 순환) 순서대로 이어붙이고 padding 은 바이트 수 기준으로 제거
+        payload = "".join(data for _, data in frames)
+        if size is not None:
+            payload = payload[:size * 2]
+        results.extend(decode_line(payload))
+    return results
+
+
+class PidRequester:
+    def __init__(self, channel, max_per_request=MAX_PIDS_PER_REQUEST):
+        self.channel = channel
+        self.max_per_request = max_per_request
+        # None: 아직 모름, True: 묶음 요청 가능, False: 단일 PID 요청만 사용
+        self.packed_supported = None
+        # 마지막 request() 에서 단일 PID 요청이 시간 초과된 PID (나머지 PID 의 값은 정상 반환)
+        self.timed_out = []
+        # 마지막 request() 에서 단일 PID 요청으로 응답받은 PID 별 왕복 시간(초), 묶음 요청으로 받았으면 비어 있음
+        self.latencies = {}
+
+
+    def groups(self, pids):
+        if self.packed_supported is False:
+            return [[pid] for pid in pids]
+        return pack_pids(pids, self.max_per_request)
+
+
+    async def request(self, pids, timeout=5.0):
+        """
+        PID 그룹을 요청하고 [(pid, value), ...] 반환
+        단일 PID 요청으로 되돌아갔을 때 일부만 시간 초과되면 timed_out 에 기록하고, 모두 시간 초과되면 TimeoutError
+        """
+        self.timed_out = []
+        self.latencies = {}
+        if len(pids) > 1 and self.packed_supported is not False:
+            lines = await self.channel.send(packed_command(pids), timeout=timeout)
+            results = split_packed_reply(lines)
+            if results or self.packed_supported:
+                self.packed_supported = True
+                return results
+
+        # 묶음 요청이 거부된 경우('?', NO DATA 등) 하나씩 요청
+        results = []
+        for pid in pids:
+            sent = time.monotonic()
+            try:
+                lines = await self.channel.send(pid_command(pid), timeout=timeout)
+                self.latencies[pid] = time.monotonic() - sent
+                results.extend(split_packed_reply(lines))
+            except asyncio.TimeoutError:
+                self.timed_out.append(pid)
+        if len(self.timed_out) == len(pids):
+            raise asyncio.TimeoutError
+
+        if len(pids) > 1 and results and self.packed_supported is None:
+            # 단일 요청은 응답하는데 묶음 요청은 응답하지 않음 -> 묶음 요청 미지원 어댑터
+            self.packed_supported = False
+            logger.info("[PACKED REQUEST UNSUPPORTED] fallback to single PID requests")
+        return results
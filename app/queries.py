@@ -0,0 +1,152 @@
+"""
+저장된 센서 값 조회
+기간이 길어도 응답 크기가 points 개를 넘지 않도록 서버에서 downsampling 한다.
+readings 의 기본키 (device_id, pid, timestamp) 인덱스로 기기/PID/기간 범위를 바로 찾고,
+bucket 이 1초 / 1분 이상이면 원본 대신 rollup 테이블(readings_1s / readings_1m)을 집계한다.
+"""
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from sqlalchemy import Float, cast, func, select
+
+from app.downsample import lttb
+from app.models import Reading, ReadingRollup1m, ReadingRollup1s, Trip
+
+
+def _range_filter(device_id, pid, start, end):
+    return (
+        Reading.device_id == device_id,
+        Reading.pid == pid,
+        Reading.timestamp >= start,
+        Reading.timestamp < end,
+    )
+
+
+async def fetch_raw(session, device_id, pid, start, end, limit=None):
+    query = (
+        select(Reading.timestamp, Reading.value)
+        .where(*_range_filter(device_id, pid, start, end))
+        .order_by(Reading.timestamp)
+        .limit(limit)
+    )
+    result = await session.stream(query)
+    return [{"timestamp": ts, "value": value} async for ts, value in result]
+
+
+def _rollup_source(bucket_seconds):
+    if bucket_seconds >= 60:
+        return ReadingRollup1m
+    if bucket_seconds >= 1:
+        return ReadingRollup1s
+    return None
+
+
+async def fetch_buckets(session, device_id, pid, start, end, bucket_seconds):
+    """고정 크기 bucket 별 평균/최소/최대/개수 (DB 에서 집계)"""
+    rollup = _rollup_source(bucket_seconds)
+    if rollup is None:
+        bucket = func.floor(func.extract("epoch", Reading.timestamp) / bucket_seconds).label("bucket")
+        query = (
+            select(
+                func.min(Reading.timestamp),
+                func.avg(Reading.value),
+                func.min(Reading.value),
+                func.max(Reading.value),
+                func.count(),
+            )
+            .where(*_range_filter(device_id, pid, start, end))
+        )
+    else:
+        # rollup 의 (sum, count) 로 평균을 다시 계산
+        bucket = func.floor(func.extract("epoch", rollup.bucket) / bucket_seconds).label("bucket")
+        query = (
+            select(
+                func.min(rollup.bucket),
+                func.sum(rollup.sum) / func.sum(rollup.count),
+                func.min(rollup.min),
+                func.max(rollup.max),
+                func.sum(rollup.count),
+            )
+            .where(
+                rollup.device_id == device_id,
+                rollup.pid == pid,
+                rollup.bucket >= start,
+                rollup.bucket < end,
+            )
+        )
+
+    result = await session.execute(query.group_by(bucket).order_by(bucket))
+    return [
+        {"timestamp": ts, "value": float(avg), "min": low, "max": high, "count": count}
+        for ts, avg, low, high, count in result
+    ]
+
+
+async def fetch_lttb(session, device_id, pid, start, end, points):
+    """원본 값을 가져와 LTTB 로 points 개만 남김"""
+    rows = await fetch_raw(session, device_id, pid, start, end)
+    sampled = lttb([(row["timestamp"].timestamp(), row["value"], row["timestamp"]) for row in rows], points)
+    return [{"timestamp": ts, "value": value} for _, value, ts in sampled]
+
+
+async def fetch_series(session, device_id, pid, start, end, points=500, mode="bucket"):
+    bucket_seconds = max((end - start).total_seconds() / points, 0.001)
+    if mode == "raw":
+        data = await fetch_raw(session, device_id, pid, start, end, limit=points)
+    elif mode == "lttb":
+        data = await fetch_lttb(session, device_id, pid, start, end, points)
+    else:
+        data = await fetch_buckets(session, device_id, pid, start, end, bucket_seconds)
+
+    return {
+        "device_id": device_id,
+        "pid": pid,
+        "mode": mode,
+        "start": start,
+        "end": end,
+        "bucket_seconds": bucket_seconds if mode == "bucket" else None,
+        "points": data,
+    }
+
+
+async def stream_device_readings(session, device_id, pids, start, end, fetch_size=50000):
+    """
+    기기 하나의 여러 PID 값을 시간순으로 (epoch 초, pid, value) numpy 배열 block 단위로 반환 (학습 데이터 export 용)
+    하루(파티션) 단위로 나눠서 정렬하고, server-side cursor 로 fetch_size 행씩 읽어서 전체를 메모리에 올리지 않음
+    """
+    day_start = start
+    while day_start < end:
+        day_end = min(datetime.combine(day_start.date() + timedelta(days=1), time.min, day_start.tzinfo), end)
+        query = (
+            select(cast(func.extract("epoch", Reading.timestamp), Float), Reading.pid, Reading.value)
+            .where(
+                Reading.device_id == device_id,
+                Reading.pid.in_(pids),
+                Reading.timestamp >= day_start,
+                Reading.timestamp < day_end,
+            )
+            .order_by(Reading.timestamp)
+            .execution_options(yield_per=fetch_size)
+        )
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            block = np.array(rows, dtype=np.float64)
+            yield block[:, 0], block[:, 1].astype(np.int64), block[:, 2]
+        day_start = day_end
+
+
+async def fetch_trips(session, device_id=None, start=None, end=None, limit=100, summary=True):
+    """시작 시각 기준 최근 trip 부터 (집계는 저장된 값을 그대로 사용, readings 를 읽지 않음)"""
+    columns = [Trip.id, Trip.device_id, Trip.started_at, Trip.ended_at, Trip.end_reason, Trip.samples,
+               Trip.duration, Trip.fuel_used]
+    if summary:
+        columns.append(Trip.summary)
+    query = select(*columns).order_by(Trip.started_at.desc()).limit(limit)
+    if device_id is not None:
+        query = query.where(Trip.device_id == device_id)
+    if start is not None:
+        query = query.where(Trip.started_at >= start)
+    if end is not None:
+        query = query.where(Trip.started_at < end)
+    result = await session.execute(query)
+    return [dict(row._mapping) for row in result]
@@ -0,0 +1,107 @@
+"""
+PID 별 목표 주기(Hz)에 맞춰 요청할 PID 를 고르는 폴링 스케줄러
+RPM 처럼 빠르게 변하는 값은 자주, 냉각수 온도나 주행 거리처럼 느리게 변하는 값은 드물게 요청한다.
+"""
+import time
+
+# PID: (목표 주기 Hz, 우선순위) - 우선순위는 숫자가 작을수록 높음
+DEFAULT_POLL_RATES = {
+    0x010C: (10.0, 0), # 엔진 RPM
+    0x0104: (5.0, 0), # 엔진 부하
+    0x0110: (5.0, 0), # 공기 유량
+    0x010B: (5.0, 1), # 흡기 매니폴드 절대압
+    0x0161: (5.0, 1), # 요구 토크
+    0x015E: (2.0, 1), # 엔진 연료 소비율
+    0x0122: (2.0, 1), # 연료 레일 압력
+    0x0106: (1.0, 2), # 단기 연료 트림
+    0x0142: (0.5, 2), # ECU 모듈 전압
+    0x0105: (0.2, 2), # 냉각수 온도
+    0x0121: (0.05, 3), # 엔진 경고등 점등 후 주행 거리
+    0x0130: (0.05, 3), # 워밍업 횟수
+    0x0131: (0.05, 3), # 고장 코드 초기화 이후 주행 거리
+}
+
+DEFAULT_RATE = (1.0, 2)
+
+# 달성 주기 계산 시 사용하는 지수 이동 평균 계수
+_EMA_ALPHA = 0.2
+
+
+class PidSchedule:
+    def __init__(self, pid, hz, priority, start):
+        self.pid = pid
+        self.hz = hz
+        self.period = 1.0 / hz
+        self.priority = priority
+        self.next_due = start
+
+        self.last_sample = None
+        self.interval_ema = None
+        self.samples = 0
+        self.missed = 0 # 한 주기 이상 늦게 요청된 횟수
+
+
+    @property
+    def achieved_hz(self):
+        if not self.interval_ema:
+            return 0.0
+        return 1.0 / self.interval_ema
+
+
+class PollScheduler:
+    def __init__(self, pids, poll_rates=None, start=None):
+        """start: 첫 요청 시점 (time.monotonic() 기준, 기본값은 현재)"""
+        rates = {**DEFAULT_POLL_RATES, **(poll_rates or {})}
+        start = time.monotonic() if start is None else start
+        self.schedules = {
+            pid: PidSchedule(pid, *rates.get(pid, DEFAULT_RATE), start) for pid in pids
+        }
+
+
+    def due(self, now, limit):
+        """
+        요청 시점이 지난 PID 를 최대 limit 개 반환
+        우선순위가 높은 PID 를 먼저 고르되, 주기 대비 많이 밀린 PID 일수록 순위를 올려
+        낮은 우선순위 PID 도 굶지 않도록 요청 예산을 나눈다.
+        """
+        due = [s for s in self.schedules.values() if s.next_due <= now]
+        due.sort(key=lambda s: s.priority - (now - s.next_due) / s.period)
+        return [s.pid for s in due[:limit]]
+
+
+    def time_until_next(self, now):
+        next_due = min(s.next_due for s in self.schedules.values())
+        return max(next_due - now, 0.0)
+
+
+    def completed(self, pid, started, now, success=True):
+        """started: 요청을 보낸 시점, now: 응답을 받은 시점"""
+        schedule = self.schedules[pid]
+        if started - schedule.next_due > schedule.period:
+            schedule.missed += 1
+        # 밀린 요청을 몰아서 보내지 않고 현재 시점 기준으로 다음 요청 시점을 잡음
+        schedule.next_due = max(schedule.next_due + schedule.period, now)
+
+        if not success:
+            return
+        if schedule.last_sample is not None:
+            interval = now - schedule.last_sample
+            if schedule.interval_ema is None:
+                schedule.interval_ema = interval
+            else:
+                schedule.interval_ema += _EMA_ALPHA * (interval - schedule.interval_ema)
+        schedule.last_sample = now
+        schedule.samples += 1
+
+
+    def report(self):
+        """PID 별 목표 주기와 실제 달성 주기"""
+        return {
+            pid: {
+                "requested_hz": s.hz,
+                "achieved_hz": round(s.achieved_hz, 3),
+                "samples": s.samples,
+                "missed": s.missed,
+            }
+            for pid, s in self.schedules.items()
+        }
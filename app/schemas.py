@@ -2,7 +2,8 @@
 """
 fastapi의 요청과 응답 데이터의 유효성을 검사하는 pydantic 모델 정의
 """
-from typing import List
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict
 
@@ -18,4 +19,31 @@ class UUIDCreate(UUIDBase):
 
 class UUID(UUIDBase):
     id : int
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+class ReadingPoint(BaseModel):
+    timestamp : datetime
+    value : float
+    min : Optional[float] = None
+    max : Optional[float] = None
+    count : Optional[int] = None
+
+class ReadingSeries(BaseModel):
+    device_id : str
+    pid : int
+    mode : Literal["bucket", "lttb", "raw"]
+    start : datetime
+    end : datetime
+    bucket_seconds : Optional[float] = None
+    points : List[ReadingPoint]
+
+class TripSummary(BaseModel):
+    id : int
+    device_id : str
+    started_at : datetime
+    ended_at : Optional[datetime] = None
+    end_reason : Optional[str] = None
+    samples : int
+    duration : Optional[float] = None
+    fuel_used : Optional[float] = None
+    summary : Optional[Dict[str, Any]] = None
@@ -1,6 +1,18 @@
 
-from app.database import AsyncSessionLocal
-from app.models import RawData, UUID
+from app.adaptive_timing import AdaptiveTiming
+from app.database import AsyncSessionLocal, settings
+from app.device_profile import load_profile, save_profile
+from app.elm327 import CommandChannel
+from app.ingest_buffer import IngestBuffer
+from app.logger import get_logger
+from app.metrics import NOTIFY_BYTES, REQUEST_LATENCY, REQUEST_TIMEOUTS, SAMPLES
+from app.models import UUID
+from app.pid_decoder import ECU_PIDS
+from app.pid_packer import PidRequester
+from app.scheduler import PollScheduler
+from app.telemetry import telemetry_hub
+from app.transport import ble_transport
+from app.trips import DISCONNECT, TripRecorder
 
 """
 0105	냉각수 온도
@@ -18,59 +30,81 @@ from app.models import RawData, UUID
 """
 
 import asyncio
-import bleak
+import logging
+import time
+from datetime import datetime, timezone
+
+logger = get_logger("sensor")
+hot_logger = get_logger("sensor.data", hot=True) # 응답마다 찍히는 로그
 
 bleAddress = "62E97F99-DF53-497B-85F5-171CA03CC4AE" # obdcheck의 uuid
 
+RATE_REPORT_INTERVAL = 10.0 # 목표/달성 주기 출력 간격(초)
+
 
 class SensorReader:
-    def __init__(self, ble_address):
-        self.ble_address = ble_address
-        self.client = bleak.BleakClient(self.ble_address)
-        self.response_received = asyncio.Event()
-        self.response_queue = asyncio.Queue()
+    def __init__(self, ble_address, ingest_buffer=None, poll_rates=None, connect_lock=None, telemetry=None,
+                 transport_factory=None, trips=None):
+        self.ble_address = ble_address or bleAddress
+        # 주소를 받아 BleakClient 와 같은 인터페이스의 객체를 만드는 함수 (기본: 실제 BLE)
+        self.transport_factory = transport_factory or ble_transport
+        self.telemetry = telemetry or telemetry_hub
+        self.connect_lock = connect_lock # 여러 기기가 동시에 connect 하지 않도록 공유하는 semaphore
+        self.poll_rates = poll_rates
+        self.scheduler = None
+        self.timing = None
+        self.write_properties = {}
+        self.client = self.transport_factory(self.ble_address)
+        self.channel = CommandChannel(self.client)
         self.active_write_uuid = ""
         self.active_notify_uuid = ""
+        # 버퍼를 전달받은 경우(fleet 모드) 버퍼의 시작/종료는 소유자가 담당
+        self._owns_buffer = ingest_buffer is None
+        self.ingest_buffer = ingest_buffer if ingest_buffer is not None else IngestBuffer()
+        self._owns_trips = trips is None
+        self.trips = trips if trips is not None else TripRecorder()
+        self._notify_bytes = NOTIFY_BYTES.labels(device=self.ble_address)
 
 
     # OBD 센서에서 데이터가 수신될 때마다 실행되는 함수
-    # bytearray(b'41 0C 11 30 \r41 0C 11 2E \r')  와 같은 데이터를 str으로 변환
-    async def notify_handler(self, sender, data):
-        print("[HANDLER ORIGIN DATA]", data)
-        # await self.response_queue.put(data)
-        # str_data = data.decode("utf-8")
-        # str_data.split(" ")
-        # print("[HANDLER PARSED DATA]", str_data)
-        await self.response_queue.put(data)
-        self.response_received.set()  # todo: 얘를 추가 안해서 hexdecimal 에러 발생
-
-
-
-
-        #todo: 데이터 전처리(파싱)
-
-
-    async def save_data(self, ecu_type , value):
-        async with AsyncSessionLocal() as session:
-            try:
-                rawdata = RawData(type=ecu_type, value=value)
-                session.add(rawdata)
-                await session.commit()
-                await session.refresh()
-            except Exception as e:
-                await session.rollback()
-                print("[SAVE ERROR]", e)
+    # bytearray(b'41 0C 11 30 \r41 0C 11 2E \r>') 와 같은 조각을 '>' 프롬프트 기준으로 조립해서
+    # 현재 전송 중인 명령의 응답으로 전달
+    def notify_handler(self, sender, data):
+        self._notify_bytes.inc(len(data))
+        self.channel.on_notify(sender, data)
+
+
+    # 매 프레임마다 트랜잭션을 여는 대신 버퍼에 쌓아두고 배치로 flush
+    # 실시간 구독자에게는 DB 를 거치지 않고 바로 전달
+    def save_data(self, pid, value, timestamp=None):
+        timestamp = timestamp or datetime.now(timezone.utc)
+        self.ingest_buffer.add(
+            device_id=self.ble_address,
+            timestamp=timestamp,
+            pid=pid,
+            value=value,
+        )
+        self.telemetry.publish(self.ble_address, pid, timestamp, value)
+        self.trips.add(self.ble_address, pid, timestamp, value)
 
 
     # DB에
+    # 연결이 끊기거나 연결에 실패하면 반환, 재연결은 호출하는 쪽(FleetSupervisor)에서 담당
     async def reading_data(self):
 
-        self.client = bleak.BleakClient(bleAddress)
+        self.client = self.transport_factory(self.ble_address)
+        self.channel = CommandChannel(self.client)
+        self.active_write_uuid = ""
+        self.active_notify_uuid = ""
 
         try:
-            await self.client.connect()
+            if self.connect_lock is not None:
+                async with self.connect_lock:
+                    await self.client.connect()
+            else:
+                await self.client.connect()
         except Exception as e:
-            print("[COnncet ERROR]", e)
+            logger.error("[COnncet ERROR] %s %s", self.ble_address, e)
             return
 
         # 센서 연결
@@ -83,42 +117,86 @@ class SensorReader:
 
         try:
             if self.client.is_connected:
-                print("[CONNECTED SUCCESS]")
+                logger.info("[CONNECTED SUCCESS] %s", self.ble_address)
             else:
-                print("[UNCONNECTED]")
+                logger.warning("[UNCONNECTED] %s", self.ble_address)
         except Exception as e:
-            print("[CONNECTED ERROR]", e)
+            logger.error("[CONNECTED ERROR] %s", e)
 
 
-        write_char_uuid = []
-        notify_char_uuid = []
+        # 저장된 프로필이 있으면 UUID 탐색과 프로토콜 자동 검색(SEARCHING...)을 생략
+        # 프로필로 초기화에 실패하면 전체 탐색으로 되돌아감
+        try:
+            profile = await load_profile(self.ble_address)
+            if profile is None or not await self.warm_start(profile):
+                await self.discover()
+                # 응답하는 write UUID 가 없으면 요청을 보낼 수 없으므로 종료 (supervisor 가 backoff 후 재연결)
+                if not self.active_write_uuid:
+                    logger.error("[DISCOVER ERROR] %s no responding write characteristic", self.ble_address)
+                    return
+                init_results = await self.init_adapter()
+                protocol = await self.detect_protocol()
+                # 프로토콜을 확인하지 못했으면 ATSP0 으로 계속 수집하되 다음 연결에서 다시 탐색하도록 저장하지 않음
+                if protocol is not None:
+                    await save_profile(self.ble_address, self.active_notify_uuid, self.active_write_uuid,
+                                       self.write_properties.get(self.active_write_uuid, []), protocol, init_results)
+
+            # 연결되어 요청을 시작하면 trip 시작, 연결이 끊겨 poll() 이 끝날 때 닫힘
+            self.trips.open(self.ble_address)
+            await self.poll()
+        finally:
+            await self.close()
+
+
+    # notify 해제 후 연결 종료
+    async def close(self):
+        try:
+            if self.active_notify_uuid and self.client.is_connected:
+                await self.client.stop_notify(self.active_notify_uuid)
+        except Exception as e:
+            logger.warning("[STOP NOTIFY ERROR] %s %s", self.ble_address, e)
+        try:
+            await self.client.disconnect()
+        except Exception as e:
+            logger.warning("[DISCONNECT ERROR] %s %s", self.ble_address, e)
 
-        at_commands = [
-            # b"ATZ\r",  # ELM327 칩 리셋
-            b"ATE0\r",  # Echo Off
-            b"ATL0\r",  # Line Feeds Off
-            b"ATH0\r",  # Headers Off
-            b"ATSP0\r"  # Auto Protocol
-        ]
 
-        ecu_commands = [
-            b'0105\r',
-            b'0106\r',
-            b'0122\r'
-            b'015E\r',
-            b'0104\r',
-            b'010C\r',
-            b'0161\r',
-            b'0142\r',
-            b'0121\r',
-            b'0130\r',
-            b'0131\r',
-            b'010B\r',
-            b'0110\r',
-        ]
+    # 프로필에 저장된 notify/write UUID 와 프로토콜로 바로 초기화
+    async def warm_start(self, profile):
+        try:
+            await self.client.start_notify(profile.notify_uuid, self.notify_handler)
+            self.active_notify_uuid = profile.notify_uuid
+            self.channel.write_uuid = profile.write_uuid
+            self.write_properties[profile.write_uuid] = (profile.write_properties or "").split(",")
+
+            init_results = await self.init_adapter(profile.protocol, timeout=2.0)
+            if any(reply is None for reply in init_results.values()):
+                raise asyncio.TimeoutError("AT command timed out")
+
+            # 저장된 프로토콜로 ECU 가 응답하는지 확인 (UNABLE TO CONNECT, BUS ERROR 등이면 실패)
+            reply = await self.channel.send(b"0100\r", timeout=5.0)
+            if not any(line.replace(" ", "").startswith("4100") for line in reply):
+                raise ValueError(f"protocol {profile.protocol} not responding: {reply}")
+
+            self.active_write_uuid = profile.write_uuid
+            logger.info("[WARM START] %s %s protocol %s", self.active_notify_uuid, self.active_write_uuid, profile.protocol)
+            return True
+        except Exception as e:
+            logger.warning("[WARM START ERROR] %s", e)
+            try:
+                await self.client.stop_notify(profile.notify_uuid)
+            except Exception:
+                pass
+            self.active_notify_uuid = ""
+            self.channel.write_uuid = None
+            return False
 
 
-        # service와 characteristic UUID 탐색
+    # service와 characteristic UUID 탐색
+    async def discover(self):
+        write_char_uuid = []
+        notify_char_uuid = []
+
         async with AsyncSessionLocal() as session:
             for service in self.client.services:
                 for characteristic in service.characteristics:
@@ -127,88 +205,192 @@ class SensorReader:
                         # postgresql DB에 UUID 정보 저장
                         service_data = UUID(service_uuid=str(service.uuid), characteristic_uuid=str(characteristic.uuid), characteristic_properties= ','.join(characteristic.properties), characteristic_description=str(characteristic.description))
                         session.add(service_data)
-                        session.commit() # todo:/Users/sihyeon/PycharmProjects/OBDProject/app/sensor_reader.py:126: RuntimeWarning: coroutine 'AsyncSession.commit' was never awaited
-
 
                         # write/notify 권한 UUID 배열 생성
                         if 'write' in characteristic.properties:
                             write_char_uuid.append(characteristic.uuid)
+                            self.write_properties[characteristic.uuid] = characteristic.properties
                         elif 'notify' in characteristic.properties:
                             notify_char_uuid.append(characteristic.uuid)
 
                     except Exception as e:
-                        print(f"[UUID ERROR] {e}")
-
-            # todo: PID 수신 받을 수 있는 notify-write 조합이 따로 있음
-            # 유효한 notify uuid 저장
-            for notify_uuid in notify_char_uuid:
-                try:
-                    await self.client.start_notify(notify_uuid, self.notify_handler)
-                    self.active_notify_uuid = notify_uuid
-                    print("[ACTIVE NOTIFY UUID] " + self.active_notify_uuid)
-
-                    # break
-
-                    # 유효한 write uuid 저장 -> 데이터 수신 성공 여부 체크
-                    for write_uuid in write_char_uuid:
-                        clear_cmd = b"ATZ\r"
-                        try:
-                            self.response_received.clear()
-                            await self.client.write_gatt_char(write_uuid, clear_cmd, response=True)
-                            await asyncio.wait_for(self.response_received.wait(), timeout=5.0)
-
-                            print("[ACTIVE WRITE UUID] " + self.active_write_uuid)
-
-                            data = await self.response_queue.get()
-                            if data is not None:
-                                self.active_write_uuid = write_uuid
-                                break
-
-                        except asyncio.TimeoutError:
-                            print(f"[WRITE ERROR] {write_uuid} timed out")
-
-                except Exception as e:
-                    print(f"[NOTIFY ERROR]{notify_uuid} -  {e}")
-
-
-
-
-
-            # 나머지 at 커멘드 순차적으로 입력
-            # todo: 중간에 안전하게 종료하는 법? -> ^c 를 눌러도 강제종료 불가능
-            for at in at_commands:
-                try:
-                    self.response_received.clear()
-                    await self.client.write_gatt_char(self.active_write_uuid, at, response=True)
-                    await asyncio.wait_for(self.response_received.wait(), timeout=5.0) # 응답이 올 때까지 대기
-                    data = await self.response_queue.get()
-                    print(f"[AT COMMAND SUCCESS] ", at, ' ',  data)
-
-                    if data is None:
-                        print("[AT COMMAND ERROR] No Response" , at)
-                except asyncio.TimeoutError:
-                    print("[AT COMMAND TIME OUT ERROR]" , at)
-
-
-            # ecu commands 동시 요청
-            while True:
-                tasks = []
-                for ecu in ecu_commands:
-                    async def write_single_ecu_command(ecu_cmd):# 각 명령어마다 독립적인 코루틴 생성
-                        try:
-                            self.response_received.clear()
-                            await self.client.write_gatt_char(self.active_write_uuid, ecu_cmd, response=True)
-                            await asyncio.wait_for(self.response_received.wait(), timeout=5.0)
-                            while not self.response_queue.empty():
-                                ecu_data = await self.response_queue.get()
-                                print("[ECU DATA] ", ecu_cmd, ' ', str(ecu_data), '\n')
-
-                                await self.save_data(ecu_data, str(ecu_data))
-                        except asyncio.TimeoutError:
-                            print(f"[WRITE ERROR] {ecu_cmd} timed out")
-                        except Exception as e:
-                            print(f"[WRITE ERROR] {e}")
-                    async_write_single_ecu_command = write_single_ecu_command(ecu)
-                    tasks.append(async_write_single_ecu_command)
-
-                await asyncio.gather(*tasks)
+                        logger.warning("[UUID ERROR] %s", e)
+
+            try:
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                logger.warning("[UUID ERROR] %s", e)
+
+        # todo: PID 수신 받을 수 있는 notify-write 조합이 따로 있음
+        # 유효한 notify uuid 저장
+        for notify_uuid in notify_char_uuid:
+            try:
+                await self.client.start_notify(notify_uuid, self.notify_handler)
+                self.active_notify_uuid = notify_uuid
+                logger.info("[ACTIVE NOTIFY UUID] %s", self.active_notify_uuid)
+
+                # 유효한 write uuid 저장 -> 데이터 수신 성공 여부 체크
+                for write_uuid in write_char_uuid:
+                    clear_cmd = b"ATZ\r"
+                    try:
+                        self.channel.write_uuid = write_uuid
+                        data = await self.channel.send(clear_cmd, timeout=5.0)
+                        self.active_write_uuid = write_uuid
+                        logger.info("[ACTIVE WRITE UUID] %s %s", self.active_write_uuid, data)
+                        break
+
+                    except asyncio.TimeoutError:
+                        logger.warning("[WRITE ERROR] %s timed out", write_uuid)
+
+                if self.active_write_uuid:
+                    break
+
+            except Exception as e:
+                logger.warning("[NOTIFY ERROR] %s - %s", notify_uuid, e)
+
+        self.channel.write_uuid = self.active_write_uuid
+
+
+    # 나머지 at 커멘드 순차적으로 입력, 명령별 응답을 반환 (시간 초과 시 None)
+    # protocol 이 없으면 ATSP0(자동 검색)
+    async def init_adapter(self, protocol=None, timeout=5.0):
+        at_commands = [
+            # b"ATZ\r",  # ELM327 칩 리셋
+            b"ATE0\r",  # Echo Off
+            b"ATL0\r",  # Line Feeds Off
+            b"ATH0\r",  # Headers Off
+            f"ATSP{protocol or 0}\r".encode()  # Auto Protocol 또는 저장된 프로토콜
+        ]
+
+        # todo: 중간에 안전하게 종료하는 법? -> ^c 를 눌러도 강제종료 불가능
+        results = {}
+        for at in at_commands:
+            try:
+                data = await self.channel.send(at, timeout=timeout) # 응답이 올 때까지 대기
+                logger.info("[AT COMMAND SUCCESS] %s %s", at, data)
+                results[at.decode().strip()] = data
+
+                if not data:
+                    logger.warning("[AT COMMAND ERROR] No Response %s", at)
+            except asyncio.TimeoutError:
+                logger.warning("[AT COMMAND TIME OUT ERROR] %s", at)
+                results[at.decode().strip()] = None
+        return results
+
+
+    # 첫 요청으로 프로토콜 자동 검색을 끝낸 뒤 ATDPN 으로 프로토콜 번호 확인 ex) 'A6' -> '6'
+    async def detect_protocol(self):
+        try:
+            await self.channel.send(b"0100\r", timeout=15.0) # SEARCHING... 이 끝날 때까지 대기
+            reply = await self.channel.send(b"ATDPN\r", timeout=5.0)
+        except asyncio.TimeoutError:
+            logger.warning("[PROTOCOL ERROR] ATDPN timed out")
+            return None
+
+        for line in reply:
+            protocol = line.strip().lstrip("A")
+            if len(protocol) == 1 and protocol in "123456789ABC":
+                logger.info("[PROTOCOL] %s", protocol)
+                return protocol
+        return None
+
+
+    async def poll(self):
+        # ecu commands 순차 요청
+        # ELM327 은 한 번에 하나의 명령만 처리하므로 응답을 받은 뒤 다음 명령을 전송
+        # 스케줄러가 PID 별 목표 주기에 따라 요청 시점이 된 PID 만 골라주고
+        # 최대 6개 PID 를 한 요청으로 묶어서 BLE 왕복 횟수를 줄임 ex) b'01050C0B10...\r'
+        # 수신 데이터는 버퍼에 모아 배치로 저장, 종료 시 남은 데이터 flush
+        requester = PidRequester(self.channel)
+        self.scheduler = PollScheduler(ECU_PIDS, self.poll_rates)
+        self.timing = AdaptiveTiming() if settings.ADAPTIVE_TIMING else None
+        write_without_response = 'write-without-response' in self.write_properties.get(self.active_write_uuid, [])
+        next_report = time.monotonic() + RATE_REPORT_INTERVAL
+        if self._owns_buffer:
+            self.ingest_buffer.start()
+        if self._owns_trips:
+            self.trips.start()
+        try:
+            while self.client.is_connected:
+                now = time.monotonic()
+                due = self.scheduler.due(now, limit=requester.max_per_request)
+                if not due:
+                    await asyncio.sleep(self.scheduler.time_until_next(now))
+                    continue
+
+                for pids in requester.groups(due):
+                    received = set()
+                    started = time.monotonic()
+                    try:
+                        timeout = self.timing.timeout_for(pids) if self.timing else 5.0
+                        ecu_data = await requester.request(pids, timeout=timeout)
+                        if hot_logger.isEnabledFor(logging.DEBUG):
+                            hot_logger.debug("[ECU DATA] %s %s", [f"{pid:04X}" for pid in pids], ecu_data)
+
+                        # 수신 시점에 한 번만 디코딩해서 숫자로 저장
+                        # 여러 ECU 가 같은 PID 에 응답하면 (ex) 41 0C 11 30\r41 0C 11 2E) (기기, PID, 시각) 이 겹치므로 처음 값만 저장
+                        timestamp = datetime.now(timezone.utc)
+                        for pid, value in ecu_data:
+                            if pid in received:
+                                continue
+                            self.save_data(pid, value, timestamp)
+                            received.add(pid)
+                        if requester.timed_out:
+                            hot_logger.warning("[WRITE ERROR] %s timed out", [f"{pid:04X}" for pid in requester.timed_out])
+                            if self.timing:
+                                self.timing.record_timeout(requester.timed_out)
+                    except asyncio.TimeoutError:
+                        hot_logger.warning("[WRITE ERROR] %s timed out", [f"{pid:04X}" for pid in pids])
+                        if self.timing:
+                            self.timing.record_timeout(pids)
+                    except Exception as e:
+                        hot_logger.warning("[WRITE ERROR] %s", e)
+
+                    done = time.monotonic()
+                    for pid in pids:
+                        self.scheduler.completed(pid, started, done, pid in received)
+                        labels = {"device": self.ble_address, "pid": f"{pid:04X}"}
+                        if pid in received:
+                            REQUEST_LATENCY.labels(**labels).observe(requester.latencies.get(pid, done - started))
+                            SAMPLES.labels(**labels).inc()
+                        else:
+                            REQUEST_TIMEOUTS.labels(**labels).inc()
+                    if self.timing and received:
+                        if requester.latencies:
+                            # 단일 PID 요청으로 받았으면 그룹 전체 시간 대신 요청별 왕복 시간 기록 (p99 / ATST 가 부풀지 않도록)
+                            for pid, latency in requester.latencies.items():
+                                self.timing.record([pid], latency)
+                        else:
+                            self.timing.record(pids, done - started)
+
+                # 워밍업이 끝나면 관측된 지연 시간으로 ATST / 쓰기 모드 조정
+                if self.timing and self.timing.should_tune(time.monotonic()):
+                    try:
+                        await self.timing.tune(self.channel, time.monotonic(), write_without_response)
+                    except asyncio.TimeoutError:
+                        logger.warning("[ADAPTIVE TIMING] tuning command timed out")
+
+                if time.monotonic() >= next_report:
+                    next_report += RATE_REPORT_INTERVAL
+                    logger.info("[POLL RATE] %s %s", self.ble_address, {f"{pid:04X}": rate for pid, rate in self.scheduler.report().items()})
+                    if self.timing:
+                        logger.info("[LATENCY] %s %s", self.ble_address, self.timing.report())
+
+            logger.info("[DISCONNECTED] %s", self.ble_address)
+        finally:
+            self.trips.close(self.ble_address, DISCONNECT)
+            if self._owns_buffer:
+                await self.ingest_buffer.stop()
+            if self._owns_trips:
+                await self.trips.stop()
+
+
+    def report(self):
+        """기기별 통계"""
+        return {
+            "connected": self.client.is_connected,
+            "poll_rate": self.scheduler.report() if self.scheduler else None,
+            "latency": self.timing.report() if self.timing else None,
+            "timeouts": self.channel.timeouts,
+        }
@@ -0,0 +1,229 @@
+"""
+프로세스 간 센서 값 전달용 shared memory ring buffer
+- 수집 프로세스 하나만 쓰고(single writer), API / DB writer 프로세스는 각자 cursor 를 두고 읽기만 함
+- 고정 크기 레코드 (seq, timestamp, value, device, pid) 와 전체 sequence 카운터(write_seq)로 구성
+- reader 는 shared memory 위의 numpy view 를 그대로 받음 (복사 없음)
+  writer 가 한 바퀴 돌아와 덮어쓴 레코드는 stale() 로 확인해서 버림
+- pid 가 CLASSIFICATION_PID 인 레코드는 DSCNN 분류 결과 (value = 확신도, pad = 라벨)
+  라벨이 문자열이면 기기 이름과 같은 이름 table 에 넣고 pad = LABEL_NAME | 이름 번호
+
+layout: [header 64 bytes][기기 이름 max_devices x 64 bytes][레코드 capacity x 32 bytes]
+"""
+import asyncio
+import struct
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from app.database import settings
+
+MAGIC = 0x4F4244464C4F5731 # "OBDFLOW1"
+HEADER = struct.Struct("<QQQII") # magic, capacity, write_seq, max_devices, device_count
+HEADER_SIZE = 64
+DEVICE_NAME_SIZE = 64
+RECORD = np.dtype([("seq", "<u8"), ("timestamp", "<f8"), ("value", "<f8"), ("device", "<u2"), ("pid", "<u2"), ("pad", "<u4")])
+_RECORD_BODY = struct.Struct("<ddHHI") # timestamp, value, device, pid, pad (seq 는 마지막에 따로 기록)
+CLASSIFICATION_PID = 0xFFFF # mode 01 PID 로는 나오지 않는 값
+LABEL_NAME = 1 << 31
+_SEQ = struct.Struct("<Q")
+_WRITE_SEQ_OFFSET = 16
+_DEVICE_COUNT_OFFSET = 28
+
+
+class SampleRing:
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        magic, self.capacity, _, self.max_devices, _ = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"not an obdflow ring: {shm.name}")
+        self._records_offset = HEADER_SIZE + self.max_devices * DEVICE_NAME_SIZE
+        self.records = np.ndarray((self.capacity,), dtype=RECORD, buffer=shm.buf, offset=self._records_offset)
+        self._device_names = {}
+
+
+    @classmethod
+    def create(cls, name=None, capacity=None, max_devices=None):
+        """수집 프로세스에서 호출, 같은 이름의 ring 이 있으면 그대로 이어서 사용 (재시작해도 reader 의 sequence 유지)"""
+        name = name or settings.SHM_RING_NAME
+        capacity = capacity or settings.SHM_RING_CAPACITY
+        max_devices = max_devices or settings.SHM_MAX_DEVICES
+        try:
+            ring = cls.attach(name)
+        except FileNotFoundError:
+            pass
+        else:
+            if ring.capacity == capacity and ring.max_devices == max_devices:
+                ring.owner = True
+                return ring
+            # 크기가 바뀌었으면 새로 만듦 (기존 reader 는 다시 attach 해야 함)
+            ring.shm.close()
+            shared_memory.SharedMemory(name).unlink()
+
+        size = HEADER_SIZE + max_devices * DEVICE_NAME_SIZE + capacity * RECORD.itemsize
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+        # 수집 프로세스가 재시작해도 같은 ring 을 이어서 쓰도록 종료 시 unlink 하지 않음
+        resource_tracker.unregister(shm._name, "shared_memory")
+        HEADER.pack_into(shm.buf, 0, MAGIC, capacity, 0, max_devices, 0)
+        return cls(shm, owner=True)
+
+
+    @classmethod
+    def attach(cls, name=None):
+        """reader 프로세스에서 호출, ring 이 아직 없으면 FileNotFoundError"""
+        shm = shared_memory.SharedMemory(name or settings.SHM_RING_NAME)
+        # attach 한 프로세스가 종료될 때 resource_tracker 가 segment 를 unlink 하지 않도록 등록 해제
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+
+    @property
+    def write_seq(self):
+        return _SEQ.unpack_from(self.shm.buf, _WRITE_SEQ_OFFSET)[0]
+
+
+    @property
+    def device_count(self):
+        return struct.unpack_from("<I", self.shm.buf, _DEVICE_COUNT_OFFSET)[0]
+
+
+    def device_name(self, index):
+        name = self._device_names.get(index)
+        if name is None:
+            offset = HEADER_SIZE + index * DEVICE_NAME_SIZE
+            name = bytes(self.shm.buf[offset:offset + DEVICE_NAME_SIZE]).rstrip(b"\0").decode()
+            self._device_names[index] = name
+        return name
+
+
+    def device_names(self):
+        return [self.device_name(index) for index in range(self.device_count)]
+
+
+    def close(self):
+        self.records = None
+        self.shm.close()
+
+
+    def unlink(self):
+        # create/attach 에서 해제한 resource_tracker 등록을 되돌린 뒤 삭제 (unlink 가 등록 해제를 다시 함)
+        resource_tracker.register(self.shm._name, "shared_memory")
+        self.shm.unlink()
+
+
+class RingWriter:
+    """
+    수집 프로세스에서 SensorReader 의 ingest_buffer 대신 사용 (add / start / stop 같은 인터페이스)
+    DB 저장은 ring 을 읽는 writer 프로세스가 담당
+    """
+
+    def __init__(self, ring):
+        self.ring = ring
+        self._buf = ring.shm.buf
+        self._seq = ring.write_seq
+        self._devices = {name: index for index, name in enumerate(ring.device_names())}
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_coalesced = 0
+
+
+    def __len__(self):
+        return 0
+
+
+    def _device_index(self, device_id):
+        index = self._devices.get(device_id)
+        if index is None:
+            index = len(self._devices)
+            if index >= self.ring.max_devices:
+                raise ValueError(f"too many devices for ring: {device_id}")
+            encoded = device_id.encode()[:DEVICE_NAME_SIZE]
+            offset = HEADER_SIZE + index * DEVICE_NAME_SIZE
+            self._buf[offset:offset + DEVICE_NAME_SIZE] = encoded.ljust(DEVICE_NAME_SIZE, b"\0")
+            struct.pack_into("<I", self._buf, _DEVICE_COUNT_OFFSET, index + 1)
+            self._devices[device_id] = index
+        return index
+
+
+    def add(self, device_id, timestamp, pid, value, pad=0):
+        seq = self._seq + 1
+        offset = self.ring._records_offset + ((seq - 1) % self.ring.capacity) * RECORD.itemsize
+        # 내용을 먼저 쓰고 레코드 seq, 전체 write_seq 순서로 기록 -> reader 는 write_seq 이하만 읽음
+        _RECORD_BODY.pack_into(self._buf, offset + 8, timestamp.timestamp(), value, self._device_index(device_id), pid, pad)
+        _SEQ.pack_into(self._buf, offset, seq)
+        _SEQ.pack_into(self._buf, _WRITE_SEQ_OFFSET, seq)
+        self._seq = seq
+        self.rows_written += 1
+
+
+    def add_classification(self, device_id, timestamp, label, confidence):
+        """InferenceService 의 분류 결과 (TelemetryHub.publish_classification 과 같은 인터페이스)"""
+        pad = label if isinstance(label, int) else LABEL_NAME | self._device_index(str(label))
+        self.add(device_id, timestamp, CLASSIFICATION_PID, confidence, pad)
+
+
+    def start(self):
+        pass
+
+
+    async def stop(self):
+        pass
+
+
+class RingReader:
+    def __init__(self, ring, from_start=False):
+        """from_start=True 이면 ring 에 남아있는 가장 오래된 레코드부터, 아니면 지금 이후 레코드만 읽음"""
+        self.ring = ring
+        head = ring.write_seq
+        self.cursor = max(head + 1 - ring.capacity, 0) if from_start else head
+        self.lost = 0 # 읽기 전에 덮어써져서 놓친 레코드 수
+        self._last_read = (self.cursor, self.cursor)
+
+
+    def read(self, limit=None):
+        """
+        마지막으로 읽은 이후의 레코드를 shared memory view 목록(ring 끝에서 나뉘면 2개)으로 반환 (복사 없음)
+        view 를 처리한 뒤 stale() 로 처리 도중 덮어써진 앞쪽 레코드 수를 확인
+        """
+        capacity = self.ring.capacity
+        head = self.ring.write_seq
+        # 다음 레코드(head)를 쓰는 중인 slot 은 head - capacity 의 slot 이므로 그 이후만 읽음
+        oldest = head + 1 - capacity
+        if self.cursor < oldest:
+            self.lost += oldest - self.cursor
+            self.cursor = oldest
+        end = head if limit is None else min(head, self.cursor + limit)
+        self._last_read = (self.cursor, end)
+        if end == self.cursor:
+            return []
+
+        start = self.cursor % capacity
+        count = end - self.cursor
+        self.cursor = end
+        if start + count <= capacity:
+            return [self.ring.records[start:start + count]]
+        return [self.ring.records[start:], self.ring.records[:start + count - capacity]]
+
+
+    def stale(self):
+        """마지막 read() 결과 중 writer 가 이미 덮어썼을 수 있는 앞쪽 레코드 수"""
+        start, end = self._last_read
+        # writer 는 write_seq 를 올리기 전에 write_seq - capacity 의 slot 부터 덮어씀
+        overwritten = min(max(self.ring.write_seq + 1 - self.ring.capacity - start, 0), end - start)
+        self.lost += overwritten
+        return overwritten
+
+
+def classification_label(ring, pad):
+    """add_classification 으로 기록한 pad -> 라벨"""
+    pad = int(pad)
+    return ring.device_name(pad & ~LABEL_NAME) if pad & LABEL_NAME else pad
+
+
+async def wait_for_ring(name=None, interval=1.0):
+    """수집 프로세스가 ring 을 만들 때까지 대기"""
+    while True:
+        try:
+            return SampleRing.attach(name)
+        except FileNotFoundError:
+            await asyncio.sleep(interval)
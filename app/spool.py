@@ -0,0 +1,182 @@
+"""
+로컬 디스크 spool (SQLite WAL)
+수집한 값은 항상 로컬 spool 에 먼저 기록하고, 백그라운드 drainer 가 모아서 Postgres 로 옮긴다.
+DB 가 느리거나 끊겨도 수집 지연은 로컬 디스크 속도로 일정하고, 데이터는 spool 에 남아 있다가 복구 후 반영된다.
+"""
+import asyncio
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database import AsyncSessionLocal, settings
+from app.logger import get_logger
+from app.metrics import DB_FLUSH_LATENCY, DB_ROWS_WRITTEN
+from app.models import Reading
+from app.storage import refresh_rollups
+
+logger = get_logger("spool")
+
+
+class Spool:
+    def __init__(self, path=None):
+        self.path = path or settings.SPOOL_PATH
+        # to_thread 로 여러 스레드에서 접근하므로 lock 으로 직렬화
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # WAL 에서는 전원 손실 시에도 DB 는 깨지지 않음
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, device_id TEXT, pid INTEGER, ts REAL, value REAL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS checkpoint (id INTEGER PRIMARY KEY CHECK (id = 1), seq INTEGER)")
+        self._conn.execute("INSERT OR IGNORE INTO checkpoint (id, seq) VALUES (1, 0)")
+        # 매번 count(*) 하지 않도록 시작 시 한 번 세고 이후에는 추가/반영 개수로 계산
+        self.pending_rows = self.pending()
+
+
+    def append(self, rows):
+        """IngestBuffer 의 row(dict) 목록을 한 트랜잭션으로 추가"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO spool (device_id, pid, ts, value) VALUES (?, ?, ?, ?)",
+                [(row["device_id"], row["pid"], row["timestamp"].timestamp(), row["value"]) for row in rows],
+            )
+            self._conn.execute("COMMIT")
+            self.pending_rows += len(rows)
+
+
+    def read_batch(self, limit):
+        """checkpoint 이후의 row 를 최대 limit 개 반환 [(seq, row), ...]"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT seq, device_id, pid, ts, value FROM spool "
+                "WHERE seq > (SELECT seq FROM checkpoint WHERE id = 1) ORDER BY seq LIMIT ?",
+                (limit,),
+            )
+            return [
+                (seq, {
+                    "device_id": device_id,
+                    "pid": pid,
+                    "timestamp": datetime.fromtimestamp(ts, timezone.utc),
+                    "value": value,
+                })
+                for seq, device_id, pid, ts, value in cursor
+            ]
+
+
+    def commit(self, seq, count=0):
+        """seq 까지 Postgres 반영 완료 -> checkpoint 이동 후 반영된 row 삭제(한 트랜잭션)"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("UPDATE checkpoint SET seq = ? WHERE id = 1", (seq,))
+            self._conn.execute("DELETE FROM spool WHERE seq <= ?", (seq,))
+            self._conn.execute("COMMIT")
+            self.pending_rows = max(self.pending_rows - count, 0)
+
+
+    def compact(self):
+        """모두 반영된 뒤 WAL 파일 크기를 줄임"""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT count(*) FROM spool WHERE seq > (SELECT seq FROM checkpoint WHERE id = 1)"
+            ).fetchone()[0]
+
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SpoolDrainer:
+    """spool 의 row 를 DRAIN_BATCH 개씩 Postgres 로 옮기는 백그라운드 작업"""
+
+    def __init__(self, spool, batch_size=None, interval=None):
+        self.spool = spool
+        self.batch_size = batch_size or settings.SPOOL_DRAIN_BATCH
+        self.interval = interval or settings.SPOOL_DRAIN_INTERVAL
+        self._task = None
+        self.rows_drained = 0
+        self.failures = 0
+
+
+    async def drain_once(self):
+        """한 배치 반영, 반영한 row 수 반환"""
+        batch = await asyncio.to_thread(self.spool.read_batch, self.batch_size)
+        if not batch:
+            return 0
+
+        with DB_FLUSH_LATENCY.labels(target="drain").time():
+            async with AsyncSessionLocal() as session:
+                try:
+                    # 반영 후 checkpoint 저장 전에 종료되면 같은 row 가 다시 들어오므로 중복은 무시
+                    rows = [row for _, row in batch]
+                    await session.execute(insert(Reading).on_conflict_do_nothing(), rows)
+                    # StorageMaintenance 는 최근 ROLLUP_LOOKBACK 구간만 다시 집계하므로
+                    # DB 장애 후 늦게 반영되는 구간의 rollup 은 여기서 같은 트랜잭션으로 갱신
+                    since = min(row["timestamp"] for row in rows)
+                    if since < datetime.now(timezone.utc) - timedelta(seconds=settings.ROLLUP_LOOKBACK):
+                        until = max(row["timestamp"] for row in rows) + timedelta(microseconds=1)
+                        await refresh_rollups(session, since, until)
+                    await session.commit()
+                except Exception:
+                    await session.rollback()
+                    raise
+
+        await asyncio.to_thread(self.spool.commit, batch[-1][0], len(batch))
+        self.rows_drained += len(batch)
+        DB_ROWS_WRITTEN.inc(len(batch), target="drain")
+        return len(batch)
+
+
+    async def drain_all(self):
+        while await self.drain_once() == self.batch_size:
+            pass
+
+
+    async def _run(self):
+        backoff = self.interval
+        while True:
+            try:
+                drained = await self.drain_once()
+                backoff = self.interval
+                if drained == self.batch_size:
+                    continue # 밀려있으면 쉬지 않고 계속 반영
+                if drained:
+                    await asyncio.to_thread(self.spool.compact)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # DB 장애 시 데이터는 spool 에 남겨두고 간격을 늘려가며 재시도
+                self.failures += 1
+                logger.error("[SPOOL DRAIN ERROR] %s", e)
+                backoff = min(backoff * 2, settings.RECONNECT_BACKOFF_MAX)
+            await asyncio.sleep(backoff)
+
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+
+    async def stop(self, timeout=5.0):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # 종료 전에 가능한 만큼 반영, 남은 데이터는 다음 실행 때 반영
+        try:
+            await asyncio.wait_for(self.drain_all(), timeout=timeout)
+        except Exception as e:
+            logger.error("[SPOOL DRAIN ERROR] %s", e)
@@ -0,0 +1,178 @@
+"""
+시계열 저장소 관리
+- readings / readings_1s 의 일 단위 파티션을 미리 생성하고, 보관 기간이 지난 파티션은 DROP 으로 삭제
+- 최근 구간의 원본 값을 1초 / 1분 rollup 테이블로 계속 집계
+DELETE 대신 파티션 DROP 을 사용하므로 데이터가 많아져도 삭제 비용이 일정하다.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from app.database import async_engine, settings
+from app.logger import get_logger
+
+logger = get_logger("storage")
+
+# 일 단위로 파티션하는 테이블: 테이블 이름 -> (파티션 기준 열, 보관 기간 설정 이름)
+PARTITIONED_TABLES = {
+    "readings": ("timestamp", "RETENTION_DAYS_RAW"),
+    "readings_1s": ("bucket", "RETENTION_DAYS_1S"),
+}
+
+
+def partition_name(table, day):
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def _day(value):
+    return datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+
+
+async def ensure_partitions(conn, start, end, tables=PARTITIONED_TABLES):
+    """
+    start ~ end 를 포함하는 일 단위 파티션 생성 (이미 있으면 무시)
+    파티션이 없던 날의 값은 DEFAULT 파티션에 들어가 있으므로, 그런 값이 있으면
+    새 파티션으로 옮긴 뒤 ATTACH (DEFAULT 에 그 날의 값이 있으면 PARTITION OF 로는 만들 수 없음)
+    """
+    for table, (column, _) in tables.items():
+        default = f"{table}_default"
+        await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {default} PARTITION OF {table} DEFAULT"))
+        day = _day(start)
+        while day <= end:
+            name = partition_name(table, day)
+            bounds = {"since": day, "until": day + timedelta(days=1)}
+            bounds_sql = f"FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            day += timedelta(days=1)
+            if await conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}):
+                continue
+            stray = await conn.scalar(text(
+                f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {column} >= :since AND {column} < :until)"
+            ), bounds)
+            if not stray:
+                await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES {bounds_sql}"))
+                continue
+            await conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            result = await conn.execute(text(
+                f"WITH moved AS (DELETE FROM {default} WHERE {column} >= :since AND {column} < :until RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ), bounds)
+            await conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {bounds_sql}"))
+            logger.info("[PARTITION] moved %d rows from %s to %s", result.rowcount, default, name)
+
+
+async def drop_old_partitions(conn, now, tables=PARTITIONED_TABLES):
+    """보관 기간이 지난 파티션 DROP, 삭제한 파티션 이름 목록 반환"""
+    dropped = []
+    for table, (column, retention_setting) in tables.items():
+        cutoff = _day(now) - timedelta(days=getattr(settings, retention_setting))
+        result = await conn.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+            "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+            "WHERE parent.relname = :table"
+        ), {"table": table})
+        for (name,) in result:
+            suffix = name[len(table) + 2:]
+            if not name.startswith(f"{table}_p") or not suffix.isdigit():
+                continue
+            day = datetime.strptime(suffix, "%Y%m%d").replace(tzinfo=timezone.utc)
+            # 파티션의 마지막 시점이 cutoff 이전이면 삭제
+            if day + timedelta(days=1) <= cutoff:
+                await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped.append(name)
+
+        # DEFAULT 파티션(파티션이 없던 날의 값)은 DROP 할 수 없으므로 보관 기간이 지난 값만 DELETE
+        await conn.execute(text(f"DELETE FROM {table}_default WHERE {column} < :cutoff"), {"cutoff": cutoff})
+
+    cutoff = now - timedelta(days=settings.RETENTION_DAYS_1M)
+    await conn.execute(text("DELETE FROM readings_1m WHERE bucket < :cutoff"), {"cutoff": cutoff})
+    return dropped
+
+
+async def refresh_rollups(conn, since, until):
+    """
+    [since, until) 구간의 1초 / 1분 집계를 원본에서 다시 계산해서 덮어씀
+    같은 구간을 여러 번 계산해도 결과가 같으므로 늦게 들어온 데이터도 다음 갱신 때 반영된다.
+    구간은 1분 단위로 넓혀서 계산 (until 이 분 중간이면 그 1분 집계가 일부 1초 집계만으로 덮어써지므로)
+    """
+    since = since.replace(microsecond=0)
+    minute_since = since.replace(second=0)
+    if until != until.replace(second=0, microsecond=0):
+        until = until.replace(second=0, microsecond=0) + timedelta(minutes=1)
+
+    await conn.execute(text(
+        "INSERT INTO readings_1s (device_id, pid, bucket, count, sum, min, max) "
+        "SELECT device_id, pid, date_trunc('second', timestamp), count(*), sum(value), min(value), max(value) "
+        "FROM readings WHERE timestamp >= :since AND timestamp < :until "
+        "GROUP BY 1, 2, 3 "
+        "ON CONFLICT (device_id, pid, bucket) DO UPDATE SET "
+        "count = EXCLUDED.count, sum = EXCLUDED.sum, min = EXCLUDED.min, max = EXCLUDED.max"
+    ), {"since": since, "until": until})
+
+    await conn.execute(text(
+        "INSERT INTO readings_1m (device_id, pid, bucket, count, sum, min, max) "
+        "SELECT device_id, pid, date_trunc('minute', bucket), sum(count), sum(sum), min(min), max(max) "
+        "FROM readings_1s WHERE bucket >= :since AND bucket < :until "
+        "GROUP BY 1, 2, 3 "
+        "ON CONFLICT (device_id, pid, bucket) DO UPDATE SET "
+        "count = EXCLUDED.count, sum = EXCLUDED.sum, min = EXCLUDED.min, max = EXCLUDED.max"
+    ), {"since": minute_since, "until": until})
+
+
+class StorageMaintenance:
+    """rollup 갱신(ROLLUP_INTERVAL 마다)과 파티션 생성/삭제(PARTITION_INTERVAL 마다)를 실행하는 백그라운드 작업"""
+
+    def __init__(self, engine=async_engine):
+        self.engine = engine
+        self._task = None
+        self._next_partition_check = 0.0
+
+
+    async def prepare(self):
+        """앱 시작 시 오늘부터 PARTITION_DAYS_AHEAD 일 뒤까지 파티션 생성"""
+        now = datetime.now(timezone.utc)
+        async with self.engine.begin() as conn:
+            await ensure_partitions(conn, now, now + timedelta(days=settings.PARTITION_DAYS_AHEAD))
+
+
+    async def run_once(self):
+        now = datetime.now(timezone.utc)
+        loop_time = asyncio.get_running_loop().time()
+
+        async with self.engine.begin() as conn:
+            await refresh_rollups(conn, now - timedelta(seconds=settings.ROLLUP_LOOKBACK), now)
+
+        if loop_time >= self._next_partition_check:
+            self._next_partition_check = loop_time + settings.PARTITION_INTERVAL
+            async with self.engine.begin() as conn:
+                await ensure_partitions(conn, now, now + timedelta(days=settings.PARTITION_DAYS_AHEAD))
+                dropped = await drop_old_partitions(conn, now)
+            if dropped:
+                logger.info("[RETENTION] dropped partitions: %s", dropped)
+
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("[STORAGE MAINTENANCE ERROR] %s", e)
+            await asyncio.sleep(settings.ROLLUP_INTERVAL)
+
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
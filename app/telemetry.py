@@ -0,0 +1,144 @@
+"""
+실시간 센서 값 fan-out
+수집 경로에서 디코딩된 값을 (기기, PID) 별 ring buffer 에 보관하고 WebSocket/SSE 구독자에게 바로 전달한다.
+DB 를 거치지 않으므로 구독자가 늘어도 DB 부하는 늘지 않는다.
+"""
+import asyncio
+from collections import deque
+
+from app.database import settings
+from app.pid_decoder import PIDS
+
+CLASSIFICATION = "classification" # DSCNN 분류 결과를 PID 대신 이 이름으로 발행
+
+
+class Subscriber:
+    def __init__(self, device_id=None, pids=None, max_pending=None):
+        self.device_id = device_id
+        self.pids = set(pids) if pids else None
+        self.max_pending = max_pending or settings.TELEMETRY_MAX_PENDING
+        self._pending = []
+        self._coalesce_at = self.max_pending
+        self._ready = asyncio.Event()
+        self.coalesced = 0 # 느린 구독자라서 최신 값으로 합쳐진 샘플 수
+
+
+    def wants(self, sample):
+        if self.device_id is not None and sample["device_id"] != self.device_id:
+            return False
+        return self.pids is None or sample["pid"] in self.pids
+
+
+    # 발행하는 쪽을 막지 않도록 동기 함수로 대기열에만 추가
+    def offer(self, sample):
+        self._pending.append(sample)
+        if len(self._pending) > self._coalesce_at:
+            # 전송이 밀린 구독자는 (기기, PID) 별 최신 값만 남김 -> 메모리 상한 유지
+            latest = {}
+            for pending in self._pending:
+                latest[(pending["device_id"], pending["pid"])] = pending
+            self.coalesced += len(self._pending) - len(latest)
+            self._pending = list(latest.values())
+            # (기기, PID) 조합이 max_pending 보다 많으면 샘플마다 다시 합치지 않도록 다음 기준을 늘림
+            self._coalesce_at = max(self.max_pending, 2 * len(self._pending))
+        self._ready.set()
+
+
+    async def next_batch(self):
+        await self._ready.wait()
+        self._ready.clear()
+        batch, self._pending = self._pending, []
+        self._coalesce_at = self.max_pending
+        return batch
+
+
+class TelemetryHub:
+    def __init__(self, history=None):
+        self.history = history or settings.TELEMETRY_HISTORY
+        self._buffers = {} # (device_id, pid) -> deque(maxlen=history)
+        self._subscribers = set()
+        self._retired_coalesced = 0 # 연결이 끊긴 구독자의 coalesced 합계
+
+
+    def publish(self, device_id, pid, timestamp, value):
+        spec = PIDS.get(pid)
+        sample = {
+            "device_id": device_id,
+            "pid": pid,
+            "name": spec.name if spec else None,
+            "timestamp": timestamp.isoformat(),
+            "value": value,
+        }
+
+        self._publish((device_id, pid), sample)
+
+
+    def publish_classification(self, device_id, timestamp, label, confidence):
+        """윈도우 분류 결과를 센서 값과 같은 경로로 발행 (pid = CLASSIFICATION)"""
+        sample = {
+            "device_id": device_id,
+            "pid": CLASSIFICATION,
+            "name": CLASSIFICATION,
+            "timestamp": timestamp.isoformat(),
+            "value": label,
+            "confidence": confidence,
+        }
+        self._publish((device_id, CLASSIFICATION), sample)
+
+
+    def _publish(self, key, sample):
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = deque(maxlen=self.history)
+        buffer.append(sample)
+
+        for subscriber in self._subscribers:
+            if subscriber.wants(sample):
+                subscriber.offer(sample)
+
+
+    def snapshot(self, device_id=None, pids=None, limit=None):
+        """(기기, PID) 별 최근 limit 개 샘플 (None 이면 ring buffer 전체, 0 이면 없음)"""
+        samples = []
+        for (buffer_device, pid), buffer in self._buffers.items():
+            if device_id is not None and buffer_device != device_id:
+                continue
+            if pids and pid not in pids:
+                continue
+            if limit is None:
+                samples.extend(buffer)
+            elif limit > 0:
+                samples.extend(list(buffer)[-limit:])
+        return samples
+
+
+    def subscribe(self, device_id=None, pids=None):
+        subscriber = Subscriber(device_id, pids)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+
+    def unsubscribe(self, subscriber):
+        if subscriber in self._subscribers:
+            self._subscribers.discard(subscriber)
+            self._retired_coalesced += subscriber.coalesced
+
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+    @property
+    def pending(self):
+        """구독자들에게 아직 전달되지 않은 샘플 수"""
+        return sum(len(subscriber._pending) for subscriber in self._subscribers)
+
+
+    @property
+    def coalesced(self):
+        return self._retired_coalesced + sum(subscriber.coalesced for subscriber in self._subscribers)
+
+
+# 프로세스 전체에서 공유하는 hub
+telemetry_hub = TelemetryHub()
@@ -0,0 +1,74 @@
+"""
+SensorReader 가 사용하는 BLE 전송 계층
+bleak.BleakClient 와 같은 인터페이스(connect, services, start_notify, write_gatt_char ...)를 가진 객체라면
+실제 어댑터 대신 사용할 수 있다. ex) app/fake_elm327.py 의 FakeElm327
+"""
+import asyncio
+import json
+import time
+from typing import Protocol
+
+import bleak
+
+
+class Transport(Protocol):
+    is_connected: bool
+    services: object
+
+    async def connect(self): ...
+    async def disconnect(self): ...
+    async def start_notify(self, uuid, callback): ...
+    async def stop_notify(self, uuid): ...
+    async def write_gatt_char(self, uuid, data, response=True): ...
+
+
+def ble_transport(address):
+    return bleak.BleakClient(address)
+
+
+class RecordingTransport:
+    """
+    실제 어댑터와 주고받은 명령/응답을 JSONL 로 기록하는 wrapper
+    기록한 파일은 FakeElm327(recording=...) 로 다시 재생할 수 있다.
+    한 줄 형식: {"command": "010C", "reply": "41 0C 11 30\\r\\r>", "latency": 0.052}
+    """
+
+    def __init__(self, client, path):
+        self.client = client
+        self._file = open(path, "a", encoding="utf-8")
+        self._command = None
+        self._sent_at = None
+        self._reply = bytearray()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    async def start_notify(self, uuid, callback):
+        def record(sender, data):
+            self._reply += data
+            if b">" in data and self._command is not None:
+                self._file.write(json.dumps({
+                    "command": self._command,
+                    "reply": self._reply.decode("ascii", errors="ignore"),
+                    "latency": round(time.monotonic() - self._sent_at, 4),
+                }) + "\n")
+                self._file.flush()
+                self._command = None
+                self._reply.clear()
+            result = callback(sender, data)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result)
+
+        await self.client.start_notify(uuid, record)
+
+    async def write_gatt_char(self, uuid, data, response=True):
+        self._command = bytes(data).decode("ascii", errors="ignore").strip()
+        self._sent_at = time.monotonic()
+        self._reply.clear()
+        await self.client.write_gatt_char(uuid, data, response=response)
+
+    async def disconnect(self):
+        try:
+            await self.client.disconnect()
+        finally:
+            self._file.close()
@@ -0,0 +1,259 @@
+"""
+주행(trip) 단위 집계
+- 연결되면 trip 을 열고, 연결이 끊기거나 TRIP_IDLE_TIMEOUT 동안 값이 없으면 닫음
+- 디코딩한 값이 들어올 때마다 PID 별 count/sum/min/max, 시간 가중 적분, histogram 을 바로 갱신 (raw 값을 다시 읽지 않음)
+  시간 가중 값은 다음 값이 들어올 때까지 직전 값이 유지된다고 보고 계산 (TRIP_MAX_GAP 보다 긴 간격은 제외)
+- 진행 중인 trip 은 TRIP_FLUSH_INTERVAL 마다, 닫힌 trip 은 다음 flush 때 trips 테이블에 저장
+"""
+import asyncio
+import bisect
+import math
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, update
+
+from app.database import AsyncSessionLocal, settings
+from app.logger import get_logger
+from app.models import Trip
+
+logger = get_logger("trips")
+
+DISCONNECT = "disconnect"
+IDLE = "idle"
+
+FUEL_RATE_PID = 0x015E # L/h
+
+# PID 별 histogram 구간의 아래 경계, 마지막 구간은 마지막 경계 이상 전체 (첫 구간 아래 값은 첫 구간에 포함)
+HISTOGRAMS = {
+    0x010C: list(range(0, 8000, 500)), # 엔진 RPM
+    0x0104: list(range(0, 100, 10)), # 엔진 부하 %
+    0x0105: list(range(-40, 130, 10)), # 냉각수 온도 °C
+    0x010D: list(range(0, 200, 20)), # 차속 km/h
+}
+
+
+class PidAggregate:
+    __slots__ = ("count", "sum", "min", "max", "integral", "seconds", "last_t", "last_value",
+                 "edges", "hist_counts", "hist_seconds")
+
+    def __init__(self, edges=None):
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.integral = 0.0 # 값 x 초
+        self.seconds = 0.0 # 적분에 포함된 시간
+        self.last_t = None
+        self.last_value = None
+        self.edges = edges
+        self.hist_counts = [0] * len(edges) if edges else None
+        self.hist_seconds = [0.0] * len(edges) if edges else None
+
+
+    def _bin(self, value):
+        return max(bisect.bisect_right(self.edges, value) - 1, 0)
+
+
+    def add(self, t, value, max_gap):
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if self.last_t is not None:
+            dt = t - self.last_t
+            if 0.0 < dt <= max_gap:
+                self.integral += self.last_value * dt
+                self.seconds += dt
+                if self.edges:
+                    self.hist_seconds[self._bin(self.last_value)] += dt
+        if self.edges:
+            self.hist_counts[self._bin(value)] += 1
+        self.last_t = t
+        self.last_value = value
+
+
+    def to_dict(self):
+        result = {
+            "count": self.count,
+            "mean": self.sum / self.count,
+            "min": self.min,
+            "max": self.max,
+            "integral": self.integral,
+            "seconds": round(self.seconds, 3),
+            "time_mean": self.integral / self.seconds if self.seconds else None,
+        }
+        if self.edges:
+            result["histogram"] = {
+                "edges": self.edges,
+                "counts": self.hist_counts,
+                "seconds": [round(s, 3) for s in self.hist_seconds],
+            }
+        return result
+
+
+class TripState:
+    def __init__(self, device_id, started_at):
+        self.device_id = device_id
+        self.started_at = started_at
+        self.opened = started_at.timestamp()
+        self.ended_at = None
+        self.end_reason = None
+        self.first_sample = None
+        self.last_sample = None
+        self.samples = 0
+        self.aggregates = {}
+        self.id = None # 처음 저장할 때 할당
+        self.dirty = True
+
+
+    def add(self, pid, t, value, max_gap):
+        aggregate = self.aggregates.get(pid)
+        if aggregate is None:
+            aggregate = self.aggregates[pid] = PidAggregate(HISTOGRAMS.get(pid))
+        aggregate.add(t, value, max_gap)
+        if self.first_sample is None:
+            self.first_sample = t
+        self.last_sample = t
+        self.samples += 1
+        self.dirty = True
+
+
+    def row(self):
+        fuel = self.aggregates.get(FUEL_RATE_PID)
+        return {
+            "device_id": self.device_id,
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+            "end_reason": self.end_reason,
+            "samples": self.samples,
+            "duration": self.last_sample - self.first_sample if self.samples else 0.0,
+            "fuel_used": fuel.integral / 3600 if fuel is not None else None,
+            "summary": {f"{pid:04X}": aggregate.to_dict() for pid, aggregate in self.aggregates.items()},
+            "updated_at": datetime.now(timezone.utc),
+        }
+
+
+class TripRecorder:
+    """기기별 진행 중인 trip 을 관리하고 주기적으로 저장 (여러 SensorReader 가 공유)"""
+
+    def __init__(self, idle_timeout=None, max_gap=None, flush_interval=None):
+        self.idle_timeout = idle_timeout or settings.TRIP_IDLE_TIMEOUT
+        self.max_gap = max_gap or settings.TRIP_MAX_GAP
+        self.flush_interval = flush_interval or settings.TRIP_FLUSH_INTERVAL
+        self._open = {} # device_id -> TripState
+        self._closed = [] # 아직 저장하지 않은 닫힌 trip
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self.trips_closed = 0
+
+
+    def __len__(self):
+        return len(self._open)
+
+
+    def open(self, device_id, now=None):
+        if device_id in self._open:
+            self.close(device_id, DISCONNECT)
+        self._open[device_id] = TripState(device_id, now or datetime.now(timezone.utc))
+
+
+    def close(self, device_id, reason):
+        trip = self._open.pop(device_id, None)
+        if trip is None:
+            return
+        # 마지막 값 시각을 종료 시각으로 사용 (idle 로 닫혀도 idle 시간은 포함하지 않음)
+        trip.ended_at = datetime.fromtimestamp(trip.last_sample, timezone.utc) if trip.samples else trip.started_at
+        trip.end_reason = reason
+        trip.dirty = True
+        self._closed.append(trip)
+        self.trips_closed += 1
+
+
+    def add(self, device_id, pid, timestamp, value):
+        t = timestamp.timestamp()
+        trip = self._open.get(device_id)
+        if trip is not None and trip.samples and t - trip.last_sample > self.idle_timeout:
+            self.close(device_id, IDLE)
+            trip = None
+        if trip is None:
+            # idle 로 닫힌 뒤 연결이 유지된 채 다시 값이 들어오면 새 trip
+            trip = self._open[device_id] = TripState(device_id, timestamp)
+        trip.add(pid, t, value, self.max_gap)
+
+
+    def close_idle(self, now=None):
+        now = now if now is not None else datetime.now(timezone.utc).timestamp()
+        for device_id, trip in list(self._open.items()):
+            last_activity = trip.last_sample if trip.samples else trip.opened
+            if now - last_activity > self.idle_timeout:
+                self.close(device_id, IDLE)
+
+
+    def snapshot(self, device_id):
+        """진행 중인 trip 의 현재 집계 (저장 전 값 포함)"""
+        trip = self._open.get(device_id)
+        return trip.row() if trip is not None else None
+
+
+    async def flush(self):
+        async with self._flush_lock:
+            # 값이 하나도 없이 닫힌 trip(ECU 응답 없음)은 저장하지 않음
+            trips = [trip for trip in self._closed if trip.samples or trip.id is not None]
+            trips += [trip for trip in self._open.values() if trip.dirty and trip.samples]
+            closed = self._closed
+            self._closed = []
+            if not trips:
+                return 0
+
+            inserted = []
+            try:
+                async with AsyncSessionLocal() as session:
+                    try:
+                        for trip in trips:
+                            row = trip.row()
+                            if trip.id is None:
+                                trip.id = await session.scalar(insert(Trip).values(**row).returning(Trip.id))
+                                inserted.append(trip)
+                            else:
+                                await session.execute(update(Trip).where(Trip.id == trip.id).values(**row))
+                        await session.commit()
+                    except Exception:
+                        await session.rollback()
+                        raise
+            except Exception as e:
+                logger.error("[TRIP FLUSH ERROR] %s", e)
+                # rollback 된 insert 의 id 는 버리고 다음 flush 때 다시 저장
+                for trip in inserted:
+                    trip.id = None
+                self._closed = closed + self._closed
+                return 0
+
+            for trip in trips:
+                trip.dirty = False
+            return len(trips)
+
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.close_idle()
+            await self.flush()
+
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+
+    # 종료 시 진행 중인 trip 까지 저장 (진행 중인 trip 은 ended_at 없이 저장됨)
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
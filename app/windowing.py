@@ -0,0 +1,90 @@
+"""
+시계열 슬라이딩 윈도우 (DS_CNN 입력 생성)
+- 윈도우는 원본 배열의 strided view 라서 복사하지 않음 (np.load(mmap_mode="r") 배열도 그대로 사용 가능)
+- 모델 입력 형태 (N, 1, 피처 수, 윈도우 크기) 로의 복사/변환은 batch 를 만들 때만 수행
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def window_count(length, window_size, step_size):
+    if length < window_size:
+        return 0
+    return (length - window_size) // step_size + 1
+
+
+def window_view(data, window_size, step_size):
+    """
+    (시간, 피처) 배열 -> (윈도우 수, 피처 수, 윈도우 크기) view
+    노트북의 raw_time_series_data[i:i + window_size].T 를 모든 i 에 대해 복사 없이 만든 것과 같음
+    """
+    data = np.asarray(data)
+    if data.ndim == 1:
+        data = data[:, None]
+    count = window_count(len(data), window_size, step_size)
+    if count == 0:
+        return np.empty((0, data.shape[1], window_size), dtype=data.dtype)
+    # sliding_window_view 결과는 (시간 - window_size + 1, 피처 수, 윈도우 크기), step 만큼 건너뛰어도 view 유지
+    return sliding_window_view(data, window_size, axis=0)[::step_size][:count]
+
+
+def window_labels(labels, window_size, step_size):
+    """각 윈도우의 레이블 = 윈도우 마지막 시점의 레이블 (view)"""
+    labels = np.asarray(labels)
+    count = window_count(len(labels), window_size, step_size)
+    return labels[window_size - 1::step_size][:count]
+
+
+class SlidingWindows:
+    """
+    windows = SlidingWindows(data, labels, window_size=128, step_size=64)
+    for x, y in windows.batches(256):
+        model(torch.from_numpy(x))  # x: (B, 1, 피처 수, 윈도우 크기) float32
+    """
+
+    def __init__(self, data, labels=None, window_size=128, step_size=64, mean=None, std=None, dtype=np.float32):
+        self.window_size = window_size
+        self.step_size = step_size
+        self.windows = window_view(data, window_size, step_size)
+        self.labels = window_labels(labels, window_size, step_size) if labels is not None else None
+        self.dtype = dtype
+
+        # 피처(채널)별 정규화 값, batch 를 만들 때 적용
+        self.mean = None if mean is None else np.asarray(mean, dtype=dtype).reshape(-1, 1)
+        self.std = None if std is None else np.asarray(std, dtype=dtype).reshape(-1, 1)
+
+    def __len__(self):
+        return len(self.windows)
+
+    @property
+    def num_features(self):
+        return self.windows.shape[1]
+
+    def __getitem__(self, index):
+        # 단일 윈도우는 view 그대로 반환 (피처 수, 윈도우 크기)
+        return self.windows[index]
+
+    def batch(self, indices):
+        """
+        indices(slice 또는 정수 배열)에 해당하는 윈도우를 (B, 1, 피처 수, 윈도우 크기) 배열로 복사
+        메모리는 batch 크기만큼만 사용
+        """
+        windows = self.windows[indices]
+        # slice 결과는 원본의 view 라서 복사, 정수 배열 indexing 결과는 이미 복사본이라 dtype 이 같으면 그대로 사용
+        x = windows.astype(self.dtype, copy=isinstance(indices, slice))
+        if self.mean is not None:
+            x -= self.mean
+        if self.std is not None:
+            x /= self.std
+        y = self.labels[indices] if self.labels is not None else None
+        return x[:, None], y
+
+    def batches(self, batch_size, indices=None):
+        """batch_size 단위로 (x, y) 반환, indices 를 주면 그 순서대로 (ex. train/val/test 분할, shuffle)"""
+        if indices is None:
+            for start in range(0, len(self), batch_size):
+                yield self.batch(slice(start, start + batch_size))
+        else:
+            indices = np.asarray(indices)
+            for start in range(0, len(indices), batch_size):
+                yield self.batch(indices[start:start + batch_size])
@@ -0,0 +1,128 @@
+"""
+DSCNN 실시간 분류 벤치마크 (학습된 가중치 없이 임의 가중치로 실행)
+1. batch 크기별 모델 처리량 (윈도우/초)
+2. 가상 기기 N 대가 telemetry hub 로 값을 발행할 때 InferenceService 의 처리량과 윈도우 완성 -> 분류 지연 시간
+
+    python -m benchmarks.bench_inference --devices 200 --duration 20
+    python -m benchmarks.bench_inference --format int8 --threads 2
+    python -m benchmarks.bench_inference --model dscnn.onnx
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app.inference import InferenceService, load_model
+from app.logger import setup_logging
+from app.pid_decoder import ECU_PIDS
+from app.telemetry import TelemetryHub
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="export 된 모델 (없으면 임의 가중치 모델을 export 해서 사용)")
+    parser.add_argument("--format", choices=["onnx", "int8", "torchscript"], default="onnx")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--sample-hz", type=float, default=10.0)
+    parser.add_argument("--window-size", type=int, default=128)
+    parser.add_argument("--step-size", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="결과를 JSON 으로 출력")
+    return parser.parse_args()
+
+
+def export_random_model(args, directory):
+    from app.dscnn import DSCNNWithDownsampling, export_model
+
+    meta = {
+        "pids": ECU_PIDS,
+        "window_size": args.window_size,
+        "step_size": args.step_size,
+        "sample_hz": args.sample_hz,
+        "classes": ["0", "1", "2"],
+    }
+    model = DSCNNWithDownsampling(in_channels=1, num_classes=3)
+    path = os.path.join(directory, "dscnn.pt" if args.format == "torchscript" else "dscnn.onnx")
+    calibration = np.random.randn(args.window_size * 64, len(ECU_PIDS)).astype(np.float32) if args.format == "int8" else None
+    return export_model(model, path, meta, calibration)
+
+
+def model_throughput(model, batch_sizes=(1, 8, 32, 128), repeat=20):
+    num_features, window_size = len(model.meta["pids"]), model.meta["window_size"]
+    results = {}
+    for batch_size in batch_sizes:
+        x = np.random.randn(batch_size, 1, num_features, window_size).astype(np.float32)
+        model(x)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            model(x)
+        elapsed = time.perf_counter() - started
+        results[batch_size] = round(batch_size * repeat / elapsed, 1)
+    return results
+
+
+async def publish(hub, devices, pids, hz):
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    while True:
+        next_tick += 1.0 / hz
+        await asyncio.sleep(max(0.0, next_tick - loop.time()))
+        timestamp = datetime.now(timezone.utc)
+        for device in devices:
+            for pid in pids:
+                hub.publish(device, pid, timestamp, random.random() * 100)
+
+
+async def run_live(args, model):
+    hub = TelemetryHub()
+    service = InferenceService(model, telemetry=hub, batch_size=args.batch_size)
+    devices = [f"FAKE-{i:03d}" for i in range(args.devices)]
+    service.start()
+    publisher = asyncio.create_task(publish(hub, devices, service.pids, service.sample_hz))
+    await asyncio.sleep(args.duration)
+    publisher.cancel()
+    await service.stop()
+
+    report = service.report()
+    # 윈도우가 채워지는 동안은 분류할 윈도우가 없으므로 채워진 이후 기준의 필요 처리량
+    report["required_windows_per_s"] = round(args.devices * service.sample_hz / service.step_size, 2)
+    return report
+
+
+def main():
+    args = parse_args()
+    setup_logging("WARNING")
+
+    with tempfile.TemporaryDirectory() as directory:
+        model = load_model(args.model or export_random_model(args, directory), threads=args.threads)
+        result = {
+            "model": args.model or args.format,
+            "threads": args.threads,
+            "model_windows_per_s": model_throughput(model),
+            "live": asyncio.run(run_live(args, model)),
+        }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"model          {result['model']} ({args.threads} threads)")
+    print("batch          windows/s")
+    for batch_size, rate in result["model_windows_per_s"].items():
+        print(f"  {batch_size:<12} {rate}")
+    live = result["live"]
+    print(f"devices        {live['devices']}")
+    print(f"windows/s      {live['windows_per_s']} (required {live['required_windows_per_s']}, dropped {live['dropped']})")
+    print(f"latency (ms)   p50 {live['latency_ms']['p50']}  p95 {live['latency_ms']['p95']}")
+
+
+if __name__ == "__main__":
+    main()
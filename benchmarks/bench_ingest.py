@@ -0,0 +1,119 @@
+"""
+가상 ELM327 어댑터로 수집 -> 저장 전체 경로 벤치마크 (블루투스 필요 없음)
+reading_data 부터 Postgres 저장까지 실행하고 초당 샘플 수, PID 별 왕복 시간 백분위, 초당 DB row 수를 출력한다.
+
+    python -m benchmarks.bench_ingest --devices 4 --duration 30
+    python -m benchmarks.bench_ingest --storage spool --no-packed
+    python -m benchmarks.bench_ingest --recording session.jsonl
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.adaptive_timing import percentile
+from app.database import Base, async_engine
+from app.fake_elm327 import fake_transport_factory
+from app.fleet import FleetSupervisor
+from app.ingest_buffer import IngestBuffer
+from app.logger import setup_logging
+from app.pid_decoder import ECU_PIDS
+from app.spool import Spool, SpoolDrainer
+from app.storage import StorageMaintenance
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--latency", type=float, default=0.03, help="가상 ECU 응답 지연(초)")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--chunk-size", type=int, default=20, help="notify 한 번의 최대 바이트 수")
+    parser.add_argument("--no-packed", action="store_true", help="여러 PID 묶음 요청을 지원하지 않는 어댑터")
+    parser.add_argument("--recording", help="RecordingTransport 로 기록한 JSONL 재생")
+    parser.add_argument("--storage", choices=["db", "spool"], default="db")
+    parser.add_argument("--spool-path", default="bench_spool.db")
+    parser.add_argument("--unthrottled", action="store_true", help="PID 별 목표 주기 제한 없이 최대 속도로 요청")
+    parser.add_argument("--json", action="store_true", help="결과를 JSON 으로 출력")
+    return parser.parse_args()
+
+
+async def run(args):
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await StorageMaintenance().prepare()
+
+    spool = drainer = None
+    if args.storage == "spool":
+        spool = Spool(args.spool_path)
+        drainer = SpoolDrainer(spool)
+        drainer.start()
+
+    transport_factory = fake_transport_factory(
+        latency=args.latency, jitter=args.jitter, chunk_size=args.chunk_size,
+        packed=not args.no_packed, recording=args.recording, search_delay=0.5,
+    )
+    poll_rates = {pid: (1000.0, 0) for pid in ECU_PIDS} if args.unthrottled else None
+    fleet = FleetSupervisor(
+        [f"FAKE-{i:03d}" for i in range(args.devices)],
+        ingest_buffer=IngestBuffer(spool=spool),
+        poll_rates=poll_rates,
+        transport_factory=transport_factory,
+    )
+
+    fleet.start()
+    started = time.monotonic()
+    await asyncio.sleep(args.duration)
+    await fleet.stop()
+    if drainer is not None:
+        await drainer.stop(timeout=60.0)
+    elapsed = time.monotonic() - started
+
+    samples = 0
+    latencies = {}
+    for reader in fleet.readers.values():
+        if reader.scheduler:
+            samples += sum(s.samples for s in reader.scheduler.schedules.values())
+        if reader.timing:
+            for pid, values in reader.timing.latencies.items():
+                latencies.setdefault(pid, []).extend(values)
+
+    rows = drainer.rows_drained if drainer else fleet.ingest_buffer.rows_written
+    result = {
+        "devices": args.devices,
+        "duration_s": round(elapsed, 2),
+        "samples_per_s": round(samples / elapsed, 1),
+        "db_rows": rows,
+        "db_rows_per_s": round(rows / elapsed, 1),
+        "rows_dropped": fleet.ingest_buffer.rows_dropped,
+        "rtt_ms": {
+            f"{pid:04X}": {q: round(percentile(values, int(q[1:])) * 1000, 1) for q in ("p50", "p95", "p99")}
+            for pid, values in sorted(latencies.items())
+        },
+    }
+    if spool is not None:
+        spool.close()
+    await async_engine.dispose()
+    return result
+
+
+def main():
+    args = parse_args()
+    # 수집 경로의 로그 출력은 터미널 속도에 따라 결과가 달라지므로 경고 이상만 출력
+    setup_logging("WARNING")
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"devices        {result['devices']}")
+    print(f"duration       {result['duration_s']} s")
+    print(f"samples/s      {result['samples_per_s']}")
+    print(f"db rows/s      {result['db_rows_per_s']} ({result['db_rows']} rows, {result['rows_dropped']} dropped)")
+    print("round trip (ms)    p50     p95     p99")
+    for pid, rtt in result["rtt_ms"].items():
+        print(f"  {pid}          {rtt['p50']:>7} {rtt['p95']:>7} {rtt['p99']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import asyncio
+
+from app.elm327 import CommandChannel
+from app.fake_elm327 import WRITE_UUID, NOTIFY_UUID, FakeElm327
+
+
+class SlowOnceElm327(FakeElm327):
+    """처음 받은 0105 요청만 늦게 응답"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.slow_left = 1
+
+    def _reply(self, command):
+        reply, delay = super()._reply(command)
+        if command == "0105" and self.slow_left:
+            self.slow_left -= 1
+            delay += 0.5
+        return reply, delay
+
+
+def test_late_reply_after_timeout_does_not_shift_later_replies():
+    async def run():
+        adapter = SlowOnceElm327(latency=0.02, jitter=0.0, search_delay=0.0, seed=1)
+        channel = CommandChannel(adapter, WRITE_UUID)
+        await adapter.connect()
+        await adapter.start_notify(NOTIFY_UUID, channel.on_notify)
+
+        try:
+            await channel.send(b"0105\r", timeout=0.2)
+        except asyncio.TimeoutError:
+            pass
+        else:
+            raise AssertionError("slow command should time out")
+
+        mismatched = 0
+        for i in range(40):
+            pid = ("0C", "0D", "0B", "04")[i % 4]
+            reply = await channel.send(f"01{pid}\r".encode(), timeout=1.0)
+            if not any(line.replace(" ", "").startswith(f"41{pid}") for line in reply):
+                mismatched += 1
+        return mismatched, channel
+
+    mismatched, channel = asyncio.run(run())
+    assert mismatched == 0
+    assert channel.stale_replies == 1
+    assert channel.unsolicited == 0
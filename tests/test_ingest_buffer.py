@@ -0,0 +1,26 @@
+import asyncio
+from datetime import datetime, timezone
+
+from app.ingest_buffer import KEEP, IngestBuffer
+
+
+class RecordingBuffer(IngestBuffer):
+    """DB 대신 쓰려던 row 를 기록"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.written = []
+
+    async def _write(self, rows):
+        self.written.extend(rows)
+
+
+def test_flush_writes_keep_rows_without_coalesce_rows():
+    buffer = RecordingBuffer(flush_size=100, overflow_policies={0x0131: KEEP})
+    timestamp = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for i in range(3):
+        buffer.add(device_id="A", timestamp=timestamp, pid=0x0131, value=float(i))
+
+    assert asyncio.run(buffer.flush()) == 3
+    assert [row["value"] for row in buffer.written] == [0.0, 1.0, 2.0]
+    assert len(buffer) == 0
@@ -0,0 +1,29 @@
+import asyncio
+
+from app.pid_packer import PidRequester
+
+
+class SingleOnlyChannel:
+    """묶음 요청은 '?' 로 거부하고 단일 PID 요청은 delay 초 뒤에 응답"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def send(self, command, timeout=5.0):
+        command = command.decode().strip()
+        if len(command) > 4:
+            return ["?"]
+        await asyncio.sleep(self.delay)
+        return [f"41 {command[2:]} 00"]
+
+
+def test_fallback_records_latency_per_single_request():
+    requester = PidRequester(SingleOnlyChannel(delay=0.05))
+    pids = [0x0105, 0x010B, 0x010D, 0x0104]
+    results = asyncio.run(requester.request(pids))
+
+    assert [pid for pid, _ in results] == pids
+    assert requester.packed_supported is False
+    assert set(requester.latencies) == set(pids)
+    # 그룹 전체 시간(약 0.2초)이 아니라 요청 하나의 왕복 시간
+    assert all(0.04 <= latency < 0.15 for latency in requester.latencies.values())
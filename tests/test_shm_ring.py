@@ -0,0 +1,33 @@
+import os
+from datetime import datetime, timezone
+
+from app.shm_ring import RingReader, RingWriter, SampleRing
+
+
+def test_stale_counts_slot_being_overwritten():
+    ring = SampleRing.create(f"obdflow_test_{os.getpid()}", capacity=8, max_devices=4)
+    try:
+        writer = RingWriter(ring)
+        reader = RingReader(ring)
+        timestamp = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        for i in range(7):
+            writer.add("A", timestamp, 0x010C, float(i))
+
+        views = reader.read()
+        assert sum(len(view) for view in views) == 7
+        assert reader.stale() == 0
+
+        # write_seq 가 8 이 되면 writer 가 seq 9 를 seq 1 의 slot 에 쓰는 중일 수 있음
+        writer.add("A", timestamp, 0x010C, 7.0)
+        assert reader.stale() == 1
+        writer.add("A", timestamp, 0x010C, 8.0)
+        assert reader.stale() == 2
+
+        for i in range(9, 12):
+            writer.add("A", timestamp, 0x010C, float(i))
+        views = reader.read()
+        assert [int(record["seq"]) for view in views for record in view] == [8, 9, 10, 11, 12]
+        assert reader.stale() == 0
+    finally:
+        ring.close()
+        ring.unlink()